@@ -0,0 +1,92 @@
+'''
+File:   crawlManifest.py
+Author: John Smutny
+Date:   12/07/2022
+Desc:   Persistent state of an Olympedia crawl.
+
+        Every fetched URL is recorded with its fetch time, the sha256 of its
+        content and the validators the server sent (ETag / Last-Modified).
+        'Fetcher' uses the validators for conditional requests and the
+        scraper marks a page as 'extracted' once its rows are written, so:
+        - an interrupted crawl resumes with the first unfinished page.
+        - a refresh after a new Games only downloads/extracts the new pages.
+
+        The manifest is a small json file, rewritten atomically after every
+        change.
+'''
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+
+class CrawlManifest:
+    # Constructor. Load an existing manifest from PATH (if any).
+    def __init__(self, PATH):
+        self.path = PATH
+        self._lock = threading.Lock()
+
+        if os.path.exists(PATH):
+            with open(PATH) as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def validators(self, url):
+        '''
+        :return: dict of conditional request headers for 'url'.
+        '''
+        entry = self.entries.get(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    ##################################################################
+    # @input url       str fetched page.
+    # @input content   bytes of the page.
+    # @input headers   response headers (validators).
+    # @output bool     True if the content differs from the last fetch.
+    def record(self, url, content, headers):
+        digest = hashlib.sha256(content).hexdigest()
+
+        with self._lock:
+            previous = self.entries.get(url, {})
+            changed = previous.get('sha256') != digest
+
+            self.entries[url] = {
+                'fetched': datetime.now(timezone.utc).isoformat(),
+                'sha256': digest,
+                'etag': headers.get('ETag', previous.get('etag')),
+                'last_modified': headers.get('Last-Modified',
+                                             previous.get('last_modified')),
+                # A changed page has to be extracted again.
+                'extracted': previous.get('extracted', False) and not changed}
+            self._save()
+
+        return changed
+
+    def isExtracted(self, url):
+        return self.entries.get(url, {}).get('extracted', False)
+
+    def markExtracted(self, url):
+        with self._lock:
+            self.entries[url]['extracted'] = True
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.path + ".tmp", 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
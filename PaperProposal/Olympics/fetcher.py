@@ -0,0 +1,200 @@
+'''
+File:   fetcher.py
+Author: John Smutny
+Date:   12/05/2022
+Desc:   Bounded-concurrency HTTP fetcher used by 'webscrapping.py'.
+
+        - One pooled keep-alive requests.Session shared by all worker threads.
+        - Polite per-host rate limit (minimum interval between requests to
+          the same host).
+        - Retries with exponential backoff on connection errors and on
+          429/5xx responses.
+        - On-disk response cache so a page is only downloaded once.
+        - Optional 'CrawlManifest': cached pages are revalidated with
+          conditional requests (If-None-Match / If-Modified-Since) and a
+          304 response reuses the cached copy.
+
+        The fetcher works against any base URL, which lets the scraper run
+        offline against 'fixtureServer.py' serving saved pages.
+'''
+
+import collections
+import hashlib
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = "vt_AdvML-olympics-scraper/1.0 (course project)"
+
+
+class Fetcher:
+    # Constructor. Define the connection pool, rate limits and cache.
+    def __init__(self, CACHE_DIR="./cache/", MAX_WORKERS=8,
+                 MIN_INTERVAL=0.25, RETRIES=4, BACKOFF=0.5, TIMEOUT=30,
+                 MANIFEST=None):
+        self.cache_dir = CACHE_DIR
+        self.manifest = MANIFEST
+        self.max_workers = MAX_WORKERS
+        self.min_interval = MIN_INTERVAL
+        self.timeout = TIMEOUT
+
+        retry = Retry(total=RETRIES,
+                      backoff_factor=BACKOFF,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET', 'HEAD'],
+                      respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS,
+                              pool_maxsize=MAX_WORKERS,
+                              max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Per-host time of the next allowed request.
+        self._host_lock = threading.Lock()
+        self._host_next = {}
+
+        if CACHE_DIR is not None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+
+    ##################################################################
+    # Des: Block until the host of 'url' may be contacted again.
+    def _waitForHost(self, url):
+        host = urlsplit(url).netloc
+
+        with self._host_lock:
+            now = time.monotonic()
+            start = max(now, self._host_next.get(host, now))
+            self._host_next[host] = start + self.min_interval
+
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _cachePath(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ".html")
+
+    def _readCache(self, url):
+        if self.cache_dir is None:
+            return None
+
+        path = self._cachePath(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _writeCache(self, url, content):
+        if self.cache_dir is None:
+            return
+
+        path = self._cachePath(url)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+
+    ##################################################################
+    # @input url    str page to download.
+    # @output bytes Page content.
+    # Des: Download one page, reading/writing the on-disk cache.
+    def fetch(self, url):
+        content, _ = self.fetchChanged(url)
+        return content
+
+    ##################################################################
+    # @input url    str page to download.
+    # @output (bytes, bool) Page content and whether it changed since the
+    #                       previous crawl.
+    # Des: Without a manifest a cached page is returned as-is. With a
+    #       manifest a cached page is revalidated by a conditional request.
+    def fetchChanged(self, url):
+        cached = self._readCache(url)
+        if cached is not None and self.manifest is None:
+            return cached, True
+
+        headers = {}
+        if cached is not None:
+            headers = self.manifest.validators(url)
+
+        self._waitForHost(url)
+        response = self.session.get(url, headers=headers,
+                                    timeout=self.timeout)
+
+        if response.status_code == 304 and cached is not None:
+            self.manifest.record(url, cached, response.headers)
+            return cached, False
+
+        response.raise_for_status()
+        content = response.content
+        self._writeCache(url, content)
+
+        changed = True
+        if self.manifest is not None:
+            changed = self.manifest.record(url, content, response.headers)
+
+        return content, changed
+
+    ##################################################################
+    # @input urls   list of str pages to download.
+    # @output dict  url -> page content, in the same order as 'urls'.
+    # Des: Download many pages with at most MAX_WORKERS concurrent requests.
+    def fetchAll(self, urls):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pages = list(pool.map(self.fetch, urls))
+
+        return dict(zip(urls, pages))
+
+    ##################################################################
+    # @input urls   list of str pages to download.
+    # @output generator of (url, page content) in the same order as 'urls'.
+    # Des: Same as fetchAll() but pages are handed out as they are consumed
+    #       so a caller can process and release one page at a time.
+    def fetchIter(self, urls):
+        yield from self._boundedMap(self.fetch, urls)
+
+    ##################################################################
+    # @output generator of (url, function(url)) in the same order as 'urls'.
+    # Des: At most 2 * MAX_WORKERS requests are submitted or held at once;
+    #       the window is refilled as results are handed out, so memory stays
+    #       flat no matter how many urls are crawled.
+    def _boundedMap(self, function, urls):
+        window = 2 * self.max_workers
+        urls = iter(urls)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = collections.deque()
+            for url in itertools.islice(urls, window):
+                pending.append((url, pool.submit(function, url)))
+
+            while pending:
+                url, future = pending.popleft()
+                for next_url in itertools.islice(urls, 1):
+                    pending.append((next_url, pool.submit(function,
+                                                          next_url)))
+                yield url, future.result()
+
+    ##################################################################
+    # @output generator of (url, page content, changed flag)
+    # Des: fetchIter() using conditional requests (see fetchChanged()).
+    def fetchChangedIter(self, urls):
+        for url, (content, changed) in self._boundedMap(self.fetchChanged,
+                                                        urls):
+            yield url, content, changed
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,129 @@
+'''
+File:   fixtureCheck.py
+Author: John Smutny
+Date:   12/08/2022
+Desc:   Offline check of the Olympedia scraper against the saved pages in
+        './fixtures' (see 'fixtureServer.py'):
+
+            python fixtureCheck.py
+
+        1) First crawl   - every page is downloaded (200) and the rows of
+                           both results pages are written to the csv,
+                           aligned by header text.
+        2) Re-crawl      - the event index is revalidated (304) and the
+                           already extracted results pages are skipped
+                           without a request; the csv is unchanged.
+        3) --revalidate  - unchanged results pages are answered 304 and not
+                           extracted again.
+        4) Changed page  - a results page that changed on the server is
+                           downloaded again and its rows replace the old
+                           ones (no duplicates).
+
+        Every crawl runs 'webscrapping.py --base-url' in a subprocess.
+        Fails with an AssertionError on the first broken step.
+'''
+
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from fixtureServer import startServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+
+INDEX = "/event_names/93"
+RESULTS = ["/results/57123", "/results/57456"]
+
+# (Year, Pos, Competitor, NOC, Points, 100 metres, Long Jump)
+EXPECTED_ROWS = [
+    ('1960', '1', 'Rafer Johnson', 'USA', '8392', '10.9', '7.35'),
+    ('1960', '2', 'Yang Chuan-Kwang', 'TPE', '8334', '10.7', '7.46'),
+    ('1960', '3', 'Vasily Kuznetsov', 'URS', '7809', '11.1', '6.96'),
+    ('1964', '1', 'Willi Holdorf', 'GER', '7887', '10.7', '7.00'),
+    ('1964', '2', 'Rein Aun', 'URS', '7842', '10.9', '7.19'),
+    ('1964', '3', 'Hans-Joachim Walde', 'GER', '7809', '11.0', '7.15')]
+
+
+def crawl(server, base_url, WORK_DIR, *ARGS):
+    '''
+    Run the scraper once.
+    :return: {path: status} of the requests the server answered.
+    '''
+    del server.requests[:]
+    subprocess.run([sys.executable, os.path.join(HERE, "webscrapping.py"),
+                    '--base-url', base_url,
+                    '--interval', '0',
+                    '--cache-dir', os.path.join(WORK_DIR, "cache"),
+                    '--manifest', os.path.join(WORK_DIR, "manifest.json"),
+                    '--output', os.path.join(WORK_DIR, "results.csv"),
+                    *ARGS],
+                   cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+
+    return dict(server.requests)
+
+
+def readRows(WORK_DIR):
+    with open(os.path.join(WORK_DIR, "results.csv"), newline='') as f:
+        return sorted((row['Year'], row['Pos'], row['Competitor'],
+                       row['NOC'], row['Points'], row['100 metres'],
+                       row['Long Jump']) for row in csv.DictReader(f))
+
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="olympedia_check_")
+    # The served copy is edited in step 4.
+    served_dir = os.path.join(work_dir, "fixtures")
+    shutil.copytree(FIXTURE_DIR, served_dir)
+    server, base_url = startServer(served_dir)
+
+    try:
+        # 1) First crawl.
+        requests = crawl(server, base_url, work_dir)
+        assert requests == {INDEX: 200, RESULTS[0]: 200, RESULTS[1]: 200}, \
+            requests
+        assert readRows(work_dir) == sorted(EXPECTED_ROWS), readRows(work_dir)
+        print("first crawl: OK")
+
+        # 2) Re-crawl: 304 for the index, results pages skipped.
+        requests = crawl(server, base_url, work_dir)
+        assert requests == {INDEX: 304}, requests
+        assert readRows(work_dir) == sorted(EXPECTED_ROWS), readRows(work_dir)
+        print("re-crawl (304 / skip): OK")
+
+        # 3) Revalidate: every page is unchanged.
+        requests = crawl(server, base_url, work_dir, '--revalidate')
+        assert requests == {INDEX: 304, RESULTS[0]: 304, RESULTS[1]: 304}, \
+            requests
+        assert readRows(work_dir) == sorted(EXPECTED_ROWS), readRows(work_dir)
+        print("revalidate (304): OK")
+
+        # 4) A corrected results page replaces its rows.
+        path = os.path.join(served_dir, "results__57456.html")
+        with open(path) as f:
+            page = f.read()
+        with open(path, 'w') as f:
+            f.write(page.replace('<td>7842</td>', '<td>7843</td>'))
+        later = time.time() + 10
+        os.utime(path, (later, later))
+
+        requests = crawl(server, base_url, work_dir, '--revalidate')
+        assert requests == {INDEX: 304, RESULTS[0]: 304, RESULTS[1]: 200}, \
+            requests
+        expected = [row if row[2] != 'Rein Aun' else
+                    row[:4] + ('7843',) + row[5:] for row in EXPECTED_ROWS]
+        assert readRows(work_dir) == sorted(expected), readRows(work_dir)
+        print("changed page (200 / rows replaced): OK")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("** Olympedia fixture check: PASSED")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+'''
+File:   fixtureServer.py
+Author: John Smutny
+Date:   12/05/2022
+Desc:   Local HTTP stand-in for olympedia.org. Serves pages saved with
+        'saveFixtures()' so the scraper can be run offline:
+
+            python fixtureServer.py ./fixtures 8000
+            python webscrapping.py --base-url http://127.0.0.1:8000/
+
+        A saved page's file name is its URL path with '/' replaced by '__'
+        (ex: /event_names/93 -> event_names__93.html). './fixtures' holds a
+        small saved set (the decathlon event index + two results pages)
+        that 'fixtureCheck.py' crawls.
+
+        Files are served with Last-Modified, and If-Modified-Since requests
+        for unchanged files are answered 304, like the real site. Every
+        answered request is kept in 'server.requests' as (path, status).
+'''
+
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+from urllib.parse import urlsplit
+
+
+def fixtureName(url):
+    path = urlsplit(url).path.strip('/')
+    return path.replace('/', '__') + ".html"
+
+
+def saveFixtures(pages: dict, FIXTURE_DIR):
+    '''
+    :param pages: url -> page content (ex: the output of Fetcher.fetchAll())
+    '''
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for url, content in pages.items():
+        with open(os.path.join(FIXTURE_DIR, fixtureName(url)), 'wb') as f:
+            f.write(content)
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    # Map '/event_names/93' onto 'event_names__93.html'.
+    def translate_path(self, path):
+        return os.path.join(self.directory, fixtureName(path))
+
+    def log_request(self, code='-', size='-'):
+        self.server.requests.append((self.path, int(code)))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startServer(FIXTURE_DIR, PORT=0):
+    '''
+    Serve FIXTURE_DIR from a background thread.
+    :return: (server, base url). Call server.shutdown() when done.
+    '''
+    handler = partial(FixtureHandler, directory=os.path.abspath(FIXTURE_DIR))
+    server = ThreadingHTTPServer(('127.0.0.1', PORT), handler)
+    server.requests = []
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server, "http://127.0.0.1:{}/".format(server.server_address[1])
+
+
+if __name__ == '__main__':
+    server, base_url = startServer(sys.argv[1], int(sys.argv[2]))
+    print("Serving {} at {}".format(sys.argv[1], base_url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,180 @@
+'''
+File:   tableExtractor.py
+Author: John Smutny
+Date:   12/06/2022
+Desc:   Streaming extraction of Olympedia results tables.
+
+        Each results page is parsed with lxml and its rows are aligned to
+        one fixed schema by HEADER TEXT (not by column position), so Games
+        that list the disciplines in a different order, or add columns with
+        links/medal icons, still land in the right columns. Rows are yielded
+        as records and buffered by 'ResultsWriter', which appends them to a
+        single csv file in batches. Memory stays flat no matter how many
+        Games are scraped.
+
+        Every row keeps the url of its results page ('Source'). When a page
+        is extracted again (it changed, see '--revalidate'), the rows of its
+        previous version are removed from the file before the new rows are
+        appended, so the file never holds a page twice.
+'''
+
+import csv
+import os
+import re
+
+from lxml import html as lxml_html
+
+# Columns written for every athlete of every Games.
+BASE_COLUMNS = ['Year', 'Event', 'Pos', 'Competitor', 'NOC', 'Points']
+DECATHLON = ['100 metres', 'Long Jump', 'Shot Put', 'High Jump',
+             '400 metres', '110 metres Hurdles', 'Discus Throw',
+             'Pole Vault', 'Javelin Throw', '1,500 metres']
+HEPTATHLON = ['100 metres Hurdles', '200 metres', '800 metres']
+SCHEMA = BASE_COLUMNS + DECATHLON + HEPTATHLON + ['Source']
+
+# Header text variants that map onto a schema column.
+HEADER_ALIASES = {'Athlete': 'Competitor',
+                  'Name': 'Competitor',
+                  'Rank': 'Pos',
+                  'Total': 'Points'}
+
+
+def normalizeHeader(text):
+    text = re.sub(r'\s+', ' ', text).strip()
+    return HEADER_ALIASES.get(text, text)
+
+
+def cellText(cell):
+    return re.sub(r'\s+', ' ', ''.join(cell.itertext())).strip()
+
+
+def gamesYear(doc):
+    '''
+    Year of the Olympic games from the 'biodata' table Date row.
+    '''
+    dates = doc.xpath('//table[contains(@class, "biodata")]'
+                      '//tr[th[contains(., "Date")]]/td')
+    if len(dates) == 0:
+        return None
+
+    match = re.search(r'(\d{4})\s*$', cellText(dates[0]))
+    return int(match.group(1)) if match else None
+
+
+def extractRows(html_src, EVENT=None):
+    '''
+    Yield one dictionary per athlete of a results page. Keys are schema
+    columns; columns the page does not have are left out.
+
+    :param html_src: bytes/str of an Olympedia results page.
+    :param EVENT: Name stored in the 'Event' column (ex: 'Decathlon')
+    '''
+    doc = lxml_html.fromstring(html_src)
+    year = gamesYear(doc)
+
+    tables = doc.xpath('//table[contains(concat(" ", normalize-space(@class),'
+                       ' " "), " table-striped ")]')
+    if len(tables) == 0:
+        return
+
+    table = tables[0]
+    header_cells = table.xpath('./thead/tr[1]/th | ./tr[1]/th')
+
+    # Map each column position to a schema column. Blank headers (medal,
+    # WR/OR, references) and repeated 'Points' columns (points per
+    # discipline) are skipped.
+    column_map = {}
+    for position, th in enumerate(header_cells):
+        name = normalizeHeader(cellText(th))
+        if name in SCHEMA and name not in column_map.values():
+            column_map[position] = name
+
+    for row in table.xpath('./tbody/tr | ./tr[td]'):
+        cells = row.xpath('./td')
+        if len(cells) == 0:
+            continue
+
+        record = {'Year': year, 'Event': EVENT}
+        for position, name in column_map.items():
+            if position < len(cells):
+                record[name] = cellText(cells[position])
+
+        yield record
+
+
+class ResultsWriter:
+    # Constructor. Append records to 'PATH' in batches of BATCH_SIZE rows.
+    def __init__(self, PATH, BATCH_SIZE=1000, COLUMNS=SCHEMA):
+        self.path = PATH
+        self.batch_size = BATCH_SIZE
+        self.columns = COLUMNS
+        self.buffer = []
+        self.count = 0
+
+        # Only write the header when starting a new file (append-only).
+        if not os.path.exists(PATH) or os.path.getsize(PATH) == 0:
+            with open(PATH, 'w', newline='') as f:
+                csv.DictWriter(f, fieldnames=self.columns).writeheader()
+
+        # Results pages that already have rows in the file.
+        with open(PATH, newline='') as f:
+            self.sources = {row.get('Source') for row in csv.DictReader(f)}
+        self.sources.discard(None)
+
+    ##################################################################
+    # @input records   iterable of dict rows (see extractRows()).
+    # @input SOURCE    url of the results page the records come from. Rows
+    #                   of an earlier extraction of that page are replaced.
+    def add(self, records, SOURCE=None):
+        if SOURCE is not None and SOURCE in self.sources:
+            self.drop(SOURCE)
+
+        for record in records:
+            if SOURCE is not None:
+                record['Source'] = SOURCE
+                self.sources.add(SOURCE)
+            self.buffer.append(record)
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    ##################################################################
+    # @input SOURCE    url whose rows are removed from the file.
+    # Des: Streams the file into a temporary copy without those rows. Only
+    #       runs for pages that changed since their last extraction.
+    def drop(self, SOURCE):
+        self.flush()
+
+        tmp_path = self.path + ".tmp"
+        with open(self.path, newline='') as f_in, \
+                open(tmp_path, 'w', newline='') as f_out:
+            reader = csv.DictReader(f_in)
+            writer = csv.DictWriter(f_out, fieldnames=reader.fieldnames,
+                                    extrasaction='ignore')
+            writer.writeheader()
+            for row in reader:
+                if row.get('Source') != SOURCE:
+                    writer.writerow(row)
+        os.replace(tmp_path, self.path)
+
+        self.sources.discard(SOURCE)
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns,
+                                    extrasaction='ignore')
+            writer.writerows(self.buffer)
+
+        self.count = self.count + len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,7 +1,7 @@
 '''
-File:
-Author:
-Date:
+File:   webscrapping.py
+Author: John Smutny
+Date:   12/05/2022
 Desc:   Collect athletic performance information about the history of the
         Decathlon event of the Olympics and Trank & Field championships.
 
@@ -13,26 +13,25 @@ Status
 - Can gather all hyperlinks to access each Olympic games
 - Can go through a specific Olympic game and pull headers
 - Can go through a specific Olympic game and include all non-class data.
-- CANNOT join a dataframe of a specific Olympic game and a bigger dataframe.
---  Consider a map of dataframes for now
---  Consider removing certain columns that could be redundent (AKA medal, 
-we already have a column for what RANK the athlete placed in.
+- All Olympic games are aligned by header text and appended to one csv
+  (see 'tableExtractor.py'). Medal / WR / reference columns are dropped.
 
 TODOs
 
-3) Create a 'for' loop to process ALL pages
-p1) Functionalize the code in 'webscrapping.py'
 p2) Repeat steps for the women's heptathlon 
 p3) Repeat for given data about athletes
 '''
 
 
 # Import packages (beautifulsoup and Requests) to interact with HTTP pages.
+import argparse
+
 from bs4 import BeautifulSoup
-import requests
 
-# Import package helpful for data interaction
-import pandas as pd
+from crawlManifest import CrawlManifest
+from fetcher import Fetcher
+from fixtureServer import saveFixtures
+from tableExtractor import extractRows, ResultsWriter
 
 ###
 # Define file level definitions
@@ -51,100 +50,112 @@ webpages = [
             '&windReading=all&page=4&bestResultsOnly=true&firstDay=1899-12-30&lastDay=2021-08-17'
             ]
 
-webpages_olympedia = [
-    'https://www.olympedia.org/event_names/93'
-]
+# Olympedia site and the 'event_names' pages to collect.
+#   93 = Athletics Men's Decathlon
+#   Add the Women's Heptathlon 'event_names' id here (or use --event).
+URL_BASE = "https://www.olympedia.org/"
+EVENT_PAGES = {'event_names/93': 'Decathlon'}
+OUTPUT_PATH = "./data/olympedia_results.csv"
+MANIFEST_PATH = "./cache/manifest.json"
 
 ###
 
-# Get the collection of data tables from Olympedia
-# Collect top-level table information from the website (year, data url)
-page = requests.get(webpages_olympedia[0])
-html_src = page.content
-
-# Extract the links from the HTML Table. Remove all other HTML information
-soup = BeautifulSoup(html_src, 'html.parser')
-table_OlypicsOverall = soup.find("table", {"class": "biodata"})
-table_games = soup.find("table", {"class": "table table-striped"})
-
-results_urls = []
-for a in table_games.find_all("a", href=True):
-    href = a.get('href')
-    if "results" in href:
-        results_urls.append(href)
-        print("HREF = {}".format(href))
-
-# Go to each Olympic results URL and extract participant information
-URL_BASE = "https://www.olympedia.org/"
 
-# For each olympic games linked, extract all recorded athlete performance data
-df_athletes = pd.DataFrame
+def getResultsUrls(fetcher: Fetcher, base_url, event_page):
+    '''
+    Collect top-level table information from the website (year, data url)
+    :return: list of absolute results page urls for every Olympic games.
+    '''
+    html_src = fetcher.fetch(base_url + event_page)
 
-setHeader = True
-for ext in results_urls:
-    url = URL_BASE + ext
-
-    page = requests.get(url)
-    html_src = page.content
+    # Extract the links from the HTML Table. Remove all other HTML information
     soup = BeautifulSoup(html_src, 'html.parser')
-
-    # 1) Get the year of the Olympics
-    table_overall = soup.find("table", {"class": "biodata"})
-
-    # first td is the Date (but check to make sure)
-    if 'Date' in table_overall.find('tr').text:
-        date = table_overall.find('td').text
-        olympic_year = date[len(date)-4:len(date)]
-
-    # 2) Get the performance of athletes in that Olympic games
-    table_participants = soup.find("table", {"class": "table table-striped"})
-
-    # Set the dataframe header for the specific Olympic games
-    header = []
-    points_flag = True
-    used_cols = []
-    counter = 0
-    for col in table_participants.find_all('th'):
-        # Only using the 1st 'point' column
-        # Don't include the blank columns for MEDAL, WR/OR, or references
-        if "Points" in col.text and points_flag:
-            header.append(col.text)
-            points_flag = False
-            used_cols.append(counter)
-            counter += counter + 1
-        elif "Points" not in col.text:
-            header.append(col.text)
-            used_cols.append(counter)
-            counter += counter + 1
-
-
-        if "1,500 metres" in col.text:
-            break
-
-    # Extract all data from the Olympic games
-    tbody = table_participants.find_all('tr')
-    for row in tbody[1:len(tbody)]:
-                # TODO - How do you make sure that the headers are for the
-                #  right columns no matter what Olympic competition?
-                #   You make dataframes for each Olympics then JOIN them
-
-        item_list = []
-        print(row.find_all('td'))
-        for item in row.find_all('td'):
-            if len(item.select('a[class]')) == 0:
-                item_list.append(item.text)
-            else:
-                header.pop()    # TODO - Assumes that only the LAST columns
-                                # on a page will have the class object.
-
-        df_game = pd.DataFrame([item_list], columns=header)
-        #df_athletes = pd.concat([df_athletes, df_game], join="outer")
-        df_athletes.join(other=df_game)
-
-
-
-
-
+    table_games = soup.find("table", {"class": "table table-striped"})
+
+    results_urls = []
+    for a in table_games.find_all("a", href=True):
+        href = a.get('href')
+        if "results" in href:
+            results_urls.append(base_url + href.lstrip('/'))
+            print("HREF = {}".format(href))
+
+    return results_urls
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Collect Olympic combined-event results from Olympedia.")
+    parser.add_argument('--base-url', default=URL_BASE,
+                        help="Site root. Point at 'fixtureServer.py' to run "
+                             "offline.")
+    parser.add_argument('--event', action='append', default=None,
+                        help="'event_names/<id>' page(s) to collect.")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--interval', type=float, default=0.25,
+                        help="Minimum seconds between requests to a host.")
+    parser.add_argument('--cache-dir', default="./cache/")
+    parser.add_argument('--output', default=OUTPUT_PATH,
+                        help="csv file athlete results are appended to.")
+    parser.add_argument('--manifest', default=MANIFEST_PATH,
+                        help="Crawl state. Pages already extracted are "
+                             "skipped, so an interrupted crawl resumes.")
+    parser.add_argument('--revalidate', action='store_true',
+                        help="Also re-check already extracted results pages "
+                             "with conditional requests.")
+    parser.add_argument('--save-fixtures', default=None,
+                        help="Directory to save every fetched page to for "
+                             "'fixtureServer.py'.")
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/') + '/'
+    events = {event: event for event in args.event} if args.event \
+        else EVENT_PAGES
+
+    manifest = CrawlManifest(args.manifest)
+
+    with Fetcher(CACHE_DIR=args.cache_dir, MAX_WORKERS=args.workers,
+                 MIN_INTERVAL=args.interval, MANIFEST=manifest) as fetcher, \
+            ResultsWriter(args.output) as writer:
+
+        if args.save_fixtures is not None:
+            saveFixtures(fetcher.fetchAll([base_url + event
+                                           for event in events]),
+                         args.save_fixtures)
+
+        for event, event_name in events.items():
+            # The event index is always revalidated so new Games are found.
+            results_urls = getResultsUrls(fetcher, base_url, event)
+
+            # Results of past Games do not change. Only visit pages that
+            # were never extracted (new Games, or an interrupted crawl).
+            if not args.revalidate:
+                results_urls = [url for url in results_urls
+                                if not manifest.isExtracted(url)]
+            print("** {}: {} results pages to visit".format(
+                event_name, len(results_urls)))
+
+            # Go to each Olympic results URL concurrently and stream every
+            # recorded athlete performance into the output file.
+            for url, page, _ in fetcher.fetchChangedIter(results_urls):
+                if args.save_fixtures is not None:
+                    saveFixtures({url: page}, args.save_fixtures)
+
+                if manifest.isExtracted(url):
+                    continue
+
+                # A changed page replaces the rows of its earlier version.
+                writer.add(extractRows(page, event_name), SOURCE=url)
+
+                # Rows are on disk before the page is marked complete.
+                writer.flush()
+                manifest.markExtracted(url)
+
+    print("** Olympedia results: {} rows written to {}".format(writer.count,
+                                                              args.output))
+
+
+if __name__ == '__main__':
+    main()
 
 
 ########
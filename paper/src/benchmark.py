@@ -0,0 +1,257 @@
+'''
+File:   benchmark.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/14/2022
+Description:
+    Micro-benchmarks of the data preparation and scoring functions with a
+    golden-output regression gate. Each function runs on fixed (seeded)
+    fixture frames. Its best time over REPEAT runs and a fingerprint of its
+    output are compared to the committed baseline BASELINE_PATH.
+
+    The run fails (exit code 1) when a function
+        1) is more than SLOWDOWN slower than its baseline time (and by more
+           than MIN_DELTA seconds, to ignore timer noise), or
+        2) produces output that differs from the baseline by more than
+           TOLERANCE (relative).
+
+    Usage:
+        python benchmark.py            - compare against the baseline
+        python benchmark.py --update   - write a new baseline (after an
+                                          intended change of results, or on
+                                          a new reference machine)
+'''
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataPreparation as dp
+import lib.modelCommon as common
+import lib.distanceCache as distanceCache
+from lib.DataQualityReport import DataQualityReport
+
+BASELINE_PATH = "benchmarkBaseline.json"
+REPEAT = 5
+SLOWDOWN = 1.0
+MIN_DELTA = 0.01
+TOLERANCE = 1e-6
+
+FIXTURE_ROWS = 3000
+FIXTURE_YEARS = [[1971, 1980], [1981, 1990]]
+FIXTURE_SEED = 5424
+
+POSITIONS = ['PG', 'SG', 'SF', 'PF', 'C', 'G', 'F', 'PG-SG', 'SF-PF', 'F-C',
+             'G-F']
+STAT_COLUMNS = ['G', 'GS', 'MP', 'PER', 'TS%', '3PAr', 'FTr', 'WS', 'BPM',
+                'FG', 'FGA', 'FG%', '3P', '3PA', '3P%', 'FT', 'FTA', 'FT%',
+                'TRB', 'AST', 'STL', 'BLK', 'TOV', 'PTS']
+
+
+def fixtureStats(ROWS=FIXTURE_ROWS, SEED=FIXTURE_SEED) -> pd.DataFrame:
+    '''
+    Season_Stats shaped frame (after 'cleanupFeatures') with multi-position
+    entries and missing values.
+    '''
+    rng = np.random.default_rng(SEED)
+
+    df = pd.DataFrame({'ID': np.arange(ROWS),
+                       'Year': rng.integers(FIXTURE_YEARS[0][0],
+                                            FIXTURE_YEARS[-1][1] + 1,
+                                            ROWS).astype(np.float64),
+                       'Player': ["Player {}".format(i) for i in range(ROWS)],
+                       'Pos': rng.choice(POSITIONS, ROWS),
+                       'Age': rng.integers(19, 40, ROWS).astype(np.float64),
+                       'Tm': rng.choice(['ATL', 'BOS', 'LAL', 'NYK'], ROWS),
+                       'height': rng.normal(200, 9, ROWS).round(),
+                       'weight': rng.normal(100, 11, ROWS).round()})
+    for col in STAT_COLUMNS:
+        df[col] = rng.gamma(2.0, 10.0, ROWS).round(3)
+
+    # Missing values: 3 point stats missing before 1980 (NaN = zero), plus
+    # a few random gaps.
+    early = df['Year'] < 1980
+    df.loc[early, ['3P', '3PA', '3P%', '3PAr']] = np.nan
+    for col in ['FT%', 'TS%', 'PER']:
+        df.loc[rng.random(ROWS) < 0.05, col] = np.nan
+    df.loc[rng.random(ROWS) < 0.5, 'GS'] = np.nan
+
+    df.index = df['ID']
+
+    return df
+
+
+def fixtureScores(SEED=FIXTURE_SEED):
+    '''
+    Feature matrix with 5 loose clusters and their labels.
+    '''
+    rng = np.random.default_rng(SEED)
+    labels = rng.integers(0, 5, 1500)
+    centers = rng.normal(0, 3, (5, 20))
+    x = centers[labels] + rng.normal(0, 2, (1500, 20))
+
+    return pd.DataFrame(x), pd.Series(labels)
+
+
+def runDQR(df):
+    dqr = DataQualityReport()
+    dqr.quickDQR(df, list(df.columns), ['Player', 'Pos', 'Tm'])
+    return dqr.statsdf
+
+
+def benchmarks() -> dict:
+    '''
+    name -> function without arguments. Fixture copies are made before the
+    timer starts for functions that modify their input.
+    '''
+    df_stats = fixtureStats()
+    df_scores, labels = fixtureScores()
+    x = df_stats[STAT_COLUMNS].fillna(0).to_numpy()
+
+    return {
+        'cleanPositionFeature_5': (
+            lambda: df_stats.copy(),
+            lambda df: dp.cleanPositionFeature(df, False)['Pos']),
+        'cleanPositionFeature_3': (
+            lambda: df_stats.copy(),
+            lambda df: dp.cleanPositionFeature(df, True)['Pos']),
+        'modifyNanValues': (
+            lambda: df_stats.copy(),
+            lambda df: dp.modifyNanValues(df, 0.3, FIXTURE_YEARS)[
+                STAT_COLUMNS]),
+        'DataQualityReport.quickDQR': (
+            lambda: df_stats.copy(),
+            runDQR),
+        'normalizeData': (
+            lambda: x,
+            common.normalizeData),
+        'calcCalinskiHarabaszScore': (
+            lambda: (df_scores, labels),
+            lambda data: common.calcCalinskiHarabaszScore(*data)),
+        # Pairwise distances are computed again in every repeat.
+        'calcSilhouetteCoefficient': (
+            lambda: distanceCache.clear() or (df_scores, labels),
+            lambda data: common.calcSilhouetteCoefficient(*data)),
+        'calcDaviesBouldinIndex': (
+            lambda: (df_scores, labels),
+            lambda data: common.calcDaviesBouldinIndex(*data)),
+    }
+
+
+def fingerprint(output) -> dict:
+    '''
+    Tolerance comparable summary of a function output. Numeric cells are
+    reduced to sums (plain, absolute and position weighted); all other
+    cells are hashed.
+    '''
+    if isinstance(output, (pd.DataFrame, pd.Series)):
+        values = output.to_numpy(dtype=object)
+    else:
+        values = np.asarray(output, dtype=object)
+    shape = list(values.shape)
+    values = values.ravel()
+
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce')
+    is_number = numbers.notna().to_numpy()
+    numbers = numbers.fillna(0).to_numpy(dtype=np.float64)
+
+    text = "|".join("{}:{}".format(i, values[i])
+                    for i in np.flatnonzero(~is_number))
+    weights = np.arange(1, len(numbers) + 1) / len(numbers) if len(numbers) \
+        else numbers
+
+    return {'shape': shape,
+            'sum': float(numbers.sum()),
+            'abs_sum': float(np.abs(numbers).sum()),
+            'weighted_sum': float(np.dot(numbers, weights)),
+            'text': hashlib.sha256(text.encode()).hexdigest()}
+
+
+def runBenchmark(setup, function, REPEAT=REPEAT):
+    times = []
+    for _ in range(REPEAT):
+        data = setup()
+        start = time.perf_counter()
+        output = function(data)
+        times.append(time.perf_counter() - start)
+
+    return min(times), fingerprint(output)
+
+
+def compare(name, seconds, output, baseline, SLOWDOWN=SLOWDOWN) -> list:
+    '''
+    :return: list of failure messages (empty = pass)
+    '''
+    failures = []
+    if baseline is None:
+        return ["{}: no baseline (run with --update)".format(name)]
+
+    limit = baseline['seconds'] * (1 + SLOWDOWN)
+    if seconds > limit and seconds - baseline['seconds'] > MIN_DELTA:
+        failures.append("{}: {:.4f}s is slower than the baseline {:.4f}s "
+                        "(+{:.0%})".format(name, seconds, baseline['seconds'],
+                                           seconds / baseline['seconds'] - 1))
+
+    expected = baseline['output']
+    if output['shape'] != expected['shape'] or \
+            output['text'] != expected['text']:
+        failures.append("{}: output shape/labels changed".format(name))
+    for key in ['sum', 'abs_sum', 'weighted_sum']:
+        if not np.isclose(output[key], expected[key], rtol=TOLERANCE,
+                          atol=TOLERANCE):
+            failures.append("{}: output {} drifted {} -> {}".format(
+                name, key, expected[key], output[key]))
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[6])
+    parser.add_argument('--update', action='store_true',
+                        help="write the results as the new baseline")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--slowdown', type=float, default=SLOWDOWN,
+                        help="allowed relative slowdown (1.0 = 2x)")
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+
+    results = {}
+    failures = []
+    for name, (setup, function) in benchmarks().items():
+        seconds, output = runBenchmark(setup, function, args.repeat)
+        results[name] = {'seconds': seconds, 'output': output}
+
+        previous = baseline.get(name)
+        print("{:<30} {:>9.4f}s   baseline {}".format(
+            name, seconds,
+            "{:.4f}s".format(previous['seconds']) if previous else "-"))
+        if not args.update:
+            failures.extend(compare(name, seconds, output, previous,
+                                    args.slowdown))
+
+    if args.update:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("** Benchmark: baseline written to {}".format(args.baseline))
+        return 0
+
+    for failure in failures:
+        print("FAIL " + failure)
+    print("** Benchmark: {}".format("FAILED" if failures else "PASSED"))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
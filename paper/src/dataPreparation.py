@@ -24,6 +24,13 @@ import pandas as pd
 import numpy as np
 from lib.DataQualityReport import DataQualityReport
 
+# Repeated string features stored as pandas categoricals.
+CATEGORICAL_COLUMNS = ['Player', 'Tm', 'Pos', 'Teams']
+
+# Season_Stats features never read from disk (empty in the source data).
+UNUSED_COLUMNS = ['blanl', 'blank2']
+PLAYER_COLUMNS = {'Player': str, 'height': np.float64, 'weight': np.float64}
+
 
 ##############################
 
@@ -162,6 +169,48 @@ def removeDuplicates(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def resolveTrades(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Basketball-Reference lists a traded player once per team plus one
+    season total row (Tm == 'TOT'). Keep the TOT row as the player's season
+    entry and drop the per-team rows. Only players listed more than once
+    without a TOT row are combined by 'removeDuplicates()'.
+
+    The teams of each traded player (ex: 'HOU/LAL') are kept in the
+    categorical 'Teams' column (NaN for players who were not traded).
+
+    :param df: Input dataframe of the overall data
+    :return: Pandas Dataframe with one entry per year per player
+    '''
+    KEY = ['Year', 'Player', 'Age']
+
+    is_tot = df['Tm'] == 'TOT'
+    has_tot = is_tot.groupby([df[col] for col in KEY], sort=False,
+                             dropna=False).transform('any')
+    per_team = has_tot & ~is_tot
+
+    # Teams of every traded player, in the order they were listed.
+    teams = df.loc[per_team].groupby(KEY, sort=False, dropna=False)['Tm'] \
+        .agg('/'.join).rename('Teams')
+    df_tot = df.loc[is_tot, KEY + ['ID']].join(teams, on=KEY)
+    teams = pd.Series(df_tot['Teams'].to_numpy(), index=df_tot['ID'])
+
+    df = df[~per_team]
+    print("**** Data Modification: resolveTrades - COMPLETE\t {} TOT "
+          "entries kept, {} team entries removed.".format(is_tot.sum(),
+                                                         per_team.sum()))
+
+    # Remaining duplicates have no TOT row to use.
+    duplicated = df.duplicated(['Year', 'Player'], keep=False)
+    if duplicated.any():
+        df = pd.concat([df[~duplicated],
+                        removeDuplicates(df[duplicated].copy())]).sort_index()
+
+    df = df.assign(Teams=df['ID'].map(teams).astype('category'))
+
+    return df
+
+
 def modifyNanValues(df: pd.DataFrame,
                     NAN_LIMIT,
                     YEARS_PAIRS: list) -> pd.DataFrame:
@@ -179,6 +228,8 @@ def modifyNanValues(df: pd.DataFrame,
 
     count = 0
     KEY_FEATURES = ['3P', '3PA', '3P%', 'FT%']
+    # NaN means 'not traded', it is not a missing value.
+    SKIP_FEATURES = ['Teams']
 
     # loop through each feature by year range. Based on how many Nan values
     # there are, change the Nan values.
@@ -186,6 +237,8 @@ def modifyNanValues(df: pd.DataFrame,
         df_year = df.loc[(df["Year"] >= YEARS[0]) & (df["Year"] <= YEARS[1])]
 
         for col in df.columns:
+            if col in SKIP_FEATURES:
+                continue
             nanCount = df_year[col].isnull().sum()
 
             '''
@@ -295,25 +348,14 @@ def cleanPositionFeature(df: pd.DataFrame, THREE_POSITIONS_FLAG) -> \
     return df
 
 
-def modifyData(df: pd.DataFrame, YEARS_PAIRS: list,
-               REQ_GAMES, REQ_MIN,
-               THREE_POSITIONS_FLAG) -> \
-        pd.DataFrame:
+def cleanupFeatures(df: pd.DataFrame, YEARS_PAIRS: list) -> pd.DataFrame:
     '''
-        :param df:
-        :return: pd.DataFrame:
-
-        Edit the dataset in the following ways
-        1) Remove features not needed for model
-        2) Consolidate players with multiple entries in a single season.
-        3) Apply filters
-            Player must have played in specific years: years = { firstYear, SecondYear }
-            Player must have played in at least x games.
-            Player must have played at least y minutes per game played.
+    Initial player filter and feature cleanup.
+    1) Only keep the years inside YEARS_PAIRS.
+    2) Name the ID feature and remove unusable features.
+    3) Remove entries without a player name.
     '''
-
     YEARS = [YEARS_PAIRS[0][0], YEARS_PAIRS[len(YEARS_PAIRS)-1][1]]
-    print("** Data Modification {}-{}: START".format(YEARS[0], YEARS[1]))
 
     ##########################
     # Initial Player Filter
@@ -328,30 +370,33 @@ def modifyData(df: pd.DataFrame, YEARS_PAIRS: list,
     df = df.rename(columns={'Unnamed: 0': "ID"})
 
     # Remove features that could break the program execution
-    REMOVE_FEATURES = ['blanl', 'blank2']
-    df = df.drop(columns=REMOVE_FEATURES)
+    # (already skipped when loaded with 'loadSeasonStats()')
+    REMOVE_FEATURES = UNUSED_COLUMNS
+    df = df.drop(columns=REMOVE_FEATURES, errors='ignore')
 
     # Remove all player names of 'nan'
     df = df[~pd.isna(df['Player'])]
 
-    ##########################
-    # Ensure 'Position' feature has only 3 or 5 categories if included.
-    df = cleanPositionFeature(df, THREE_POSITIONS_FLAG)
-
-    ##########################
-    # Consolidate any entries that are listed more than once.
-    df = removeDuplicates(df)
+    return df
 
-    ##########################
-    # Remove nan features if over a criteria
-    df = modifyNanValues(df, 0.3, YEARS_PAIRS)
 
+def encodePositions(df: pd.DataFrame) -> pd.DataFrame:
     # Add in One-Hot Encoding 'Pos' feature values.
     df_oneHot_pos = pd.get_dummies(df['Pos'], prefix='Pos')
     df_oneHot_pos['ID'] = df['ID']
 
     df = pd.merge(df, df_oneHot_pos, how='left', on='ID')
 
+    return df
+
+
+def applyPlayerFilters(df: pd.DataFrame, REQ_GAMES, REQ_MIN) -> \
+        pd.DataFrame:
+    '''
+    Player must have played in at least REQ_GAMES games and at least
+    REQ_MIN minutes per game played.
+    '''
+
     ##########################
     # Specific Player Filters
     count = 0
@@ -368,11 +413,113 @@ def modifyData(df: pd.DataFrame, YEARS_PAIRS: list,
     print("**** Data Modification: MINUTES Filter - COMPLETE\t {} ({:.2}%) "
           "values effected.".format(count, count / len(df)))
 
+    return df
+
+
+def modifyData(df: pd.DataFrame, YEARS_PAIRS: list,
+               REQ_GAMES, REQ_MIN,
+               THREE_POSITIONS_FLAG) -> \
+        pd.DataFrame:
+    '''
+        :param df:
+        :return: pd.DataFrame:
+
+        Edit the dataset in the following ways
+        1) Remove features not needed for model
+        2) Consolidate players with multiple entries in a single season.
+        3) Apply filters
+            Player must have played in specific years: years = { firstYear, SecondYear }
+            Player must have played in at least x games.
+            Player must have played at least y minutes per game played.
+
+        Each step is its own function so 'sweep.py' can share them between
+        parameter combinations.
+    '''
+
+    YEARS = [YEARS_PAIRS[0][0], YEARS_PAIRS[len(YEARS_PAIRS)-1][1]]
+    print("** Data Modification {}-{}: START".format(YEARS[0], YEARS[1]))
+
+    df = cleanupFeatures(df, YEARS_PAIRS)
+
+    ##########################
+    # Ensure 'Position' feature has only 3 or 5 categories if included.
+    df = cleanPositionFeature(df, THREE_POSITIONS_FLAG)
+
+    ##########################
+    # Consolidate any entries that are listed more than once.
+    df = resolveTrades(df)
+
+    ##########################
+    # Remove nan features if over a criteria
+    df = modifyNanValues(df, 0.3, YEARS_PAIRS)
+
+    df = encodePositions(df)
+
+    df = applyPlayerFilters(df, REQ_GAMES, REQ_MIN)
+
     print("*** Data Modification {}-{}: COMPLETE".format(YEARS[0], YEARS[1]))
 
     return df
 
 
+def compactDtypes(df: pd.DataFrame, FLOAT_RTOL=1e-6) -> pd.DataFrame:
+    '''
+    Reduce the memory footprint of the prepared dataset.
+    1) Repeated string fields (Player, Tm, Pos, Teams) become categoricals.
+    2) Whole-number features (G, GS, PTS, Pos_* one-hot, Year, etc) are
+        narrowed to the smallest integer type that holds them.
+    3) Remaining rate statistics become float32 when float32 reproduces every
+        value within FLOAT_RTOL.
+
+    :param df: Fully modified dataset (no NaN values remain).
+    :return: Same dataset with compact dtypes.
+    '''
+
+    before = df.memory_usage(deep=True).sum()
+    df = df.copy()
+
+    for col in df.columns:
+        data = df[col]
+
+        if data.dtype == object or col in CATEGORICAL_COLUMNS:
+            df[col] = data.astype('category')
+
+        elif data.dtype == bool or not np.issubdtype(data.dtype, np.number):
+            continue
+
+        elif data.isnull().any():
+            df[col] = data.astype(np.float32)
+
+        elif np.all(np.mod(data.to_numpy(), 1) == 0):
+            df[col] = pd.to_numeric(data, downcast='integer')
+
+        else:
+            values = data.to_numpy(dtype=np.float64)
+            if np.allclose(values.astype(np.float32), values,
+                           rtol=FLOAT_RTOL, atol=0):
+                df[col] = data.astype(np.float32)
+
+    after = df.memory_usage(deep=True).sum()
+    print("**** Data Modification: Compact dtypes - COMPLETE\t {:.2f} MB -> "
+          "{:.2f} MB ({:.1f}% smaller).".format(before / 1024**2,
+                                               after / 1024**2,
+                                               100 * (1 - after / before)))
+
+    return df
+
+
+def loadModelData(PATH_NO_EXTENSION) -> pd.DataFrame:
+    '''
+    Load a dataset saved by 'initialDataModification()'. The pickle file
+    keeps the compact dtypes; the csv file is only used as a fallback.
+    '''
+    try:
+        return pd.read_pickle(PATH_NO_EXTENSION + ".pkl")
+    except FileNotFoundError:
+        return compactDtypes(pd.read_csv(PATH_NO_EXTENSION + ".csv",
+                                         index_col=False))
+
+
 def combineData(df_player: pd.DataFrame, df_stats: pd.DataFrame) -> \
         pd.DataFrame:
     # Drop some of the player features
@@ -438,26 +585,67 @@ def outputReferenceFiles(df_RAW: pd.DataFrame, df_MODEL: pd.DataFrame,
 ##############################
 
 
+def loadSeasonStats(DATA_PATH, YEARS_PAIRS, CHUNKSIZE=20000) -> \
+        pd.DataFrame:
+    '''
+    Stream the Season_Stats csv in chunks and keep only the rows that can be
+    used: seasons inside the YEARS_PAIRS range with a Player name. Only the
+    needed columns are parsed, with explicit dtypes, so peak memory depends
+    on the selected years rather than the full history.
+    The original row numbers are kept as the index (same as 'Unnamed: 0').
+    '''
+    YEARS = [YEARS_PAIRS[0][0], YEARS_PAIRS[len(YEARS_PAIRS) - 1][1]]
+
+    header = pd.read_csv(DATA_PATH, nrows=0).columns
+    usecols = [col for col in header if col not in UNUSED_COLUMNS]
+    dtypes = {col: np.float64 for col in usecols}
+    dtypes.update({'Unnamed: 0': np.int64, 'Player': str, 'Pos': str,
+                   'Tm': str})
+
+    chunks = []
+    for chunk in pd.read_csv(DATA_PATH, usecols=usecols, dtype=dtypes,
+                             chunksize=CHUNKSIZE):
+        chunks.append(chunk[(chunk['Year'] >= YEARS[0]) &
+                            (chunk['Year'] <= YEARS[1]) &
+                            chunk['Player'].notna()])
+
+    df = pd.concat(chunks)
+    print("** Load {}: {} rows for {}-{}".format(DATA_PATH, len(df),
+                                                 YEARS[0], YEARS[1]))
+
+    return df
+
+
+def loadData(PLAYER_PATH, DATA_PATH, YEARS_PAIRS) -> pd.DataFrame:
+    # Load datasets. Only the requested years are kept in memory.
+    df_players = pd.read_csv(PLAYER_PATH, usecols=list(PLAYER_COLUMNS),
+                             dtype=PLAYER_COLUMNS)
+    df_stats = loadSeasonStats(DATA_PATH, YEARS_PAIRS)
+
+    # Add specific features from 'PLAYER_PATH' to the 'DATA_PATH' dataset
+    return combineData(df_players, df_stats)
+
+
 def initialDataModification(PLAYER_PATH, DATA_PATH,
                             YEARS_PAIRS, REQ_GAMES, REQ_MIN,
                             THREE_POSITION_FLAG, NON_NUMERIC_COLUMNS,
                             OUTPUT_FILES_FLAG):
 
-    # Load datasets
-    df_players = pd.read_csv(PLAYER_PATH)
-    df_stats = pd.read_csv(DATA_PATH)
-
-    # Add specific features from 'PLAYER_PATH' to the 'DATA_PATH' dataset
-    df_data = combineData(df_players, df_stats)
+    df_data = loadData(PLAYER_PATH, DATA_PATH, YEARS_PAIRS)
 
     # Process data using indicated constraints for ONLY the relevant years.
 
     df_model = modifyData(df_data, YEARS_PAIRS, REQ_GAMES, REQ_MIN,
                           THREE_POSITION_FLAG)
 
-    df_model.to_csv("../data/ref/Season_Stats_MODEL_{}-{}.csv".format(
-                    YEARS_PAIRS[0][0], YEARS_PAIRS[len(YEARS_PAIRS) - 1][1]),
-                    index=False)
+    # Shrink the working set for every model. Decade slices inherit these
+    # dtypes.
+    df_model = compactDtypes(df_model)
+
+    MODEL_PATH = "../data/ref/Season_Stats_MODEL_{}-{}".format(
+                    YEARS_PAIRS[0][0], YEARS_PAIRS[len(YEARS_PAIRS) - 1][1])
+    df_model.to_csv(MODEL_PATH + ".csv", index=False)
+    df_model.to_pickle(MODEL_PATH + ".pkl")
 
     # IF DESIRED, output various DQR and csv files about the data.
     if OUTPUT_FILES_FLAG:
@@ -0,0 +1,116 @@
+################################################################################
+#   File:   dbscan.py
+#   Author: John Smutny
+#   Course: ECE-5424: Advanced Machine Learning
+#   Date:   12/15/2022
+#   Description:
+#       Density-based (DBSCAN) clustering model to analyze NBA positions.
+#       Tests if players form dense 'cores' instead of five blobs. Players
+#       that are not in a dense region are labeled as noise (-1) and are
+#       reported separately from the clusters.
+#
+#       Neighbor queries use the per-decade tree index in
+#       'lib/neighborIndex.py' (shared with the hierarchy model).
+#
+#   Reference
+#       DBSCAN: https://scikit-learn.org/stable/modules/clustering.html#dbscan
+################################################################################
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import DBSCAN
+
+import lib.modelCommon as common
+import lib.fitCache as fitCache
+import lib.neighborIndex as neighborIndex
+
+# Percentile of the MIN_SAMPLES-distance used as eps when it is not given.
+EPS_PERCENTILE = 90
+
+
+def modifyDataForModel(df: pd.DataFrame,
+                       INCLUDE_POS_FLAG, THREE_POS_FLAG) -> pd.DataFrame:
+
+    # Remove Features
+    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos', 'Teams']
+
+    # Also delete position features if they should not be used in modeling.
+    if not INCLUDE_POS_FLAG:
+        if THREE_POS_FLAG:
+            REMOVE_FEATURES.extend(["Pos_G", "Pos_F", "Pos_C"])
+        else:
+            REMOVE_FEATURES.extend(["Pos_PG", 'Pos_SG',
+                                    "Pos_SF", "Pos_PF",
+                                    "Pos_C"])
+
+    # Cluster labels written by previously run models are not features.
+    REMOVE_FEATURES.extend([col for col in df.columns
+                            if col.startswith('Cluster')])
+
+    df = df.drop(columns=REMOVE_FEATURES)
+
+    return df
+
+
+def estimateEps(x, MIN_SAMPLES: int) -> float:
+    '''
+    'Knee' of the k-distance curve, approximated by a high percentile of
+    every player's distance to its MIN_SAMPLES-th neighbor.
+    '''
+    return float(np.percentile(neighborIndex.kDistance(x, MIN_SAMPLES),
+                               EPS_PERCENTILE))
+
+
+def fitDBSCAN(x, EPS: float, MIN_SAMPLES: int) -> dict:
+    # Neighborhoods come from the shared tree index instead of a brute
+    # force distance computation.
+    graph = neighborIndex.radiusGraph(x, EPS)
+    model = DBSCAN(eps=EPS, min_samples=MIN_SAMPLES, metric='precomputed')
+    model.fit(graph)
+
+    return {'labels': model.labels_,
+            'core': model.core_sample_indices_}
+
+
+def cachedDBSCAN(x, EPS: float, MIN_SAMPLES: int) -> dict:
+    return fitCache.cachedFit(x, "DBSCAN",
+                              {'eps': EPS, 'min_samples': MIN_SAMPLES},
+                              lambda: fitDBSCAN(x, EPS, MIN_SAMPLES))
+
+
+def runDBSCAN(df: pd.DataFrame, YEARS: list, INCLUDE_POS, THREE_POS_FLAG,
+              APPLY_PCA: bool, VARIANCE: float, MIN_SAMPLES=10, EPS=None):
+    print("---- Start DBSCAN Clustering model ----")
+
+    df_data = modifyDataForModel(df, INCLUDE_POS, THREE_POS_FLAG)
+    x = common.normalizeData(df_data.to_numpy())
+
+    if APPLY_PCA:
+        x = common.pcaTransform(x, VARIANCE)
+
+    print("** Data for Model Modification: COMPLETE")
+
+    if EPS is None:
+        EPS = estimateEps(x, MIN_SAMPLES)
+
+    fit = cachedDBSCAN(x, EPS, MIN_SAMPLES)
+    labels = fit['labels']
+
+    numClusters = int(labels.max()) + 1
+    numNoise = int(np.sum(labels < 0))
+    print("eps = {:.4f}\tClusters = {}\tNoise players = {} ({:.1%})".format(
+        EPS, numClusters, numNoise, numNoise / len(labels)))
+
+    # Clusters are labeled [0, x], noise is -1
+    df.loc[:, 'Cluster'] = labels
+
+    #####################################
+    # Evaluate the Model
+    # 1) Output PIE concentration charts of the clusters (+ noise)
+    # 2) Measure the Tightness of each cluster (noise excluded)
+    common.calcPositionConc(df, "DBSCAN", YEARS, THREE_POS_FLAG,
+                            max(numClusters, 1))
+
+    metrics = common.reportClusterScores(df, YEARS, INCLUDE_POS)
+
+    return metrics + [numClusters, numNoise, round(EPS, 4)]
@@ -0,0 +1,315 @@
+'''
+File:   featureSelection.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/16/2022
+Description:
+    Feature subset search driven by clustering quality. The models use
+    every remaining stat column, even though e.g. PER, WS and BPM are
+    largely redundant and the 3P-era columns are imputed in early decades.
+
+    Per decade, subsets of the model features are searched with
+        forward  - greedy, add the best feature each step
+        backward - greedy, remove the least useful feature each step
+        beam     - forward search keeping the BEAM_WIDTH best subsets
+    A subset is scored by fitting kMeans on it (same preparation as the
+    models: MinMax scale -> row normalize) and combining the Silhouette
+    Coefficient with the position entropy of the clusters:
+        Score = sum(WEIGHTS[metric] * metric)
+
+    The raw Silhouette Coefficient favors tiny subsets: one or two skewed
+    columns split into well separated slabs whether or not they hold any
+    player structure. The score therefore uses SC_Gain, the SC of the
+    subset minus the SC of the same subset with every column permuted
+    independently (same marginals, no joint structure). A subset only
+    scores when kMeans finds NUM_CLUSTERS clusters of at least
+    MIN_CLUSTER_SHARE of the players each, otherwise its score is -inf.
+    Columns that are constant or imputed (mostly -1, see
+    'dataPreparation.modifyNanValues()') in a decade are dropped before
+    its search.
+
+    Every subset is evaluated once; the scores are cached and shared by all
+    three searches.
+
+    Candidate subsets of a step are evaluated in a process pool. The scaled
+    feature matrix of each decade is shared once (column-major, so a worker
+    only reads the columns of its subset) through a SharedArrayStore.
+
+Output:
+    SELECTED_PATH - Best subset of every (decade, search).
+    TRACE_PATH    - Every evaluated subset of every search step.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, \
+    silhouette_score
+from sklearn.preprocessing import normalize
+
+import dataPreparation as dp
+import kMeans as kMeans
+import lib.modelCommon as common
+import lib.sharedArrays as sharedArrays
+from lib.sharedArrays import SharedArrayStore
+
+##########################
+################
+##########################
+
+'''
+-- Search settings --
+SEARCHES - Searches to run for every decade {forward, backward, beam}
+MIN_FEATURES / MAX_FEATURES - Size limits of a subset.
+MIN_CLUSTER_SHARE - Smallest share of the players a cluster must hold.
+IMPUTED_LIMIT - Share of -1 values above which a column counts as imputed.
+WEIGHTS - Weight of each metric in the subset score. Metrics:
+            SC_Gain (higher = better separated than the permuted baseline)
+            Entropy (lower = clusters carry more position information)
+            SC, SC_Baseline, CHS, DBI (also reported in the trace)
+'''
+YEARS = [[1971, 1980],
+         [1981, 1990],
+         [1991, 2000],
+         [2001, 2010],
+         [2011, 2020]]
+MODEL_DATA_PATH = "../data/ref/Season_Stats_MODEL_{}-{}".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+SELECTED_PATH = "../data/output/FEATURES_Selected_{}-{}.csv".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+TRACE_PATH = "../data/output/FEATURES_Trace_{}-{}.csv".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+
+SEARCHES = ['forward', 'backward', 'beam']
+BEAM_WIDTH = 3
+MIN_FEATURES = 2
+MAX_FEATURES = 15
+NUM_CLUSTERS = 5
+MIN_CLUSTER_SHARE = 0.02
+IMPUTED_LIMIT = 0.3
+INCLUDE_POS = False
+WEIGHTS = {'SC_Gain': 1.0, 'Entropy': -0.25}
+NUM_WORKERS = None
+
+METRICS = ['SC', 'SC_Baseline', 'SC_Gain', 'CHS', 'DBI', 'Entropy']
+
+
+def _nonTrivial(labels) -> bool:
+    counts = np.bincount(labels, minlength=NUM_CLUSTERS)
+
+    return int(np.sum(counts >= MIN_CLUSTER_SHARE * len(labels))) == \
+        NUM_CLUSTERS
+
+
+def _evaluateSubset(job) -> np.ndarray:
+    '''
+    Process pool worker. Metrics (order of METRICS) of one feature subset.
+    '''
+    name, columns, THREE_POS_FLAG = job
+    # Only the subset's columns are read from the shared matrix.
+    x_scaled = sharedArrays.get(name + '_x')[:, list(columns)]
+    x = normalize(x_scaled)
+    positions = sharedArrays.get(name + '_pos')
+
+    labels = kMeans.fitKmeans(x, NUM_CLUSTERS)['labels']
+    if not _nonTrivial(labels):
+        return np.full(len(METRICS), np.nan)
+
+    # Baseline: same columns, each shuffled on its own (seeded by the
+    # subset, so a subset always gets the same baseline).
+    rng = np.random.default_rng(list(columns))
+    x_baseline = normalize(rng.permuted(x_scaled, axis=0))
+    labels_baseline = kMeans.fitKmeans(x_baseline, NUM_CLUSTERS)['labels']
+    sc_baseline = silhouette_score(x_baseline, labels_baseline) \
+        if len(np.unique(labels_baseline)) > 1 else 0.0
+
+    df_conc = common.positionConcentration(labels, positions,
+                                           THREE_POS_FLAG, NUM_CLUSTERS)
+    sc = silhouette_score(x, labels)
+
+    return np.array([sc,
+                     sc_baseline,
+                     sc - sc_baseline,
+                     calinski_harabasz_score(x, labels),
+                     davies_bouldin_score(x, labels),
+                     common.concentrationEntropy(df_conc)])
+
+
+class SubsetSearch:
+    '''
+    Searches over the features of one decade. Scores of evaluated subsets
+    are cached and shared by all searches.
+    '''
+
+    def __init__(self, name, features: list, THREE_POS_FLAG, pool):
+        self.name = name
+        self.features = features
+        self.three = THREE_POS_FLAG
+        self.pool = pool
+        self.metrics = {}
+        self.trace = []
+
+    def score(self, subset) -> float:
+        metrics = self.metrics[subset]
+        if np.isnan(metrics).any():
+            return -np.inf
+
+        return float(sum(weight * metrics[METRICS.index(metric)]
+                         for metric, weight in WEIGHTS.items()))
+
+    def evaluate(self, subsets, SEARCH, STEP) -> list:
+        '''
+        Score a list of subsets (tuples of column numbers). Only subsets
+        that were not evaluated before are sent to the pool.
+        :return: subsets sorted from best to worst score.
+        '''
+        subsets = list(dict.fromkeys(tuple(sorted(s)) for s in subsets))
+        missing = [s for s in subsets if s not in self.metrics]
+        if missing:
+            jobs = [(self.name, s, self.three) for s in missing]
+            for subset, metrics in zip(missing, self.pool.map(
+                    _evaluateSubset, jobs, chunksize=4)):
+                self.metrics[subset] = metrics
+
+        for subset in subsets:
+            self.trace.append({'Search': SEARCH,
+                               'Step': STEP,
+                               'Size': len(subset),
+                               'Features': "|".join(self.features[i]
+                                                    for i in subset),
+                               **dict(zip(METRICS, self.metrics[subset])),
+                               'Score': self.score(subset)})
+
+        return sorted(subsets, key=self.score, reverse=True)
+
+    def beam(self, WIDTH, SEARCH='beam'):
+        '''
+        Add one feature per step to each of the WIDTH best subsets. Stops
+        when a step does not improve the best score.
+        '''
+        n = len(self.features)
+        best, best_score = None, -np.inf
+        beam = [()]
+        step = 0
+
+        while len(beam[0]) < min(MAX_FEATURES, n):
+            candidates = [subset + (f,) for subset in beam
+                          for f in range(n) if f not in subset]
+
+            # Subsets below MIN_FEATURES are not scored, only expanded.
+            if len(candidates[0]) < MIN_FEATURES:
+                beam = list(dict.fromkeys(tuple(sorted(s))
+                                          for s in candidates))
+                continue
+
+            step = step + 1
+            ranked = self.evaluate(candidates, SEARCH, step)
+            # The first step always sets 'best', even if nothing scores.
+            if best is not None and self.score(ranked[0]) <= best_score:
+                break
+
+            best, best_score = ranked[0], self.score(ranked[0])
+            beam = ranked[:WIDTH]
+
+        return best
+
+    def forward(self):
+        return self.beam(1, 'forward')
+
+    def backward(self):
+        '''
+        Remove one feature per step from the full set. Stops when no
+        removal improves the score.
+        '''
+        best = tuple(range(len(self.features)))
+        self.evaluate([best], 'backward', 0)
+        step = 0
+
+        while len(best) > MIN_FEATURES:
+            step = step + 1
+            ranked = self.evaluate([tuple(f for f in best if f != drop)
+                                    for drop in best], 'backward', step)
+            if self.score(ranked[0]) <= self.score(best):
+                break
+            best = ranked[0]
+
+        return best
+
+
+def runFeatureSelection(df: pd.DataFrame, YEARS: list,
+                        SEARCHES=SEARCHES, NUM_WORKERS=NUM_WORKERS):
+    '''
+    :return: (df_selected, df_trace)
+    '''
+    THREE_POS_FLAG = 'G' in set(df['Pos'].astype(str))
+
+    selected = []
+    traces = []
+    with SharedArrayStore() as store:
+        decades = []
+        for i, YEAR in enumerate(YEARS):
+            df_year = df.loc[(df['Year'] >= YEAR[0]) &
+                             (df['Year'] <= YEAR[1])]
+            df_features = kMeans.modifyDataForModel(df_year, INCLUDE_POS,
+                                                    THREE_POS_FLAG)
+
+            # Constant / imputed columns carry no player information.
+            x_raw = df_features.to_numpy(dtype=np.float64)
+            dropped = (np.ptp(x_raw, axis=0) == 0) | \
+                ((x_raw == -1).mean(axis=0) > IMPUTED_LIMIT)
+            if dropped.any():
+                print("** Feature Selection {}-{}: dropped {}".format(
+                    YEAR[0], YEAR[1], ", ".join(df_features.columns[dropped])))
+                df_features = df_features.loc[:, ~dropped]
+
+            # MinMax scaling is per column, so the matrix is scaled once
+            # for every subset. Column-major for cheap column reads.
+            name = "decade{}".format(i)
+            store.put(name + '_x', np.asfortranarray(
+                common.scaleData(x_raw[:, ~dropped])))
+            store.put(name + '_pos', np.asarray(df_year['Pos'].astype(str),
+                                                dtype=str))
+            decades.append((name, YEAR, list(df_features.columns)))
+
+        with store.pool(NUM_WORKERS) as pool:
+            for name, YEAR, features in decades:
+                years = "{}-{}".format(YEAR[0], YEAR[1])
+                search = SubsetSearch(name, features, THREE_POS_FLAG, pool)
+
+                for SEARCH in SEARCHES:
+                    if SEARCH == 'forward':
+                        best = search.forward()
+                    elif SEARCH == 'backward':
+                        best = search.backward()
+                    else:
+                        best = search.beam(BEAM_WIDTH)
+
+                    selected.append({'Years': years,
+                                     'Search': SEARCH,
+                                     'Size': len(best),
+                                     'Features': "|".join(features[f]
+                                                          for f in best),
+                                     **dict(zip(METRICS,
+                                                search.metrics[best])),
+                                     'Score': search.score(best)})
+                    print("** Feature Selection {} ({}): {}".format(
+                        years, SEARCH, selected[-1]['Features']))
+
+                df_trace = pd.DataFrame(search.trace)
+                df_trace.insert(0, 'Years', years)
+                traces.append(df_trace)
+                print("**** {} distinct subsets evaluated".format(
+                    len(search.metrics)))
+
+    return pd.DataFrame(selected), pd.concat(traces, ignore_index=True)
+
+
+if __name__ == '__main__':
+    df_data = dp.loadModelData(MODEL_DATA_PATH)
+    df_selected, df_trace = runFeatureSelection(df_data, YEARS)
+
+    os.makedirs(os.path.dirname(SELECTED_PATH), exist_ok=True)
+    df_selected.to_csv(SELECTED_PATH, index=False)
+    df_trace.to_csv(TRACE_PATH, index=False)
+    print(df_selected.to_string())
@@ -0,0 +1,313 @@
+################################################################################
+#   File:   gmm.py
+#   Author: John Smutny
+#   Course: ECE-5424: Advanced Machine Learning
+#   Date:   12/02/2022
+#   Description:
+#       Gaussian Mixture Model (EM algorithm) to analyze NBA positions.
+#       Mixtures are fit with a vectorized EM for a range of component counts
+#       and covariance structures {diag, tied, full}. The best mixture is
+#       selected by the Bayesian Information Criterion (BIC); the AIC choice
+#       is reported alongside it.
+#
+#       Unlike the hard-assignment models, a mixture gives every player a
+#       probability of belonging to each cluster. The average entropy of
+#       those soft assignments is reported as a direct measure of
+#       'positionlessness' - a player split evenly between clusters has a
+#       high entropy.
+#
+#   Reference
+#       Pattern Classification (Duda, Hart, Stork) - Ch 3.9 EM Algorithm
+#       Model Selection: https://scikit-learn.org/stable/modules/mixture.html
+################################################################################
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_triangular
+from scipy.special import logsumexp
+from sklearn.cluster import KMeans
+
+import lib.modelCommon as common
+import lib.fitCache as fitCache
+import lib.sharedArrays as sharedArrays
+from lib.sharedArrays import SharedArrayStore
+
+COVARIANCE_TYPES = ['diag', 'tied', 'full']
+REG_COVAR = 1e-6
+
+
+def modifyDataForModel(df: pd.DataFrame,
+                       INCLUDE_POS_FLAG, THREE_POS_FLAG) -> pd.DataFrame:
+
+    # Remove Features
+    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos', 'Teams']
+
+    # Also delete position features if they should not be used in modeling.
+    if not INCLUDE_POS_FLAG:
+        if THREE_POS_FLAG:
+            REMOVE_FEATURES.extend(["Pos_G", "Pos_F", "Pos_C"])
+        else:
+            REMOVE_FEATURES.extend(["Pos_PG", 'Pos_SG',
+                                    "Pos_SF", "Pos_PF",
+                                    "Pos_C"])
+
+    # Cluster labels written by previously run models are not features.
+    REMOVE_FEATURES.extend([col for col in df.columns
+                            if col.startswith('Cluster')])
+
+    df = df.drop(columns=REMOVE_FEATURES)
+
+    return df
+
+
+#========================================
+# Vectorized EM
+
+def sharedStatistics(x) -> dict:
+    '''
+    Statistics of the data matrix that every EM fit needs on every
+    iteration, regardless of the number of components or covariance type.
+    Computed once per dataset and shared by all fits of a k-sweep.
+    '''
+    return {'x2': x * x,        # diag E/M-step
+            'XtX': x.T @ x}     # tied M-step
+
+
+def numParameters(k: int, d: int, COVARIANCE: str) -> int:
+    if COVARIANCE == 'diag':
+        cov_params = k * d
+    elif COVARIANCE == 'tied':
+        cov_params = d * (d + 1) / 2
+    else:
+        cov_params = k * d * (d + 1) / 2
+
+    return int(cov_params + k * d + k - 1)
+
+
+def estimateLogProb(x, stats: dict, means, covariances, COVARIANCE: str):
+    '''
+    E-step: log N(x | mu_k, Sigma_k) for every point and component.
+    :return: (n, k) matrix of log densities.
+    '''
+    n, d = x.shape
+    const = d * np.log(2 * np.pi)
+
+    if COVARIANCE == 'diag':
+        precision = 1.0 / covariances
+        # sum_d (x - mu)^2 / var expanded so the shared x^2 term is reused.
+        maha = (stats['x2'] @ precision.T
+                - 2 * x @ (means * precision).T
+                + np.sum(means ** 2 * precision, axis=1))
+        log_det = np.sum(np.log(covariances), axis=1)
+
+    elif COVARIANCE == 'tied':
+        chol = np.linalg.cholesky(covariances)
+        y = solve_triangular(chol, x.T, lower=True).T
+        mu = solve_triangular(chol, means.T, lower=True).T
+        maha = (np.sum(y * y, axis=1)[:, np.newaxis]
+                - 2 * y @ mu.T
+                + np.sum(mu * mu, axis=1))
+        log_det = np.full(len(means), 2 * np.sum(np.log(np.diag(chol))))
+
+    else:
+        maha = np.empty((n, len(means)))
+        log_det = np.empty(len(means))
+        for k in range(len(means)):
+            chol = np.linalg.cholesky(covariances[k])
+            y = solve_triangular(chol, (x - means[k]).T, lower=True)
+            maha[:, k] = np.sum(y * y, axis=0)
+            log_det[k] = 2 * np.sum(np.log(np.diag(chol)))
+
+    return -0.5 * (const + log_det + maha)
+
+
+def maximization(x, stats: dict, resp, COVARIANCE: str):
+    '''
+    M-step: mixture weights, means and covariances from responsibilities.
+    '''
+    n, d = x.shape
+    nk = resp.sum(axis=0) + 10 * np.finfo(resp.dtype).eps
+    means = (resp.T @ x) / nk[:, np.newaxis]
+
+    if COVARIANCE == 'diag':
+        avg_x2 = (resp.T @ stats['x2']) / nk[:, np.newaxis]
+        covariances = avg_x2 - means ** 2 + REG_COVAR
+
+    elif COVARIANCE == 'tied':
+        covariances = (stats['XtX'] - (nk[:, np.newaxis] * means).T @ means)
+        covariances = covariances / nk.sum() + REG_COVAR * np.eye(d)
+
+    else:
+        covariances = np.empty((len(nk), d, d))
+        for k in range(len(nk)):
+            diff = x - means[k]
+            covariances[k] = (resp[:, k] * diff.T) @ diff / nk[k]
+            covariances[k].flat[::d + 1] += REG_COVAR
+
+    return nk / n, means, covariances
+
+
+def fitGMM(x, stats: dict, k: int, COVARIANCE: str,
+           MAX_ITER=200, TOL=1e-4, RANDOM_STATE=0) -> dict:
+    '''
+    Fit one Gaussian mixture with EM. Initial responsibilities come from a
+    single k-means run so that fits are repeatable.
+    '''
+    n, d = x.shape
+    init = KMeans(n_clusters=k, n_init=1,
+                  random_state=RANDOM_STATE).fit_predict(x)
+    resp = np.zeros((n, k))
+    resp[np.arange(n), init] = 1
+
+    weights, means, covariances = maximization(x, stats, resp, COVARIANCE)
+
+    log_likelihood = -np.inf
+    converged = False
+    for iteration in range(MAX_ITER):
+        # E-step
+        weighted = estimateLogProb(x, stats, means, covariances, COVARIANCE) \
+            + np.log(weights)
+        log_norm = logsumexp(weighted, axis=1)
+        resp = np.exp(weighted - log_norm[:, np.newaxis])
+
+        previous = log_likelihood
+        log_likelihood = np.sum(log_norm)
+        if abs(log_likelihood - previous) < TOL * n:
+            converged = True
+            break
+
+        # M-step
+        weights, means, covariances = maximization(x, stats, resp,
+                                                   COVARIANCE)
+
+    p = numParameters(k, d, COVARIANCE)
+
+    return {'K': k,
+            'Covariance': COVARIANCE,
+            'resp': resp,
+            'weights': weights,
+            'means': means,
+            'covariances': covariances,
+            'LogLikelihood': log_likelihood,
+            'BIC': -2 * log_likelihood + p * np.log(n),
+            'AIC': -2 * log_likelihood + 2 * p,
+            'Iterations': iteration + 1,
+            'Converged': converged}
+
+
+def _fitJob(job) -> dict:
+    '''
+    Process pool worker. The data and its statistics are read from the
+    shared array store instead of being pickled into every worker.
+    '''
+    k, cov = job
+    x = sharedArrays.get('x')
+    stats = {'x2': sharedArrays.get('x2'), 'XtX': sharedArrays.get('XtX')}
+
+    return fitGMM(x, stats, k, cov)
+
+
+def fitMixtures(x, K_RANGE, COVARIANCE_LIST=COVARIANCE_TYPES,
+                NUM_WORKERS=None) -> list:
+    '''
+    Fit a mixture for every (k, covariance) combination. Previously fit
+    mixtures are read from the fit cache. The remaining fits run in a
+    process pool; all of them share one copy of the data and of its
+    statistics through a SharedArrayStore.
+    '''
+    jobs = [(k, cov) for cov in COVARIANCE_LIST for k in K_RANGE]
+
+    keys = [fitCache.fitKey(x, "GMM",
+                            {'k': k, 'covariance': cov, 'max_iter': 200,
+                             'tol': 1e-4, 'random_state': 0,
+                             'reg': REG_COVAR})
+            for k, cov in jobs]
+    fits = [fitCache.load(key) if fitCache.ENABLED else None
+            for key in keys]
+
+    missing = [i for i, fit in enumerate(fits) if fit is None]
+    new_fits = []
+    if len(missing) > 0 and NUM_WORKERS == 1:
+        # Already inside a worker (ex: 'sweep.py'), fit in this process.
+        stats = sharedStatistics(x)
+        new_fits = [fitGMM(x, stats, jobs[i][0], jobs[i][1])
+                    for i in missing]
+    elif len(missing) > 0:
+        with SharedArrayStore() as store:
+            store.put('x', x)
+            for name, array in sharedStatistics(x).items():
+                store.put(name, array)
+
+            with store.pool(NUM_WORKERS) as pool:
+                new_fits = list(pool.map(_fitJob,
+                                         [jobs[i] for i in missing]))
+
+    for i, fit in zip(missing, new_fits):
+        fits[i] = fit
+        if fitCache.ENABLED:
+            fitCache.save(keys[i], fit)
+
+    return fits
+
+
+def assignmentEntropy(resp) -> float:
+    '''
+    Average Shannon entropy (nats) of the per-player soft assignments.
+    0 = every player belongs entirely to one cluster.
+    '''
+    p = np.clip(resp, 1e-12, 1)
+    return round(float(np.mean(-np.sum(p * np.log(p), axis=1))), 3)
+
+
+#========================================
+
+def runGMM(df: pd.DataFrame, YEARS: list, INCLUDE_POS, THREE_POS_FLAG,
+           APPLY_PCA: bool, VARIANCE: float, K_RANGE=range(2, 9),
+           COVARIANCE_LIST=COVARIANCE_TYPES):
+    print("---- Start Gaussian Mixture (EM) model ----")
+
+    df_data = modifyDataForModel(df, INCLUDE_POS, THREE_POS_FLAG)
+    x = common.normalizeData(df_data.to_numpy())
+
+    if APPLY_PCA:
+        x = common.pcaTransform(x, VARIANCE)
+
+    print("** Data for Model Modification: COMPLETE")
+
+    fits = fitMixtures(x, K_RANGE, COVARIANCE_LIST)
+
+    # Model Selection - lowest information criterion wins.
+    df_selection = pd.DataFrame(
+        [[f['K'], f['Covariance'], f['LogLikelihood'], f['BIC'], f['AIC'],
+          f['Iterations'], f['Converged']] for f in fits],
+        columns=['K', 'Covariance', 'LogLikelihood', 'BIC', 'AIC',
+                 'Iterations', 'Converged'])
+    df_selection.to_csv("../model/ref/GMM_Selection_{}-{}.csv".format(
+        YEARS[0], YEARS[1]), index=False)
+
+    best = fits[int(df_selection['BIC'].idxmin())]
+    best_aic = df_selection.loc[df_selection['AIC'].idxmin()]
+    print("BIC selection: k={} ({})\tAIC selection: k={} ({})".format(
+        best['K'], best['Covariance'], best_aic['K'],
+        best_aic['Covariance']))
+
+    # Hard labels from the soft assignments. Empty components are dropped so
+    # the labels are always in range [0, x].
+    labels = np.argmax(best['resp'], axis=1)
+    _, labels = np.unique(labels, return_inverse=True)
+    df.loc[:, 'Cluster'] = labels
+
+    entropy = assignmentEntropy(best['resp'])
+    print("Soft Assignment Entropy = {}".format(entropy))
+
+    #####################################
+    # Evaluate the Model
+    # 1) Output PIE concentration charts of the clusters
+    # 2) Measure the Tightness of each cluster
+    numClusters = int(labels.max()) + 1
+    common.calcPositionConc(df, "GMM", YEARS, THREE_POS_FLAG, numClusters)
+
+    metrics = common.reportClusterScores(df, YEARS, INCLUDE_POS)
+    metrics.extend([numClusters, best['Covariance'], entropy])
+
+    return metrics
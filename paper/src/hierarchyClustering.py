@@ -17,13 +17,16 @@ import scipy.cluster.hierarchy as shc
 import numpy as np
 
 import lib.modelCommon as common
+import lib.fitCache as fitCache
+import lib.distanceCache as distanceCache
+import lib.neighborIndex as neighborIndex
 from sklearn.cluster import AgglomerativeClustering
 
 def modifyDataForModel(df: pd.DataFrame,
                        INCLUDE_POS_FLAG, THREE_POS_FLAG) -> pd.DataFrame:
 
     # Remove Features
-    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos']
+    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos', 'Teams']
 
     # Also delete position features if they should not be used in modeling.
     if not INCLUDE_POS_FLAG:
@@ -34,23 +37,52 @@ def modifyDataForModel(df: pd.DataFrame,
                                     "Pos_SF", "Pos_PF",
                                     "Pos_C"])
 
+    # Cluster labels written by previously run models are not features.
+    REMOVE_FEATURES.extend([col for col in df.columns
+                            if col.startswith('Cluster')])
+
     df = df.drop(columns=REMOVE_FEATURES)
 
     return df
 
 
-def hierarchicalClustering(df: pd.DataFrame, YEARS: list,
-                           INCLUDE_POS, THREE_POS_FLAG,
-                           APPLY_PCA: bool, VARIANCE: float):
-    print("---- Start Hierarchy Clustering model ----")
-
-    df_data = modifyDataForModel(df, INCLUDE_POS, THREE_POS_FLAG)
-    x = common.normalizeData(df_data.to_numpy())
-
-    if APPLY_PCA:
-        x = common.pcaTransform(x, VARIANCE)
-
-    print("** Data for Model Modification: COMPLETE")
+def linkageFromTree(children, distances, numPoints):
+    # Convert a sklearn merge tree into a scipy linkage matrix.
+    counts = np.zeros(len(children))
+    for i, merge in enumerate(children):
+        counts[i] = sum(1 if child < numPoints else counts[child - numPoints]
+                        for child in merge)
+
+    return np.column_stack([children, distances, counts]).astype(np.float64)
+
+
+def fitConnectedWard(x, numClusters, NEIGHBORS: int):
+    '''
+    Ward linkage where only players in each other's NEIGHBORS nearest
+    neighbors (shared per decade tree index) can be merged directly.
+    :return: (linkage matrix, labels of the tree cut at numClusters)
+    '''
+    cluster = AgglomerativeClustering(n_clusters=numClusters, linkage='ward',
+                                      connectivity=neighborIndex.connectivity(
+                                          x, NEIGHBORS),
+                                      compute_full_tree=True,
+                                      compute_distances=True)
+    cluster.fit(x)
+
+    return linkageFromTree(cluster.children_, cluster.distances_, len(x)), \
+        cluster.labels_
+
+
+def fitHierarchy(x, numClusters, distances=None, NEIGHBORS=None) -> dict:
+    # NEIGHBORS = connectivity-constrained ward on the k-NN graph instead.
+    # The threshold clusters are cut from the same (connected) tree, so no
+    # unconstrained fit or full distance matrix is needed.
+    if NEIGHBORS is not None:
+        Z, labels = fitConnectedWard(x, numClusters, NEIGHBORS)
+        return {'linkage': Z,
+                'labels': labels,
+                'thresholdLabels': shc.fcluster(Z, t=200,
+                                                criterion='distance') - 1}
 
     # Initialize hiererchial clustering method, in order for the algorithm to determine the number of clusters
     # put n_clusters=None, compute_full_tree = True,
@@ -61,43 +93,76 @@ def hierarchicalClustering(df: pd.DataFrame, YEARS: list,
     # Cluster the data
     cluster.fit_predict(x)
 
-    print(f"Number of clusters = {1 + np.amax(cluster.labels_)}")
-
-    # Display the clustering, assigning cluster label to every datapoint
-    print("Classifying the points into clusters:")
-    print(cluster.labels_)
-
-    # Display the clustering graphically in a plot
-    plt.scatter(x[:, 0], x[:, 1], c=cluster.labels_, cmap='rainbow')
-    plt.title(f"SK Learn estimated number of clusters = {1 + np.amax(cluster.labels_)}")
-    plt.show()
-
     # see documentation for different cluster methodologies
     # { single, complete, average, weighted, centroid, median, ward }
     # https://docs.scipy.org/doc/scipy/reference/generated/scipy.cluster.hierarchy.linkage.html
-    Z = shc.linkage( x,
+    # Use the cached condensed distances when available.
+    Z = shc.linkage( x if distances is None else distances,
                      method='ward',
                      optimal_ordering=False
                      )
 
-
     # Documentation of .cut_tree vs .fcluster (I think .fcluster is the way
     # to go.
     # https://docs.scipy.org/doc/scipy/reference/cluster.hierarchy.html
-    numClusters = len(df['Pos'].unique())
-    clusters = shc.cut_tree(Z,
-                            n_clusters=numClusters)
-
     # For a specific 't' number of clusters, get a 1D vector of size=(
-    # #dataPts) showing which cluster each dataPt is in. Add the cluster
-    # label to the dataset.
+    # #dataPts) showing which cluster each dataPt is in.
     labels = shc.fcluster(Z,
                           criterion='maxclust',
                           t=numClusters)
 
+    return {'linkage': Z,
+            'labels': labels - 1,
+            'thresholdLabels': cluster.labels_}
+
+
+def cachedHierarchy(x, numClusters, distances=None, NEIGHBORS=None) -> dict:
+    params = {'linkage': 'ward', 't': numClusters, 'distance_threshold': 200}
+    if NEIGHBORS is not None:
+        params['connectivity_neighbors'] = NEIGHBORS
+        # Threshold labels are cut from the connected tree.
+        params['threshold_tree'] = 'connected'
+
+    return fitCache.cachedFit(x, "Hierarchy", params,
+                              lambda: fitHierarchy(x, numClusters, distances,
+                                                   NEIGHBORS))
+
+
+def hierarchicalClustering(df: pd.DataFrame, YEARS: list,
+                           INCLUDE_POS, THREE_POS_FLAG,
+                           APPLY_PCA: bool, VARIANCE: float,
+                           NEIGHBORS=None):
+    print("---- Start Hierarchy Clustering model ----")
+
+    df_data = modifyDataForModel(df, INCLUDE_POS, THREE_POS_FLAG)
+    x = common.normalizeData(df_data.to_numpy())
+
+    if APPLY_PCA:
+        x = common.pcaTransform(x, VARIANCE)
+
+    print("** Data for Model Modification: COMPLETE")
+
+    numClusters = len(df['Pos'].unique())
+    # The connectivity-constrained ward (NEIGHBORS) never needs the full
+    # distance matrix.
+    distances = distanceCache.condensed(x) if NEIGHBORS is None else None
+    fit = cachedHierarchy(x, numClusters, distances, NEIGHBORS)
+    Z = fit['linkage']
+    labels = fit['labels']
+
+    print(f"Number of clusters = {1 + np.amax(fit['thresholdLabels'])}")
+
+    # Display the clustering, assigning cluster label to every datapoint
+    print("Classifying the points into clusters:")
+    print(fit['thresholdLabels'])
+
+    # Display the clustering graphically in a plot
+    plt.scatter(x[:, 0], x[:, 1], c=fit['thresholdLabels'], cmap='rainbow')
+    plt.title(f"SK Learn estimated number of clusters = {1 + np.amax(fit['thresholdLabels'])}")
+    plt.show()
 
     # Ensure that all labels are corrected to be in range [0, 4]
-    df.loc[:, 'Cluster'] = labels - 1
+    df.loc[:, 'Cluster'] = labels
 
     ##
     # Create a visual dendrogram for the linkage data.
@@ -127,8 +192,15 @@ def hierarchicalClustering(df: pd.DataFrame, YEARS: list,
     from scipy.cluster.hierarchy import cophenet
     from scipy.spatial.distance import pdist
 
-    c, coph_dists = cophenet(Z, pdist(x))
-    print("Cophenetic Correlation Coefficient: {:.5f}".format(c))
+    # Needs every pairwise distance, so it is skipped for the
+    # connectivity-constrained ward (kept sub-quadratic).
+    if NEIGHBORS is None:
+        c, coph_dists = cophenet(Z, pdist(x) if distances is None
+                                    else distances)
+        print("Cophenetic Correlation Coefficient: {:.5f}".format(c))
+    else:
+        print("Cophenetic Correlation Coefficient: skipped "
+              "(connectivity-constrained ward)")
 
     #####################################
     # Evaluate the Model
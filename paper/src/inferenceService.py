@@ -0,0 +1,270 @@
+'''
+File:   inferenceService.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/18/2022
+Description:
+    Local inference service for player archetype lookup. Submit a stat line
+    and get back, for each decade's model, the cluster it lands in and that
+    cluster's position mix (the 'calcPositionConc' row) - without rerunning
+    'main.py'.
+
+    At startup the (decade, model) pipeline artifacts exported by 'main.py'
+    ('lib/pipelineArtifact.py': MinMax scaler, PCA basis, kMeans centroids,
+    SOM weights, ...) are loaded ONCE and kept in memory. Without exported
+    artifacts ('--fit') the pipelines are built from the modeling dataset
+    and the fit cache instead. A query is answered with vectorized
+    nearest-centroid assignment (one matrix product per model for the whole
+    batch; nearest training player for Hierarchy). Preprocessing stages (scale -> normalize -> PCA) that models
+    of a decade share are computed once per batch.
+
+    HTTP (JSON) endpoints:
+        POST /predict  {"players": [{stat: value, ...}, ...]}
+                        (or a single stat line object). Optional "decades"
+                        and "models" lists limit the answer.
+        GET  /health   manifests of the loaded pipelines
+        GET  /stats    request count and latency percentiles (ms)
+'''
+
+import argparse
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+import dataPreparation as dp
+import lib.pipelineArtifact as pipelineArtifact
+
+##########################
+################
+##########################
+
+'''
+-- Service settings --
+PIPELINE_PATH - Pipeline artifacts exported by 'main.py' (EXPORT_PIPELINES)
+MODEL_DATA_PATH - Prepared modeling dataset (see 'main.py' LOAD_MODEL_DATA),
+                    only used with '--fit'
+MODELS / APPLY_PCA / VARIANCE_THRESHOLD - Pipelines built with '--fit'
+LATENCY_WINDOW - Number of recent requests the latency stats cover.
+'''
+YEARS = [[1971, 1980],
+         [1981, 1990],
+         [1991, 2000],
+         [2001, 2010],
+         [2011, 2020]]
+MODEL_DATA_PATH = "../data/ref/Season_Stats_MODEL_{}-{}".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+
+PIPELINE_PATH = pipelineArtifact.PIPELINE_PATH
+
+HOST = "127.0.0.1"
+PORT = 8050
+MODELS = ['kMeans', 'SOM']
+INCLUDE_POS = False
+APPLY_PCA = True
+VARIANCE_THRESHOLD = 0.85
+LATENCY_WINDOW = 10000
+
+
+class InferenceService:
+    '''
+    In-memory pipelines of every decade plus request latency bookkeeping.
+    '''
+
+    def __init__(self, artifacts: list):
+        # years -> model name -> PipelineArtifact
+        self.pipelines = {}
+        for artifact in artifacts:
+            self.pipelines.setdefault(artifact.years, {})[artifact.model] = \
+                artifact
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def fromArtifacts(cls, ROOT=PIPELINE_PATH):
+        artifacts = pipelineArtifact.loadAll(ROOT)
+        if not artifacts:
+            raise FileNotFoundError("No pipeline artifacts in {}".format(
+                ROOT))
+        print("** Pipelines: LOADED {} artifacts".format(len(artifacts)))
+
+        return cls(artifacts)
+
+    @classmethod
+    def fromModelData(cls, df: pd.DataFrame, YEARS: list, MODELS=MODELS):
+        THREE_POS_FLAG = 'G' in set(df['Pos'].astype(str))
+        artifacts = []
+        for YEAR in YEARS:
+            df_year = df.loc[(df['Year'] >= YEAR[0]) &
+                             (df['Year'] <= YEAR[1])]
+            artifacts.extend(pipelineArtifact.fitArtifact(
+                df_year, YEAR, MODEL_NAME, INCLUDE_POS, THREE_POS_FLAG,
+                APPLY_PCA, VARIANCE_THRESHOLD) for MODEL_NAME in MODELS)
+            print("** Pipeline {}-{}: LOADED".format(YEAR[0], YEAR[1]))
+
+        return cls(artifacts)
+
+    def predict(self, request) -> dict:
+        '''
+        :param request: JSON body. An object (see '/predict') or a list of
+                        stat line objects.
+        '''
+        if isinstance(request, list):
+            request = {'players': request}
+        if not isinstance(request, dict):
+            raise TypeError("Request must be a JSON object or a list of "
+                            "stat lines")
+        players = request.get('players', request)
+        if isinstance(players, dict):
+            players = [players]
+        if not isinstance(players, list) or \
+                not all(isinstance(p, dict) for p in players):
+            raise TypeError("'players' must be a list of stat line objects")
+        decades = request.get('decades') or list(self.pipelines)
+        MODELS = request.get('models')
+
+        # Stat lines -> one matrix per distinct feature order. Transform
+        # stages are shared by the models (see PipelineArtifact.transform).
+        matrices = {}
+        stages = {}
+        response = {}
+        for years in decades:
+            decade = {}
+            for name in MODELS or self.pipelines[years]:
+                artifact = self.pipelines[years][name]
+                key = tuple(artifact.features)
+                if key not in matrices:
+                    missing = sorted({f for p in players for f in key
+                                      if f not in p})
+                    if missing:
+                        raise ValueError("Missing stats: {}".format(
+                            ", ".join(missing)))
+                    matrices[key] = np.array([[p[f] for f in key]
+                                              for p in players],
+                                             dtype=np.float64)
+                    # null / NaN / inf would land in cluster 0.
+                    finite = np.isfinite(matrices[key])
+                    if not finite.all():
+                        raise ValueError("Non-finite stats: {}".format(
+                            ", ".join(f for f, ok in zip(key,
+                                                         finite.all(axis=0))
+                                      if not ok)))
+
+                labels = artifact.assign(artifact.transform(matrices[key],
+                                                            stages))
+                decade[name] = [{'Cluster': int(label),
+                                 'ClusterSize': int(row[0]),
+                                 'Positions': dict(zip(artifact.positions,
+                                                       row[1:].tolist()))}
+                                for label, row in zip(
+                                    labels, artifact.concentration(labels))]
+            response[years] = decade
+
+        return response
+
+    def record(self, seconds):
+        with self.lock:
+            self.requests = self.requests + 1
+            self.latencies.append(seconds * 1000)
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = np.array(self.latencies)
+            requests = self.requests
+
+        if len(latencies) == 0:
+            return {'requests': requests}
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {'requests': requests,
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(latencies.max()), 3)}
+
+    def health(self) -> dict:
+        return {years: {name: artifact.manifest
+                        for name, artifact in models.items()}
+                for years, models in self.pipelines.items()}
+
+
+def makeHandler(service: InferenceService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, code, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.reply(200, service.health())
+            elif self.path == '/stats':
+                self.reply(200, service.stats())
+            else:
+                self.reply(404, {'error': 'Unknown path'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.reply(404, {'error': 'Unknown path'})
+                return
+
+            start = time.perf_counter()
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                response = service.predict(json.loads(self.rfile.read(length)))
+            except (KeyError, ValueError, TypeError) as e:
+                self.reply(400, {'error': str(e)})
+                return
+            service.record(time.perf_counter() - start)
+
+            self.reply(200, response)
+
+        def log_message(self, format, *args):
+            # Per-request logging would dominate the latency.
+            pass
+
+    return Handler
+
+
+def serve(service: InferenceService, HOST=HOST, PORT=PORT):
+    server = ThreadingHTTPServer((HOST, PORT), makeHandler(service))
+    server.daemon_threads = True
+    print("** Inference Service: listening on http://{}:{}".format(HOST,
+                                                                   PORT))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("** Inference Service latency: {}".format(service.stats()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Player archetype lookup service")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--pipelines', default=PIPELINE_PATH,
+                        help="Directory of exported pipeline artifacts")
+    parser.add_argument('--fit', action='store_true',
+                        help="Build the pipelines from MODEL_DATA_PATH "
+                             "instead of loading artifacts")
+    args = parser.parse_args()
+
+    if args.fit:
+        service = InferenceService.fromModelData(
+            dp.loadModelData(MODEL_DATA_PATH), YEARS)
+    else:
+        service = InferenceService.fromArtifacts(args.pipelines)
+    serve(service, args.host, args.port)
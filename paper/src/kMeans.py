@@ -9,6 +9,7 @@ Description:
 
 import pandas as pd
 import lib.modelCommon as common
+import lib.fitCache as fitCache
 
 import sklearn
 import numpy as np
@@ -25,7 +26,7 @@ import collections
 def modifyDataForModel(df: pd.DataFrame,
                        INCLUDE_POS_FLAG, THREE_POS_FLAG) -> pd.DataFrame:
     # Remove Features
-    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos']
+    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos', 'Teams']
 
     # Also delete position features if they should not be used in modeling.
     if not INCLUDE_POS_FLAG:
@@ -36,6 +37,10 @@ def modifyDataForModel(df: pd.DataFrame,
                                     "Pos_SF", "Pos_PF",
                                     "Pos_C"])
 
+    # Cluster labels written by previously run models are not features.
+    REMOVE_FEATURES.extend([col for col in df.columns
+                            if col.startswith('Cluster')])
+
     df = df.drop(columns=REMOVE_FEATURES)
 
     return df
@@ -61,6 +66,26 @@ def plotInertia(inertia: [], years: list):
     fig.show()
 
 
+def fitKmeans(x, k: int) -> dict:
+    kmeans = KMeans(n_clusters=k,
+                    init='k-means++',
+                    max_iter=300,
+                    n_init=10,
+                    random_state=0)
+    labels = kmeans.fit_predict(x)
+
+    return {'labels': labels,
+            'centroids': kmeans.cluster_centers_,
+            'inertia': kmeans.inertia_}
+
+
+def cachedKmeans(x, k: int) -> dict:
+    return fitCache.cachedFit(x, "kMeans",
+                              {'k': k, 'init': 'k-means++', 'max_iter': 300,
+                               'n_init': 10, 'random_state': 0},
+                              lambda: fitKmeans(x, k))
+
+
 def runKmeans(df: pd.DataFrame, YEARS: list, INCLUDE_POS, THREE_POS_FLAG,
               APPLY_PCA: bool, VARIANCE: float):
     print("---- Start kMeans Clustering model ----")
@@ -76,18 +101,14 @@ def runKmeans(df: pd.DataFrame, YEARS: list, INCLUDE_POS, THREE_POS_FLAG,
     inertia = []
     for i in range(5, 6):
         print(f"** Model3 (KMeans): RUN kMeans with {i} clusters \n")
-        kmeans = KMeans(n_clusters=i,
-                        init='k-means++',
-                        max_iter=300,
-                        n_init=10,
-                        random_state=0)
-        pred_y = kmeans.fit_predict(X)
-
-        inertia.append(kmeans.inertia_)
+        fit = cachedKmeans(X, i)
+        pred_y = fit['labels']
+
+        inertia.append(fit['inertia'])
         df.loc[:, f'Cluster{i}'] = pred_y
 
         print("Inertia:\t")
-        print(kmeans.inertia_)
+        print(fit['inertia'])
 
         print("Clusters (result of k-means)")
         print(collections.Counter(pred_y))
@@ -96,8 +117,8 @@ def runKmeans(df: pd.DataFrame, YEARS: list, INCLUDE_POS, THREE_POS_FLAG,
         print(collections.Counter(df['Pos']))
         plt.figure(figsize=(10, 6))
         plt.scatter(df['Pos'], X[:, 1])
-        plt.scatter(kmeans.cluster_centers_[:, 0],
-                    kmeans.cluster_centers_[:, 1],
+        plt.scatter(fit['centroids'][:, 0],
+                    fit['centroids'][:, 1],
                     s=300,
                     c='red')
         plt.show()
@@ -0,0 +1,164 @@
+'''
+File:   agreement.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/14/2022
+Description:
+    Support file to 'main.py' and 'sweep.py'
+    Agreement between the cluster labels of different models (and with the
+    players' 'Pos' ground truth) in one decade.
+
+    The contingency tables of ALL label pairs are counted in one bincount
+    over the stacked label arrays. Every measure is then computed from the
+    tables for all pairs at once:
+        ARI - Adjusted Rand Index         (1 = identical, ~0 = random)
+        NMI - Normalized Mutual Info      (1 = identical, 0 = independent)
+        VI  - Variation of Information    (0 = identical, nats)
+    Same definitions as sklearn's adjusted_rand_score and
+    normalized_mutual_info_score (arithmetic normalization).
+'''
+
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+MEASURES = ['ARI', 'NMI', 'VI']
+
+
+def contingencyTables(label_matrix):
+    '''
+    :param label_matrix: (m, n) array. Row = label vector of one model.
+    :return: (m, m, k, k) array of counts. [a, b, i, j] = number of players
+                with label i in row a and label j in row b.
+    '''
+    labels = np.stack([np.unique(row, return_inverse=True)[1].ravel()
+                       for row in np.asarray(label_matrix)])
+    m, n = labels.shape
+    k = int(labels.max()) + 1
+
+    # Index of every (row a, row b, label i, label j) combination.
+    pair = np.arange(m * m).reshape(m, m, 1) * k * k
+    codes = pair + labels[:, np.newaxis, :] * k + labels[np.newaxis, :, :]
+
+    return np.bincount(codes.ravel(), minlength=m * m * k * k) \
+        .reshape(m, m, k, k)
+
+
+def _entropy(counts, n):
+    p = counts / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -np.sum(np.where(p > 0, p * np.log(p), 0), axis=-1)
+
+
+def agreementFromTables(tables):
+    '''
+    :param tables: output of 'contingencyTables()'
+    :return: dict of measure -> (m, m) array.
+    '''
+    tables = tables.astype(np.float64)
+    n = tables[0, 0].sum()
+    rows = tables.sum(axis=3)
+    cols = tables.sum(axis=2)
+
+    # Adjusted Rand Index
+    def comb2(x):
+        return x * (x - 1) / 2
+    index = comb2(tables).sum(axis=(2, 3))
+    a = comb2(rows).sum(axis=2)
+    b = comb2(cols).sum(axis=2)
+    expected = a * b / comb2(n)
+    maximum = (a + b) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ari = np.where(maximum == expected, 1.0,
+                       (index - expected) / (maximum - expected))
+
+    # Mutual information based measures
+    h_a = _entropy(rows, n)
+    h_b = _entropy(cols, n)
+    p = tables / n
+    outer = rows[:, :, :, np.newaxis] * cols[:, :, np.newaxis, :] / (n * n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mi = np.sum(np.where(p > 0, p * np.log(p / outer), 0), axis=(2, 3))
+    mi = np.maximum(mi, 0)
+
+    mean_h = (h_a + h_b) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nmi = np.where(mean_h > 0, mi / mean_h, 1.0)
+
+    return {'ARI': ari,
+            'NMI': nmi,
+            'VI': h_a + h_b - 2 * mi}
+
+
+def agreementTensor(labels: dict, positions=None):
+    '''
+    :param labels: dict of model name -> cluster label array (same players,
+                    same order).
+    :param positions: (optional) players' 'Pos', added as model 'Pos'.
+    :return: (names, tensor) tensor shape (len(MEASURES), m, m)
+    '''
+    names = list(labels)
+    rows = [np.asarray(labels[name]) for name in names]
+    if positions is not None:
+        names.append('Pos')
+        rows.append(np.asarray(positions).astype(str))
+
+    rows = [np.unique(row, return_inverse=True)[1].ravel() for row in rows]
+    measures = agreementFromTables(contingencyTables(np.stack(rows)))
+
+    return names, np.stack([measures[name] for name in MEASURES])
+
+
+def pairRows(names: list, tensor) -> list:
+    '''
+    Long format rows (measure, 'modelA~modelB', value) of every model pair.
+    '''
+    rows = []
+    for a in range(len(names)):
+        for b in range(a + 1, len(names)):
+            for i, measure in enumerate(MEASURES):
+                rows.append((measure, "{}~{}".format(names[a], names[b]),
+                             round(float(tensor[i, a, b]), 3)))
+
+    return rows
+
+
+def reportAgreement(labels: dict, positions, YEARS: list):
+    '''
+    Agreement of every model pair in one decade. Outputs 1) a .npz file with
+    the (measure, model, model) tensor and 2) a .png heatmap per measure.
+    '''
+    names, tensor = agreementTensor(labels, positions)
+
+    os.makedirs("../model/ref", exist_ok=True)
+    np.savez("../model/ref/AGREEMENT_Season_Stats_{}-{}.npz".format(
+        YEARS[0], YEARS[1]),
+        names=np.array(names, dtype=str),
+        measures=np.array(MEASURES, dtype=str),
+        tensor=tensor.astype(np.float32))
+
+    fig, ax = plt.subplots(nrows=1, ncols=len(MEASURES),
+                           figsize=(5 * len(MEASURES), 4.5))
+    for i, measure in enumerate(MEASURES):
+        image = ax[i].imshow(tensor[i], cmap='viridis')
+        ax[i].set_title(measure)
+        ax[i].set_xticks(range(len(names)))
+        ax[i].set_xticklabels(names, rotation=45, ha='right')
+        ax[i].set_yticks(range(len(names)))
+        ax[i].set_yticklabels(names)
+        for a in range(len(names)):
+            for b in range(len(names)):
+                ax[i].text(b, a, "{:.2f}".format(tensor[i, a, b]),
+                           ha='center', va='center', color='w', fontsize=8)
+        fig.colorbar(image, ax=ax[i], fraction=0.046)
+
+    fig.suptitle("Model Agreement {}-{}".format(YEARS[0], YEARS[1]))
+    fig.tight_layout()
+    fig.savefig("../model/AGREEMENT_Season_Stats_{}-{}".format(YEARS[0],
+                                                               YEARS[1]))
+    plt.close(fig)
+
+    print("** Model Agreement {}-{}: COMPLETE".format(YEARS[0], YEARS[1]))
+
+    return names, tensor
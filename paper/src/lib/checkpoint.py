@@ -0,0 +1,129 @@
+'''
+File:   checkpoint.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/13/2022
+Description:
+    Support file to 'main.py'
+    Per-(model, decade) checkpoints of a multi-decade run. The metrics of a
+    job are written to disk (atomically) as soon as the job finishes, so a
+    run that dies in a later decade can be restarted and only runs the
+    jobs that are missing. The final MODEL_Metrics csv files are then
+    assembled from the checkpoints.
+
+    Checkpoints are kept in a directory per run configuration + dataset,
+    so a changed setting or dataset never resumes from stale results. The
+    directory is deleted once the run completes.
+
+    The cluster labels of a job (int16, decade row order) are kept next to
+    its metrics (<job>.npy), so a resumed run still has every model's labels
+    for the model agreement report.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from lib.resultsStore import configHash
+
+CHECKPOINT_DIR = "../model/checkpoint/"
+
+
+def dataFingerprint(df: pd.DataFrame) -> str:
+    '''
+    Hash of the content of the modeling dataset.
+    '''
+    h = hashlib.sha256()
+    h.update(",".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+
+    return h.hexdigest()
+
+
+def _jsonValue(value):
+    # NumPy scalars (ex: np.int64 cluster counts) as plain python numbers.
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("{} is not JSON serializable".format(
+        type(value).__name__))
+
+
+class Checkpoints:
+    # Constructor. Checkpoint directory of the run described by 'config'.
+    def __init__(self, config: dict, df_data: pd.DataFrame,
+                 DIRECTORY=CHECKPOINT_DIR):
+        key = configHash({'config': config,
+                          'data': dataFingerprint(df_data)})
+        self.directory = os.path.join(DIRECTORY, key[:16])
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, "{}.json".format(name))
+
+    def _read(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write(self, name, payload):
+        # Write + fsync a temporary file, then rename it over the checkpoint
+        # so a crash never leaves a partial checkpoint behind.
+        tmp_path = self._path(name) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f, default=_jsonValue)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(name))
+
+    def runId(self, startRun):
+        '''
+        Id of the run being resumed, or a new one from startRun().
+        '''
+        state = self._read("run")
+        if state is None:
+            state = {'run_id': startRun()}
+            self._write("run", state)
+
+        return state['run_id']
+
+    ##################################################################
+    # @input MODEL_NAME  Model name (ex: 'kMeans')
+    # @input YEARS       [firstYear, lastYear] of the decade.
+    # @output list       metrics of the finished job or None.
+    def load(self, MODEL_NAME, YEARS):
+        return self._read("{}_{}-{}".format(MODEL_NAME, YEARS[0], YEARS[1]))
+
+    ##################################################################
+    # @input LABELS      cluster label of every player of the decade (in
+    #                    decade row order), written before the metrics.
+    def save(self, MODEL_NAME, YEARS, metrics: list, LABELS=None):
+        name = "{}_{}-{}".format(MODEL_NAME, YEARS[0], YEARS[1])
+        if LABELS is not None:
+            path = os.path.join(self.directory, name + ".npy")
+            with open(path + ".tmp", 'wb') as f:
+                np.save(f, np.asarray(LABELS, dtype=np.int16))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+
+        self._write(name, list(metrics))
+
+    def labels(self, MODEL_NAME, YEARS):
+        '''
+        :return: Cluster labels saved with the job or None.
+        '''
+        path = os.path.join(self.directory, "{}_{}-{}.npy".format(
+            MODEL_NAME, YEARS[0], YEARS[1]))
+        try:
+            return np.load(path, allow_pickle=False)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,162 @@
+'''
+File:   distanceCache.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/11/2022
+Description:
+    Support file to 'main.py'
+    Per-decade cache of condensed pairwise (euclidean) distance matrices.
+    A matrix is computed once per distinct feature matrix, stored as a
+    float32 memmap and then shared by:
+        - the ward linkage of the hierarchy model
+        - the cophenetic correlation check
+        - the exact Silhouette Coefficient of every model
+
+    Matrices with more than MAX_ELEMENTS pairs are not cached; consumers
+    then fall back to blocked recomputation from the feature matrix.
+    'clear()' deletes the cached matrices (called after every decade).
+'''
+
+import atexit
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from sklearn.metrics import silhouette_score
+
+import lib.fitCache as fitCache
+
+MAX_ELEMENTS = 100_000_000      # ~400 MB of float32
+BLOCK_ROWS = 1024
+SHM_DIR = "/dev/shm"
+
+# feature matrix key -> condensed distance memmap
+_MATRICES = {}
+_DIRECTORY = None
+
+
+def _directory():
+    global _DIRECTORY
+    if _DIRECTORY is None:
+        _DIRECTORY = tempfile.mkdtemp(
+            prefix="nba_pdist_", dir=SHM_DIR if os.path.isdir(SHM_DIR)
+            else None)
+        atexit.register(clear)
+
+    return _DIRECTORY
+
+
+def condensed(x):
+    '''
+    :param x: Feature matrix (rows = players).
+    :return: Condensed distance matrix (scipy 'pdist' layout, float32) or
+                None if the matrix is larger than MAX_ELEMENTS.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[0]
+    if n * (n - 1) // 2 > MAX_ELEMENTS:
+        return None
+
+    key = fitCache.fitKey(x, "pdist", {})
+    if key not in _MATRICES:
+        path = os.path.join(_directory(), "{}.f32".format(key))
+        d = np.memmap(path, dtype=np.float32, mode='w+',
+                      shape=(n * (n - 1) // 2,))
+        _fill(d, x)
+        d.flush()
+        _MATRICES[key] = d
+
+    return _MATRICES[key]
+
+
+def _fill(d, x):
+    '''
+    Write the condensed distances of x into d, BLOCK_ROWS rows at a time, so
+    only one (BLOCK_ROWS, n) float64 block exists besides the memmap.
+    '''
+    n = x.shape[0]
+    for start in range(0, n - 1, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n - 1)
+        # Rows start..stop-1 against columns start+1..n-1; condensed row i
+        # holds the pairs (i, i+1..n-1) from offset n*i - i*(i+1)/2.
+        D = cdist(x[start:stop], x[start + 1:])
+        upper = np.arange(D.shape[1])[np.newaxis, :] >= \
+            np.arange(stop - start)[:, np.newaxis]
+        first = n * start - start * (start + 1) // 2
+        last = n * stop - stop * (stop + 1) // 2
+        d[first:last] = D[upper]
+
+
+def clear():
+    global _DIRECTORY
+    _MATRICES.clear()
+    if _DIRECTORY is not None:
+        shutil.rmtree(_DIRECTORY, ignore_errors=True)
+        _DIRECTORY = None
+
+
+def rowsFromCondensed(d, rows, n):
+    '''
+    Expand rows of the square distance matrix from its condensed form.
+    :return: (len(rows), n) float64 array.
+    '''
+    i = np.asarray(rows, dtype=np.int64)[:, np.newaxis]
+    j = np.arange(n, dtype=np.int64)[np.newaxis, :]
+    lo = np.minimum(i, j)
+    hi = np.maximum(i, j)
+
+    index = n * lo - lo * (lo + 1) // 2 + (hi - lo - 1)
+    index[i == j] = 0
+
+    D = np.asarray(d[index], dtype=np.float64)
+    D[np.broadcast_to(i == j, D.shape)] = 0
+
+    return D
+
+
+def silhouetteFromCondensed(d, labels) -> float:
+    '''
+    Exact mean Silhouette Coefficient (same definition as sklearn) computed
+    from a condensed distance matrix, BLOCK_ROWS rows at a time.
+    '''
+    _, labels = np.unique(labels, return_inverse=True)
+    n = len(labels)
+    counts = np.bincount(labels)
+    one_hot = np.zeros((n, len(counts)))
+    one_hot[np.arange(n), labels] = 1
+
+    s = np.empty(n)
+    for start in range(0, n, BLOCK_ROWS):
+        rows = np.arange(start, min(start + BLOCK_ROWS, n))
+        own = labels[rows]
+
+        # Sum of distances from every row to every cluster.
+        sums = rowsFromCondensed(d, rows, n) @ one_hot
+
+        a = sums[np.arange(len(rows)), own] / np.maximum(counts[own] - 1, 1)
+        mean_other = sums / counts
+        mean_other[np.arange(len(rows)), own] = np.inf
+        b = mean_other.min(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s[rows] = np.nan_to_num((b - a) / np.maximum(a, b))
+        # Players alone in their cluster score 0.
+        s[rows[counts[own] == 1]] = 0
+
+    return float(np.mean(s))
+
+
+def silhouette(x, labels) -> float:
+    '''
+    Silhouette Coefficient of 'labels' on the feature matrix x. Uses the
+    cached distances when the matrix is small enough, otherwise sklearn's
+    blocked recomputation.
+    '''
+    d = condensed(x)
+    if d is None:
+        return silhouette_score(np.asarray(x, dtype=np.float64), labels,
+                                metric='euclidean')
+
+    return silhouetteFromCondensed(d, labels)
@@ -0,0 +1,137 @@
+'''
+File:   fitCache.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/03/2022
+Description:
+    Support file to 'main.py'
+    Content-addressed memoization of model fits. A fit is identified by a
+    hash of the feature matrix it was trained on plus the model name and
+    its hyperparameters, so a rerun that only changes a plot or a metric
+    reuses every fit instead of re-clustering from scratch.
+
+    Fits are stored as compressed NumPy archives (.npz) in CACHE_DIR. The
+    directory is bounded to MAX_BYTES; when it grows past the bound the
+    least recently used entries are deleted first (a cache hit refreshes an
+    entry's modification time).
+'''
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+CACHE_DIR = "../model/cache/"
+MAX_BYTES = 512 * 1024 * 1024
+ENABLED = True
+
+
+def configure(path=None, max_mb=None, enabled=None):
+    global CACHE_DIR, MAX_BYTES, ENABLED
+
+    if path is not None:
+        CACHE_DIR = path
+    if max_mb is not None:
+        MAX_BYTES = int(max_mb * 1024 * 1024)
+    if enabled is not None:
+        ENABLED = enabled
+
+
+def fitKey(x, MODEL_NAME, params: dict) -> str:
+    '''
+    :param x: Feature matrix the model is trained on.
+    :param MODEL_NAME: Name of the model (ex: 'Hierarchy', 'kMeans')
+    :param params: Dictionary of every hyperparameter that changes the fit.
+    :return: hex digest identifying the fit.
+    '''
+    x = np.ascontiguousarray(x)
+
+    h = hashlib.sha256()
+    h.update(MODEL_NAME.encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    h.update(str(x.dtype).encode())
+    h.update(str(x.shape).encode())
+    h.update(x.tobytes())
+
+    return h.hexdigest()
+
+
+def _path(key):
+    return os.path.join(CACHE_DIR, "{}.npz".format(key))
+
+
+def load(key):
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path, allow_pickle=False) as archive:
+        fit = {name: archive[name][()] if archive[name].ndim == 0
+               else archive[name] for name in archive.files}
+
+    # Mark the entry as recently used for LRU eviction.
+    os.utime(path)
+
+    return fit
+
+
+def save(key, fit: dict):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Write to a temporary file first so an interrupted run never leaves a
+    # partial entry behind.
+    tmp_path = _path(key) + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **{name: np.asarray(value)
+                                  for name, value in fit.items()})
+    os.replace(tmp_path, _path(key))
+
+    evict()
+
+
+def evict():
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".npz"):
+            try:
+                stat = os.stat(os.path.join(CACHE_DIR, name))
+            except FileNotFoundError:
+                # Removed by a concurrent eviction.
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+
+    # Oldest (least recently used) entries first.
+    for _, size, name in sorted(entries):
+        if total <= MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except FileNotFoundError:
+            pass
+        total = total - size
+
+
+def cachedFit(x, MODEL_NAME, params: dict, fitFunction) -> dict:
+    '''
+    Return the cached fit for (x, MODEL_NAME, params) or run fitFunction()
+    and cache its result.
+
+    :param fitFunction: Function without arguments that returns a
+                        dictionary of NumPy arrays / scalars.
+    '''
+    if not ENABLED:
+        return fitFunction()
+
+    key = fitKey(x, MODEL_NAME, params)
+    fit = load(key)
+    if fit is not None:
+        print("** Fit Cache: HIT {} ({})".format(MODEL_NAME, key[:12]))
+        return fit
+
+    fit = fitFunction()
+    save(key, fit)
+
+    return fit
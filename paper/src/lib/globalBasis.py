@@ -0,0 +1,123 @@
+'''
+File:   globalBasis.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/09/2022
+Description:
+    Support file to 'modelCommon.py'
+    Optional 'global basis' mode. The MinMax scaler and the PCA basis are
+    fit ONCE on the players of a fit range of years (ex: 1971-2020) and
+    every decade is only projected into that basis (a matrix multiply).
+    Cluster geometry is then comparable across decades and no decade needs
+    its own decomposition.
+
+    The fitted basis is saved to a .npz file together with the hash of its
+    fitting config (feature columns, fit range YEARS, REQ_GAMES, REQ_MIN,
+    DATA_PATH). Later runs reuse it as long as that config is the same, even
+    when new seasons were added to the table: rows outside the fit range
+    are simply scaled and projected ('scale()' / 'project()'). A changed
+    config, or REFIT, fits a new basis.
+
+    Two PCA bases are kept, matching the two preprocessing paths of the
+    models:
+        'normalized' - MinMax scale -> row normalize -> PCA
+                        (hierarchy, SOM, kMeans, GMM)
+        'scaled'     - MinMax scale -> PCA (pca.runPCA)
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+import lib.pcaService as pcaService
+from lib.resultsStore import configHash
+
+# Basis used by 'modelCommon' while the mode is active (None = per decade).
+ACTIVE = None
+
+
+def scale(basis: dict, x):
+    return (x - basis['data_min']) * basis['scale']
+
+
+def fitBasis(df_features: pd.DataFrame) -> dict:
+    '''
+    :param df_features: Model features of the players of the fit range.
+    '''
+    x = df_features.to_numpy(dtype=np.float64)
+
+    data_min = x.min(axis=0)
+    data_range = x.max(axis=0) - data_min
+    # Same handling of constant features as sklearn's MinMaxScaler.
+    data_range[data_range == 0] = 1
+
+    basis = {'columns': np.array(df_features.columns, dtype=str),
+             'data_min': data_min,
+             'scale': 1 / data_range}
+
+    x_scaled = scale(basis, x)
+    for name, x_fit in [('normalized', normalize(x_scaled)),
+                        ('scaled', x_scaled)]:
+        pca = pcaService.decompose(x_fit)
+        basis[name + '_mean'] = pca['mean']
+        basis[name + '_components'] = pca['components']
+        basis[name + '_ratio'] = pca['explained_variance_ratio']
+
+    return basis
+
+
+def loadOrFit(df_features: pd.DataFrame, PATH, CONFIG: dict,
+              REFIT=False) -> dict:
+    '''
+    Load the basis saved at PATH, or fit and save a new one if there is no
+    saved basis for this fitting config.
+    :param df_features: Model features of the players of the fit range.
+    :param CONFIG: Fitting config (fit range YEARS, REQ_GAMES, REQ_MIN,
+                    DATA_PATH). Together with the feature columns it
+                    identifies the basis.
+    :param REFIT: Fit a new basis even if the config did not change.
+    '''
+    config = configHash({'columns': list(map(str, df_features.columns)),
+                         **CONFIG})
+
+    if os.path.exists(PATH) and not REFIT:
+        with np.load(PATH, allow_pickle=False) as archive:
+            basis = {name: archive[name] for name in archive.files}
+        if 'config' in basis and str(basis['config']) == config:
+            print("** Global Basis: LOADED {}".format(PATH))
+            return basis
+        print("** Global Basis: fitting config changed, refitting")
+
+    basis = fitBasis(df_features)
+    basis['config'] = np.array(config)
+
+    os.makedirs(os.path.dirname(PATH) or '.', exist_ok=True)
+    with open(PATH + ".tmp", 'wb') as f:
+        np.savez(f, **basis)
+    os.replace(PATH + ".tmp", PATH)
+    print("** Global Basis: FIT and saved to {}".format(PATH))
+
+    return basis
+
+
+def activate(basis):
+    global ACTIVE
+    ACTIVE = basis
+
+
+def explainedVarianceRatio(basis: dict, ROW_NORMALIZED=True):
+    name = 'normalized' if ROW_NORMALIZED else 'scaled'
+    return basis[name + '_ratio']
+
+
+def project(basis: dict, x, VARIANCE, ROW_NORMALIZED=True):
+    '''
+    Project already scaled (and row normalized) data onto the components of
+    the basis that explain VARIANCE of the full table.
+    '''
+    name = 'normalized' if ROW_NORMALIZED else 'scaled'
+    k = pcaService.componentsForRatio(basis[name + '_ratio'], VARIANCE)
+
+    return (x - basis[name + '_mean']) @ basis[name + '_components'][:k].T
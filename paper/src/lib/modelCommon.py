@@ -13,32 +13,47 @@ Description:
 import matplotlib.pyplot as plt
 import pandas as pd
 from sklearn.preprocessing import StandardScaler, normalize
-from sklearn.decomposition import PCA
 import numpy as np
 
 from sklearn.metrics import calinski_harabasz_score as C_H_score
-from sklearn.metrics import silhouette_score as S_score
 from sklearn.metrics import davies_bouldin_score as D_B_score
 from sklearn.preprocessing import MinMaxScaler
 
+import lib.pcaService as pcaService
+import lib.globalBasis as globalBasis
+import lib.distanceCache as distanceCache
+
+
+def scaleData(np_array):
+    # Global basis mode: scale with the min/max of the full table.
+    if globalBasis.ACTIVE is not None:
+        return globalBasis.scale(globalBasis.ACTIVE,
+                                 np.asarray(np_array, dtype=np.float64))
 
-def normalizeData(np_array):
     scaler = MinMaxScaler()
-    x_scaled = scaler.fit_transform(np_array.tolist())
+    return scaler.fit_transform(np_array.tolist())
+
+
+def normalizeData(np_array):
+    x_scaled = scaleData(np_array)
 
     x_normalized = normalize(x_scaled)
 
     return x_normalized
 
 
-def createElbowPlots(numFeatures: int, X, YEARS: list):
+def createElbowPlots(numFeatures: int, X, YEARS: list, ROW_NORMALIZED=True):
     print("**** Generate an Elbow Plot showing the data reduction curve.")
-    pca = PCA(n_components=numFeatures)
-    pca.fit(X)
+    if globalBasis.ACTIVE is not None:
+        ratio = globalBasis.explainedVarianceRatio(globalBasis.ACTIVE,
+                                                   ROW_NORMALIZED)
+    else:
+        ratio = pcaService.explainedVarianceRatio(X)
+    ratio = ratio[:numFeatures]
 
     # Display the Elbow Plot explaining the optimal # of PCA components
     plt.figure()
-    plt.plot(np.cumsum(pca.explained_variance_ratio_))
+    plt.plot(np.cumsum(ratio))
     plt.xlabel('Number of PCA Components')
     plt.ylabel('Explained Variance (%)')
     plt.savefig('../model/ref/Elbow_Plot_PCA-{}-{}.png'.format(YEARS[0],
@@ -46,26 +61,98 @@ def createElbowPlots(numFeatures: int, X, YEARS: list):
                                                        dpi=100))
 
 
-def pcaTransform(df: pd.DataFrame, VARIANCE: int) -> pd.DataFrame:
+def pcaTransform(df: pd.DataFrame, VARIANCE: int,
+                 ROW_NORMALIZED=True) -> pd.DataFrame:
     print("*** Apply PCA: Data Reduction")
     X = df
 
+    # Global basis mode: project onto the basis of the full table.
+    if globalBasis.ACTIVE is not None:
+        return globalBasis.project(globalBasis.ACTIVE, X, VARIANCE,
+                                   ROW_NORMALIZED)
+
     # Perform PCA on transformed dataset by using components with a
-    # percentage of the explained dataset variance.
-    pca = PCA(n_components=VARIANCE)
-    pca.fit(X)
+    # percentage of the explained dataset variance. The decomposition is
+    # shared with the elbow plots and every other model using this data.
+    pca = pcaService.decompose(X)
+    k = pcaService.componentsForRatio(pca['explained_variance_ratio'],
+                                      VARIANCE)
+    ratio = pca['explained_variance_ratio'][:k]
     print(
         "explained variance ratio by Components: {:.2f}%"
             "\n\tComponent (0-100%): {}".format(
-            sum(pca.explained_variance_ratio_*100),
-            pca.explained_variance_ratio_*100)
+            sum(ratio*100),
+            ratio*100)
     )
 
-    X_transform = pca.transform(X)
+    X_transform = pcaService.project(pca, X, VARIANCE)
     return X_transform
 
 
-def calcPositionConc(df: pd.DataFrame, MODEL_NAME, YEARS: list, THREE_POS_FLAG):
+def positionColumns(THREE_POS_FLAG) -> list:
+    # 'pos' columns for PIE chart in a specific order.
+    if THREE_POS_FLAG:
+        return ['G', 'F', 'C']
+
+    return ['PG', 'SG', 'SF', 'PF', 'C']
+
+
+def positionConcentration(labels, positions, THREE_POS_FLAG,
+                          NUM_CLUSTERS=None) -> pd.DataFrame:
+    '''
+    Fraction (0-1) of each position in each cluster, counted for all
+    clusters at once.
+    :param labels: Cluster label of every player (0 to x, -1 = noise).
+    :param positions: 'Pos' of every player.
+    :return: DataFrame with one row per cluster: 'Total' + one column per
+                position. Noise players (density based models) are reported
+                in an extra row with index -1.
+    '''
+    col = positionColumns(THREE_POS_FLAG)
+    labels = np.asarray(labels, dtype=np.int64)
+    positions = np.asarray(positions).astype(str)
+
+    if NUM_CLUSTERS is None:
+        NUM_CLUSTERS = len(col)
+
+    # Noise is counted as one more 'cluster' after the real ones.
+    noise = labels < 0
+    labels = np.where(noise, NUM_CLUSTERS, labels)
+    numRows = NUM_CLUSTERS + 1
+
+    total = np.bincount(labels, minlength=numRows)[:numRows]
+    counts = np.stack([np.bincount(labels[positions == pos],
+                                   minlength=numRows)[:numRows]
+                       for pos in col], axis=1)
+
+    df_conc = pd.DataFrame(np.round(counts / np.maximum(total, 1)[:, None],
+                                    3),
+                           columns=col)
+    df_conc.insert(0, 'Total', total)
+    df_conc.index = list(range(NUM_CLUSTERS)) + [-1]
+
+    if not noise.any():
+        df_conc = df_conc.drop(index=-1)
+
+    return df_conc
+
+
+def concentrationEntropy(df_conc: pd.DataFrame) -> float:
+    '''
+    Average Shannon entropy of the position mix of the clusters. Higher
+    values = clusters mix more positions ('positionless').
+    '''
+    import scipy.stats as sci
+
+    conc = df_conc.drop(index=-1, columns='Total', errors='ignore') \
+        .to_numpy(dtype=np.float64)
+    conc = conc[conc.sum(axis=1) > 0]
+
+    return round(float(np.mean(sci.entropy(conc, axis=1))), 3)
+
+
+def calcPositionConc(df: pd.DataFrame, MODEL_NAME, YEARS: list, THREE_POS_FLAG,
+                     NUM_CLUSTERS=None):
     # TODO - Consider making the PIE charts 3 positions no matter what to
     #  simplify interpretation.
     ####################################
@@ -76,47 +163,45 @@ def calcPositionConc(df: pd.DataFrame, MODEL_NAME, YEARS: list, THREE_POS_FLAG):
     #   artifact 1).
     #
     # Requirements:
-    #   Clusters must be labeled as 0 to x
-    #   Function assumes that the player's are clustered based on 5 positions.
+    #   Clusters must be labeled as 0 to x. Noise players (label -1) get
+    #   their own chart.
+    #   Function assumes that the player's are clustered based on 5 positions
+    #   unless NUM_CLUSTERS is given (ex: a mixture model selected by BIC).
 
     # TODO - Hardcode the order of the 'pos' fields from smallest -> largest.
     #  When INCLUDE_POS_FLAG=FALSE, avoid having the order on the pie chart
     #  be random.
     col = ['Total']
+    col.extend(positionColumns(THREE_POS_FLAG))
 
-    # Add 'pos' columns for PIE chart in a specific order.
-    if THREE_POS_FLAG:
-        col.extend(['G', 'F', 'C'])
-    else:
-        col.extend(['PG', 'SG', 'SF', 'PF', 'C'])
+    if NUM_CLUSTERS is None:
+        NUM_CLUSTERS = len(col[1:])
 
-    df_conc = pd.DataFrame(columns=col)
+    df_conc = positionConcentration(df['Cluster'], df['Pos'], THREE_POS_FLAG,
+                                    NUM_CLUSTERS)
 
     # i = cluster # (1-5)
     # j = specific position
-    fig, ax = plt.subplots(nrows=1, ncols=len(df['Pos'].unique()), squeeze=True)
-    for i in range(0, len(col[1:])):
+    fig, ax = plt.subplots(nrows=1, ncols=len(df_conc), squeeze=False)
+    ax = ax[0]
+    for i in range(0, len(df_conc)):
         plotOffset = i + 1
-        df_x = df[df['Cluster'] == i]
-        count = [len(df_x)]
-
-        for j in col[1:]:
-            count.append(round(len(df_x[(df_x['Pos'] == j)])/count[0], 3))
+        count = df_conc.iloc[i].tolist()
 
         # Publish Pie chart of concentrations
         # TIP - Use the hyperparameter 'autopct='%.1f'' to print values.
         # TODO - Do better styling https://www.pythoncharts.com/matplotlib/pie-chart-matplotlib/
-        ax[plotOffset-1].set_title("Cluster {}".format(i))
+        if df_conc.index[i] < 0:
+            ax[plotOffset-1].set_title("Noise")
+        else:
+            ax[plotOffset-1].set_title("Cluster {}".format(i))
+        if count[0] == 0:
+            continue
         if i == 1:
             ax[plotOffset-1].pie(count[1:], labels=col[1:], normalize=True)
         else:
             ax[plotOffset-1].pie(count[1:], normalize=True)
 
-        # Save the concentrations to publish a .csv
-        df_conc = df_conc.append(
-                        pd.Series(count, index=df_conc.columns),
-                        ignore_index=True)
-
     # Publish the resulting concentrations
     df_conc.to_csv("../model/ref/CONC_{}_Season_Stats_{}-{}.csv".format(
         MODEL_NAME,
@@ -135,13 +220,15 @@ def calcPositionConc(df: pd.DataFrame, MODEL_NAME, YEARS: list, THREE_POS_FLAG):
 
     print("** Model {} Position Extraction: COMPLETE".format(MODEL_NAME))
 
+    return df_conc
+
 
 #========================================
 
 def calcSilhouetteCoefficient(df_data: pd.DataFrame, df_labels: pd.DataFrame):
-    score = S_score(df_data.to_numpy().tolist(),
-                    df_labels.to_numpy().tolist(),
-                    metric='euclidean')
+    # Pairwise distances are shared by every model scored on this data.
+    score = distanceCache.silhouette(df_data.to_numpy(dtype=np.float64),
+                                     df_labels.to_numpy())
 
     return round(score, 3)
 
@@ -159,6 +246,26 @@ def calcDaviesBouldinIndex(df_data: pd.DataFrame, df_labels: pd.DataFrame):
 
     return round(score, 3)
 
+def scoringFeatures(df: pd.DataFrame, INCLUDE_POS) -> pd.DataFrame:
+    '''
+    Features the cluster tightness scores are calculated on.
+    '''
+    # Drop features that were not used in modeling
+    REMOVE_FEATURES = ['ID', 'Player', 'Tm', 'Pos', 'Teams']
+    if not INCLUDE_POS:
+        if len(df[df['Pos'] == 'G']) > 0:
+            REMOVE_FEATURES.extend(["Pos_G", "Pos_F", "Pos_C"])
+        else:
+            REMOVE_FEATURES.extend(["Pos_PG", 'Pos_SG',
+                                    "Pos_SF", "Pos_PF",
+                                    "Pos_C"])
+    # Cluster labels of every model (ex: 'Cluster', 'Cluster5')
+    REMOVE_FEATURES.extend([col for col in df.columns
+                            if col.startswith('Cluster')])
+
+    return df.drop(columns=REMOVE_FEATURES)
+
+
 def reportClusterScores(df: pd.DataFrame, YEARS: list, INCLUDE_POS):
     '''
     Various calculations of cluster tightness to judge how well the
@@ -181,19 +288,14 @@ def reportClusterScores(df: pd.DataFrame, YEARS: list, INCLUDE_POS):
                 in modeling
     '''
 
-    # Drop features that were not used in modeling
-    REMOVE_FEATURES = ['ID', 'Player', 'Tm', 'Pos']
-    if not INCLUDE_POS:
-        if len(df[df['Pos'] == 'G']) > 0:
-            REMOVE_FEATURES.extend(["Pos_G", "Pos_F", "Pos_C"])
-        else:
-            REMOVE_FEATURES.extend(["Pos_PG", 'Pos_SG',
-                                    "Pos_SF", "Pos_PF",
-                                    "Pos_C"])
-    REMOVE_FEATURES.extend(['Cluster'])
+    # Noise players (label -1) do not belong to a cluster.
+    df = df[df['Cluster'] >= 0]
+    if len(df['Cluster'].unique()) < 2:
+        print("** Cluster scores need at least 2 clusters")
+        return ["{}-{}".format(YEARS[0], YEARS[1]),
+                np.nan, np.nan, np.nan]
 
-    # Divide the existing dataset into FEATURES and LABELS for scoring.
-    df_data = df.drop(columns=REMOVE_FEATURES)
+    df_data = scoringFeatures(df, INCLUDE_POS)
     df_labels = df['Cluster']
 
     tightness1 = calcCalinskiHarabaszScore(df_data, df_labels)
@@ -225,31 +327,64 @@ def combinePlayers():
                                 information. Height/Weight are extracted by
                                 year. Each sheet in the .xlsx file is a
                                 different year.
+    All year sheets are read at once (see 'lib/playerIngest.py'). A player's
+    most recent Height/Weight fills in players missing from, or without
+    measurements in, Players.csv.
     '''
+    from lib.playerIngest import loadWorkbook
 
     PATH1 = "../data/input/Players.csv"
     PATH2 = "../data/input/Players_PENDING.xlsx"
 
-    YEARS = ['2018', '2019', '2020', '2021', '2022']
-    year = YEARS[0]
-
-
     df_p1 = pd.read_csv(PATH1)
 
-    names = ['name', 'Height', 'Weight']
-    df_p2 = pd.read_excel(PATH2, sheet_name=year, usecols='B,D:E')
+    df_p2 = loadWorkbook(PATH2)
+    df_p2 = df_p2.sort_values('Year').drop_duplicates('Name', keep='last')
     df_p2 = df_p2.rename(columns={'Name': 'Player',
                                   'Height': 'height',
                                   'Weight': 'weight'})
+    df_p2 = df_p2[['Player', 'height', 'weight']].set_index('Player')
+
+    # 1) Fill missing measurements of already known players.
+    df_p1 = df_p1.set_index('Player')
+    df_match = df_p2.reindex(df_p1.index)
+    for col in ['height', 'weight']:
+        df_p1[col] = np.where(df_p1[col].isnull(),
+                              df_match[col], df_p1[col])
 
-    df_p1 = df_p1.join(df_p2.set_index('Player'), on='Player')
+    # 2) Add players that started playing after Players.csv was published.
+    df_new = df_p2[~df_p2.index.isin(df_p1.index)]
+    df_p1 = pd.concat([df_p1, df_new]).reset_index()
 
     df_p1.to_csv('../data/input/Players_1950_2022.csv')
 
 
-def calcEntropy():
+def recordModelResults(store, RUN_ID, MODEL_NAME, YEARS: list,
+                       COLUMNS: list, metrics: list, df: pd.DataFrame,
+                       THREE_POS_FLAG):
+    '''
+    Write the metrics, position concentrations and labels of one finished
+    (model, decade) job to the results store ('lib/resultsStore.py').
+    :param COLUMNS: Names of the values in 'metrics' (ex: ['Years', 'CHS'])
+    :param df: Decade dataframe including the model's 'Cluster' labels.
+    '''
+    labels = df['Cluster'].to_numpy()
+    df_conc = positionConcentration(labels, df['Pos'], THREE_POS_FLAG,
+                                    max(int(labels.max()) + 1, 1))
+
+    store.recordJob(RUN_ID, MODEL_NAME, YEARS,
+                    {name: value for name, value in zip(COLUMNS, metrics)
+                     if name != 'Years'},
+                    df_conc, df['ID'].to_numpy(), labels)
+
 
+def calcEntropy(RESULTS_PATH="../data/output/Results.sqlite", RUN_ID=None):
+    '''
+    Average (and range of) position entropy of the clusters of each model
+    and decade of a run in the results store (default = latest run).
+    '''
     import scipy.stats as sci
+    from lib.resultsStore import ResultsStore
 
     modelList = ['Hierarchy', 'kMeans', 'SOM']
     YEAR_PAIRS = [[1971, 1980],
@@ -261,29 +396,26 @@ def calcEntropy():
     #writer = pd.ExcelWriter('Entropy2.xlsx', engine='xlsxwriter')
     df_Entropy = pd.DataFrame(columns=modelList)
 
-    for model in modelList:
-        for YEARS in YEAR_PAIRS:
-            df = pd.read_csv("CONC_{}_Season_Stats_{}-{}.csv".format(model,
-                                                                     YEARS[0],
-                                                                     YEARS[1]),
-                             index_col=0)
-            df = df.drop(columns='Total')
+    with ResultsStore(RESULTS_PATH) as store:
+        if RUN_ID is None:
+            RUN_ID = store.latestRun()
 
+        for model in modelList:
+            for YEARS in YEAR_PAIRS:
+                df = store.concentrations(RUN_ID, model, YEARS)
+                df = df.drop(columns='Total')
 
-            # loop through all clusters. Get average entropy of the clusters
-            entropyAvg = []
-            for row in range(len(df)):
-                array = df.iloc[row, :5].to_numpy()
+                # Entropy of every cluster. Get average entropy of the
+                # clusters
+                entropyAvg = sci.entropy(df.to_numpy(dtype=np.float64),
+                                         axis=1)
 
-                entropyAvg.append(sci.entropy(array))
-
-            #df_Entropy.loc[YEARS[1], model] = sum(entropyAvg)/len(entropyAvg)
-            df_Entropy.loc["{}s".format(YEARS[0]-1), model] = \
-                round(sum(entropyAvg) / len(entropyAvg), 3)
-            df_Entropy.loc["{}s".format(YEARS[0] - 1),
-                           "{}-Range".format(model)] =  \
-                round(max(entropyAvg) - min(entropyAvg), 3)
+                #df_Entropy.loc[YEARS[1], model] = sum(entropyAvg)/len(entropyAvg)
+                df_Entropy.loc["{}s".format(YEARS[0]-1), model] = \
+                    round(float(np.mean(entropyAvg)), 3)
+                df_Entropy.loc["{}s".format(YEARS[0] - 1),
+                               "{}-Range".format(model)] =  \
+                    round(float(np.ptp(entropyAvg)), 3)
 
 
     df_Entropy.to_excel('Entropy-ClusterAvgs.xlsx')
-
@@ -0,0 +1,106 @@
+'''
+File:   neighborIndex.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/15/2022
+Description:
+    Support file to 'dbscan.py' and 'hierarchyClustering.py'
+    Per-decade nearest neighbor index. A KD-tree (or a ball-tree for wide
+    feature matrices) is built once per distinct feature matrix and shared
+    by every neighbor question asked about it:
+        - k nearest neighbors / k-distance (DBSCAN eps estimate)
+        - radius neighbor graph (DBSCAN)
+        - k nearest neighbor connectivity graph (connectivity-constrained
+          ward in the hierarchy model)
+    Tree queries keep these sub-quadratic in the number of players.
+    'clear()' drops the indexes (called after every decade).
+'''
+
+import numpy as np
+from scipy import sparse
+from sklearn.neighbors import BallTree, KDTree
+
+import lib.fitCache as fitCache
+
+# KD-trees lose their advantage in high dimensions.
+MAX_KD_DIMENSIONS = 20
+LEAF_SIZE = 40
+
+# feature matrix key -> tree, (key, k) -> (distances, indices)
+_INDEXES = {}
+_NEIGHBORS = {}
+
+
+def _key(x):
+    return fitCache.fitKey(x, "neighbors", {})
+
+
+def index(x):
+    '''
+    :param x: Feature matrix (rows = players).
+    :return: KDTree / BallTree of x (built once).
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    key = _key(x)
+    if key not in _INDEXES:
+        tree = KDTree if x.shape[1] <= MAX_KD_DIMENSIONS else BallTree
+        _INDEXES[key] = tree(x, leaf_size=LEAF_SIZE)
+
+    return _INDEXES[key]
+
+
+def kNeighbors(x, k: int):
+    '''
+    :return: (distances, indices) of the k nearest neighbors of every
+                player, NOT counting the player itself. Shape (n, k).
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    key = (_key(x), k)
+    if key not in _NEIGHBORS:
+        distances, indices = index(x).query(x, k=k + 1)
+        _NEIGHBORS[key] = (distances[:, 1:], indices[:, 1:])
+
+    return _NEIGHBORS[key]
+
+
+def kDistance(x, k: int):
+    '''
+    Distance of every player to its k-th nearest neighbor.
+    '''
+    return kNeighbors(x, k)[0][:, -1]
+
+
+def radiusGraph(x, RADIUS):
+    '''
+    :return: sparse (n, n) matrix of the distances between all players
+                closer than RADIUS (sklearn 'precomputed' neighbor graph).
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    indices, distances = index(x).query_radius(x, r=RADIUS,
+                                               return_distance=True)
+
+    counts = np.array([len(row) for row in indices])
+    rows = np.repeat(np.arange(len(x)), counts)
+
+    return sparse.csr_matrix((np.concatenate(distances),
+                              (rows, np.concatenate(indices))),
+                             shape=(len(x), len(x)))
+
+
+def connectivity(x, k: int):
+    '''
+    :return: symmetric sparse k nearest neighbor graph (1 = connected).
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    _, indices = kNeighbors(x, k)
+
+    rows = np.repeat(np.arange(len(x)), k)
+    graph = sparse.csr_matrix((np.ones(len(rows)), (rows, indices.ravel())),
+                              shape=(len(x), len(x)))
+
+    return ((graph + graph.T) > 0).astype(np.float64)
+
+
+def clear():
+    _INDEXES.clear()
+    _NEIGHBORS.clear()
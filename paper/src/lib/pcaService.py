@@ -0,0 +1,143 @@
+'''
+File:   pcaService.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/08/2022
+Description:
+    Support file to 'modelCommon.py'
+    One SVD per feature matrix, shared by every PCA question asked about it:
+    elbow plot curves, the number of components for any explained variance
+    threshold, and projections onto those components.
+
+    A decomposition is computed once per (decade, feature set), kept in
+    memory (the MAX_MEMORY most recently used ones; 'clear()' after every
+    decade) and stored in the fit cache ('lib/fitCache.py') for later runs.
+    Sweeping VARIANCE_THRESHOLD therefore costs a single decomposition.
+
+    Matrices with more than MAX_DENSE_ELEMENTS entries use a randomized SVD
+    limited to MAX_RANDOMIZED_COMPONENTS components instead of a dense one.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy import linalg
+from sklearn.utils.extmath import randomized_svd, svd_flip
+
+import lib.fitCache as fitCache
+
+MAX_DENSE_ELEMENTS = 50_000_000
+MAX_RANDOMIZED_COMPONENTS = 50
+MAX_MEMORY = 4
+
+# Recently used decompositions. fitCache key -> decomposition dictionary.
+_DECOMPOSITIONS = OrderedDict()
+
+
+def _svd(x) -> dict:
+    n, d = x.shape
+    mean = x.mean(axis=0)
+    x_centered = x - mean
+
+    if x.size <= MAX_DENSE_ELEMENTS:
+        U, S, Vt = linalg.svd(x_centered, full_matrices=False)
+        # Same component signs as sklearn.decomposition.PCA
+        U, Vt = svd_flip(U, Vt)
+        total_variance = np.sum(S ** 2) / (n - 1)
+    else:
+        U, S, Vt = randomized_svd(x_centered,
+                                  n_components=min(MAX_RANDOMIZED_COMPONENTS,
+                                                   d),
+                                  random_state=0)
+        total_variance = np.sum(x_centered.var(axis=0, ddof=1))
+
+    explained_variance = S ** 2 / (n - 1)
+
+    return {'mean': mean,
+            'components': Vt,
+            'explained_variance': explained_variance,
+            'explained_variance_ratio': explained_variance / total_variance}
+
+
+def decompose(x, CACHE=True) -> dict:
+    '''
+    :param x: Feature matrix (rows = players).
+    :param CACHE: False for throw-away matrices (ex: permutation tests) that
+                    should not fill the caches.
+    :return: dictionary of 'mean', 'components' (rows), 'explained_variance'
+                and 'explained_variance_ratio'.
+    '''
+    if not CACHE:
+        return _svd(x)
+
+    # The matrix is hashed once; the key serves the memo and the fit cache.
+    key = fitCache.fitKey(x, "PCA", {})
+    if key in _DECOMPOSITIONS:
+        _DECOMPOSITIONS.move_to_end(key)
+        return _DECOMPOSITIONS[key]
+
+    pca = fitCache.load(key) if fitCache.ENABLED else None
+    if pca is None:
+        pca = _svd(x)
+        if fitCache.ENABLED:
+            fitCache.save(key, pca)
+
+    _DECOMPOSITIONS[key] = pca
+    while len(_DECOMPOSITIONS) > MAX_MEMORY:
+        _DECOMPOSITIONS.popitem(last=False)
+
+    return pca
+
+
+def clear():
+    _DECOMPOSITIONS.clear()
+
+
+def explainedVarianceRatio(x):
+    return decompose(x)['explained_variance_ratio']
+
+
+def numComponents(x, VARIANCE) -> int:
+    '''
+    Number of components kept for a VARIANCE setting. Matches
+    sklearn.decomposition.PCA(n_components=VARIANCE):
+        0 < VARIANCE < 1 - smallest number of components whose explained
+                            variance is greater than VARIANCE.
+        VARIANCE >= 1    - that many components.
+    '''
+    return componentsForRatio(explainedVarianceRatio(x), VARIANCE)
+
+
+def componentsForRatio(ratio, VARIANCE) -> int:
+    if VARIANCE < 1:
+        k = np.searchsorted(np.cumsum(ratio), VARIANCE, side='right') + 1
+    else:
+        k = int(VARIANCE)
+
+    return int(min(k, len(ratio)))
+
+
+def componentsForThresholds(x, THRESHOLDS) -> dict:
+    '''
+    Component count for every threshold of a sweep (one decomposition).
+    '''
+    return {threshold: numComponents(x, threshold)
+            for threshold in THRESHOLDS}
+
+
+def transform(x, VARIANCE, x_new=None, CACHE=True):
+    '''
+    Project x (or x_new, using the basis of x) onto the components kept for
+    VARIANCE.
+    '''
+    return project(decompose(x, CACHE), x if x_new is None else x_new,
+                   VARIANCE)
+
+
+def project(pca: dict, x, VARIANCE):
+    '''
+    Project x onto the components of a decomposition kept for VARIANCE.
+    '''
+    k = componentsForRatio(pca['explained_variance_ratio'], VARIANCE)
+
+    return (x - pca['mean']) @ pca['components'][:k].T
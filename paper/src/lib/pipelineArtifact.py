@@ -0,0 +1,345 @@
+'''
+File:   pipelineArtifact.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/18/2022
+Description:
+    Support file to 'main.py' and 'inferenceService.py'
+    Fitted (decade, model) pipelines saved as a small, versioned artifact so
+    new players can be scored (or clusters re-plotted) without refitting:
+
+        <PIPELINE_PATH>/<MODEL>_<first>-<last>/
+            manifest.json  - format version, model, decade, feature order,
+                             positions, preprocessing options and the
+                             name / shape / dtype of every array
+            <array>.npy    - one uncompressed NumPy file per array
+
+    Arrays:
+        data_min, data_range        - MinMax scaler
+        pca_mean, pca_components    - PCA basis (only with PCA)
+        centers                     - kMeans centroids / SOM weights /
+                                      hierarchy cluster means
+        concentration               - 'positionConcentration' table of the
+                                      training players, labeled by the
+                                      artifact's own rule (Total first)
+        linkage                     - ward linkage matrix (Hierarchy)
+        points, point_labels        - model-space training players and
+                                      their clusters (Hierarchy)
+
+    Arrays are memory-mapped on load, so loading takes milliseconds.
+    'predict()' applies scale -> normalize -> project -> assignment in
+    chunks of CHUNK_SIZE rows, so millions of rows run in bounded memory.
+    Artifacts of one decade share their scaler and often their PCA basis;
+    'transform()' with a shared STAGES dict + 'assign()' per model computes
+    every distinct stage of a batch once.
+
+    Assignment is to the nearest center, except for Hierarchy: ward clusters
+    are not Voronoi cells of their means (nearest mean reproduces only ~73%
+    of the training labels), so a player joins the cluster of the nearest
+    training player (KD-tree, 'lib/neighborIndex.py'). This is exact on the
+    training players.
+    The manifest is written last; a directory without one is incomplete.
+'''
+
+import datetime
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import hierarchyClustering as hc
+import kMeans as kMeans
+import lib.distanceCache as distanceCache
+import lib.globalBasis as globalBasis
+import lib.modelCommon as common
+import lib.neighborIndex as neighborIndex
+import lib.pcaService as pcaService
+import som as som
+
+FORMAT_VERSION = 2
+PIPELINE_PATH = "../model/pipelines/"
+CHUNK_SIZE = 65536
+
+# Exported models (Hierarchy: nearest training player, others: nearest
+# center), and their preprocessing in 'main.py'. name -> (row normalize, PCA)
+#   PCA: None = follows the PCA setting, False = never, True = always
+MODELS = {'Hierarchy': (True, None),
+          'SOM': (True, None),
+          'kMeans': (True, False),
+          'PCA_kMeans': (False, True)}
+
+
+def nearestCenter(x, centers, center_norms=None):
+    '''
+    :return: index of the closest center for every row of x.
+    '''
+    if center_norms is None:
+        center_norms = np.einsum('ij,ij->i', centers, centers)
+
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, |x|^2 is the same for every c.
+    return np.argmin(center_norms - 2 * (x @ centers.T), axis=1)
+
+
+def artifactPath(MODEL_NAME, YEARS: list, ROOT=PIPELINE_PATH):
+    return os.path.join(ROOT, "{}_{}-{}".format(MODEL_NAME, YEARS[0],
+                                                YEARS[1]))
+
+
+class PipelineArtifact:
+    def __init__(self, manifest: dict, arrays: dict):
+        self.manifest = manifest
+        self.arrays = arrays
+
+        self.model = manifest['model']
+        self.years = "{}-{}".format(*manifest['years'])
+        self.features = manifest['features']
+        self.positions = manifest['positions']
+        self.row_normalize = manifest['row_normalize']
+
+        centers = np.asarray(arrays['centers'], dtype=np.float64)
+        self.center_norms = np.einsum('ij,ij->i', centers, centers)
+        self.tree = neighborIndex.index(arrays['points']) \
+            if 'points' in arrays else None
+
+        # Key of every transform stage: feature order + the arrays of the
+        # stage and of the stages before it.
+        h = hashlib.sha256(json.dumps(self.features).encode())
+        self.stage_keys = {}
+        for stage, names in [('scale', ['data_min', 'data_range']),
+                             ('normalize', []),
+                             ('pca', ['pca_mean', 'pca_components'])]:
+            h.update(stage.encode())
+            if stage == 'normalize':
+                h.update(str(self.row_normalize).encode())
+            for name in names:
+                if name in arrays:
+                    h.update(np.ascontiguousarray(
+                        arrays[name], dtype=np.float64).tobytes())
+            self.stage_keys[stage] = h.hexdigest()
+
+    ##################################################################
+    # Des: Write the arrays, then the manifest (marks the artifact complete).
+    def save(self, DIRECTORY):
+        os.makedirs(DIRECTORY, exist_ok=True)
+
+        manifest = dict(self.manifest)
+        manifest['arrays'] = {}
+        for name, array in self.arrays.items():
+            array = np.ascontiguousarray(array)
+            np.save(os.path.join(DIRECTORY, name + ".npy"), array)
+            manifest['arrays'][name] = {'shape': list(array.shape),
+                                        'dtype': str(array.dtype)}
+
+        tmp_path = os.path.join(DIRECTORY, "manifest.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(DIRECTORY, "manifest.json"))
+
+        return DIRECTORY
+
+    ##################################################################
+    # @input MMAP   memory-map the arrays instead of reading them.
+    @classmethod
+    def load(cls, DIRECTORY, MMAP=True):
+        with open(os.path.join(DIRECTORY, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError("{}: artifact format {} is not supported "
+                             "(expected {})".format(
+                DIRECTORY, manifest.get('format_version'), FORMAT_VERSION))
+
+        arrays = {}
+        for name, spec in manifest['arrays'].items():
+            array = np.load(os.path.join(DIRECTORY, name + ".npy"),
+                            mmap_mode='r' if MMAP else None,
+                            allow_pickle=False)
+            if list(array.shape) != spec['shape'] or \
+                    str(array.dtype) != spec['dtype']:
+                raise ValueError("{}: array '{}' does not match the "
+                                 "manifest".format(DIRECTORY, name))
+            arrays[name] = array
+
+        return cls(manifest, arrays)
+
+    def transform(self, x_raw, STAGES=None):
+        '''
+        Raw stat lines (columns in 'features' order) -> model space.
+        :param STAGES: Optional dict shared by the artifacts of one batch
+                        (same x_raw). Stage outputs are kept in it, so
+                        artifacts with the same scaler / PCA basis reuse them.
+        '''
+        if STAGES is None:
+            STAGES = {}
+
+        key = self.stage_keys['scale']
+        if key not in STAGES:
+            STAGES[key] = (np.asarray(x_raw, dtype=np.float64) -
+                           self.arrays['data_min']) / self.arrays['data_range']
+        x = STAGES[key]
+
+        key = self.stage_keys['normalize']
+        if key not in STAGES:
+            if self.row_normalize:
+                # Unit rows (all-zero rows stay zero).
+                norms = np.linalg.norm(x, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                x = x / norms
+            STAGES[key] = x
+        x = STAGES[key]
+
+        key = self.stage_keys['pca']
+        if key not in STAGES:
+            if 'pca_components' in self.arrays:
+                x = (x - self.arrays['pca_mean']) @ \
+                    self.arrays['pca_components'].T
+            STAGES[key] = x
+
+        return STAGES[key]
+
+    def assign(self, x):
+        '''
+        Model-space rows (output of 'transform()') -> cluster labels.
+        '''
+        if self.tree is not None:
+            nearest = self.tree.query(x, k=1, return_distance=False)[:, 0]
+            return np.asarray(self.arrays['point_labels'])[nearest]
+
+        return nearestCenter(x, self.arrays['centers'], self.center_norms)
+
+    def predict(self, x_raw, CHUNK_SIZE=CHUNK_SIZE):
+        '''
+        :param x_raw: (n, len(features)) array or a DataFrame with (at
+                        least) the feature columns.
+        :return: int16 cluster label of every row.
+        '''
+        if isinstance(x_raw, pd.DataFrame):
+            x_raw = x_raw[self.features].to_numpy(dtype=np.float64)
+
+        labels = np.empty(len(x_raw), dtype=np.int16)
+        for start in range(0, len(x_raw), CHUNK_SIZE):
+            stop = start + CHUNK_SIZE
+            labels[start:stop] = self.assign(self.transform(
+                x_raw[start:stop]))
+
+        return labels
+
+    def concentration(self, labels):
+        '''
+        :return: 'positionConcentration' rows (Total first) of the labels.
+        '''
+        return np.asarray(self.arrays['concentration'])[labels]
+
+
+def fitArtifact(df_year: pd.DataFrame, YEARS: list, MODEL_NAME,
+                INCLUDE_POS, THREE_POS_FLAG, APPLY_PCA: bool,
+                VARIANCE: float, NEIGHBORS=None) -> PipelineArtifact:
+    '''
+    Pipeline of one (decade, model), with the same preprocessing and
+    (cached) fit as the model run by 'main.py'.
+    '''
+    ROW_NORMALIZE, MODEL_PCA = MODELS[MODEL_NAME]
+    if MODEL_PCA is not None:
+        APPLY_PCA = MODEL_PCA
+
+    df_features = kMeans.modifyDataForModel(df_year, INCLUDE_POS,
+                                            THREE_POS_FLAG)
+    x_raw = df_features.to_numpy(dtype=np.float64)
+
+    # MinMaxScaler parameters (constant columns are scaled by 1).
+    if globalBasis.ACTIVE is not None:
+        data_min = globalBasis.ACTIVE['data_min']
+        data_range = 1 / globalBasis.ACTIVE['scale']
+    else:
+        data_min = x_raw.min(axis=0)
+        data_range = x_raw.max(axis=0) - data_min
+        data_range[data_range == 0] = 1.0
+    arrays = {'data_min': data_min, 'data_range': data_range}
+
+    x = common.normalizeData(x_raw) if ROW_NORMALIZE else \
+        np.asarray(common.scaleData(x_raw))
+    if APPLY_PCA:
+        if globalBasis.ACTIVE is not None:
+            name = 'normalized' if ROW_NORMALIZE else 'scaled'
+            pca = {'mean': globalBasis.ACTIVE[name + '_mean'],
+                   'components': globalBasis.ACTIVE[name + '_components'],
+                   'explained_variance_ratio':
+                       globalBasis.ACTIVE[name + '_ratio']}
+        else:
+            pca = pcaService.decompose(x)
+        k = pcaService.componentsForRatio(pca['explained_variance_ratio'],
+                                          VARIANCE)
+        arrays['pca_mean'] = pca['mean']
+        arrays['pca_components'] = pca['components'][:k]
+        x = (x - pca['mean']) @ pca['components'][:k].T
+
+    numPositions = len(df_year['Pos'].unique())
+    if MODEL_NAME == 'Hierarchy':
+        fit = hc.cachedHierarchy(x, numPositions,
+                                 distanceCache.condensed(x)
+                                 if NEIGHBORS is None else None, NEIGHBORS)
+        labels = np.asarray(fit['labels'])
+        centers = np.stack([x[labels == c].mean(axis=0)
+                            for c in range(numPositions)])
+        arrays['linkage'] = fit['linkage']
+        # New players join the cluster of the nearest training player.
+        arrays['points'] = np.asarray(x, dtype=np.float64)
+        arrays['point_labels'] = labels.astype(np.int16)
+    elif MODEL_NAME == 'SOM':
+        fit = som.cachedSOM(x, numPositions)
+        centers = fit['weights']
+    elif MODEL_NAME == 'kMeans':
+        fit = kMeans.cachedKmeans(x, 5)
+        centers = fit['centroids']
+    else:
+        fit = kMeans.cachedKmeans(x, numPositions)
+        centers = fit['centroids']
+
+    arrays['centers'] = np.asarray(centers, dtype=np.float64)
+
+    manifest = {'format_version': FORMAT_VERSION,
+                'model': MODEL_NAME,
+                'years': [int(YEARS[0]), int(YEARS[1])],
+                'features': list(df_features.columns),
+                'positions': common.positionColumns(THREE_POS_FLAG),
+                'row_normalize': ROW_NORMALIZE,
+                'variance': VARIANCE if APPLY_PCA else None,
+                'global_basis': globalBasis.ACTIVE is not None,
+                'num_clusters': len(centers),
+                'players': len(x_raw),
+                'created': datetime.datetime.now().isoformat(
+                    timespec='seconds')}
+
+    # Concentration of the clusters 'predict()' puts the training players
+    # in, so a player's answer matches the table it is reported with.
+    artifact = PipelineArtifact(manifest, arrays)
+    arrays['concentration'] = common.positionConcentration(
+        artifact.assign(x), df_year['Pos'], THREE_POS_FLAG,
+        len(centers)).to_numpy(dtype=np.float64)
+
+    return artifact
+
+
+def exportDecade(df_year: pd.DataFrame, YEARS: list, MODEL_NAMES: list,
+                 INCLUDE_POS, THREE_POS_FLAG, APPLY_PCA: bool,
+                 VARIANCE: float, NEIGHBORS=None, ROOT=PIPELINE_PATH):
+    for MODEL_NAME in MODEL_NAMES:
+        artifact = fitArtifact(df_year, YEARS, MODEL_NAME, INCLUDE_POS,
+                               THREE_POS_FLAG, APPLY_PCA, VARIANCE, NEIGHBORS)
+        artifact.save(artifactPath(MODEL_NAME, YEARS, ROOT))
+
+    print("** Pipeline Artifacts {}-{}: SAVED".format(YEARS[0], YEARS[1]))
+
+
+def loadAll(ROOT=PIPELINE_PATH) -> list:
+    '''
+    Every complete artifact below ROOT.
+    '''
+    if not os.path.isdir(ROOT):
+        return []
+
+    return [PipelineArtifact.load(os.path.join(ROOT, name))
+            for name in sorted(os.listdir(ROOT))
+            if os.path.exists(os.path.join(ROOT, name, "manifest.json"))]
@@ -0,0 +1,135 @@
+'''
+File:   playerIngest.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/04/2022
+Description:
+    Support file to 'modelCommon.combinePlayers()'
+    Bulk ingestion of the hand gathered Excel workbooks
+    (Players_PENDING.xlsx, ARCHIEVE/2017-2022.xlsx).
+
+    1) Every year sheet of a workbook is read in a single pass of the file.
+    2) Height and Weight strings ('183cm', '6-7', '220lb', '73kg' or plain
+        numbers) are converted to numeric cm and kg with vectorized string
+        operations.
+    3) The result is saved to a converted cache file next to CACHE_DIR. The
+        cache is named by the workbook's checksum, so it is reused until the
+        workbook changes and Excel is only parsed once.
+'''
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = "../data/ref/"
+
+CM_PER_INCH = 2.54
+KG_PER_LB = 0.45359237
+
+
+def fileChecksum(PATH) -> str:
+    h = hashlib.sha256()
+    with open(PATH, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def sheetYear(SHEET_NAME):
+    '''
+    Year represented by a sheet name. '2018' -> 2018, '18' -> 2018.
+    Non-year sheets ('Key', 'Columns') return None.
+    '''
+    name = str(SHEET_NAME).strip()
+    if not name.isdigit():
+        return None
+    if len(name) == 2:
+        return 2000 + int(name)
+
+    return int(name)
+
+
+def parseHeight(data: pd.Series) -> pd.Series:
+    '''
+    Convert heights to cm. Accepts '183cm', '183', 183, "6-7" and "6'7\"".
+    '''
+    text = data.astype(str).str.strip().str.lower()
+
+    metric = text.str.extract(r'^(\d+(?:\.\d+)?)\s*(?:cm)?$')[0].astype(float)
+
+    imperial = text.str.extract(r'^(\d+)\s*(?:-|\'|ft)\s*(\d+)')
+    imperial = (imperial[0].astype(float) * 12 + imperial[1].astype(float)) \
+        * CM_PER_INCH
+
+    return metric.fillna(imperial).round(1)
+
+
+def parseWeight(data: pd.Series) -> pd.Series:
+    '''
+    Convert weights to kg. Accepts '73kg', '73', 73, '220lb' and '220 lbs'.
+    '''
+    text = data.astype(str).str.strip().str.lower()
+
+    parts = text.str.extract(r'^(\d+(?:\.\d+)?)\s*(kg|lbs?)?$')
+    value = parts[0].astype(float)
+    value = np.where(parts[1].str.startswith('lb', na=False),
+                     value * KG_PER_LB, value)
+
+    return pd.Series(value, index=data.index).round(1)
+
+
+def readWorkbook(PATH) -> pd.DataFrame:
+    '''
+    Read every year sheet of a workbook in a single pass and stack them into
+    one table with a 'Year' column.
+    '''
+    sheets = pd.read_excel(PATH, sheet_name=None)
+
+    frames = []
+    for name, df_sheet in sheets.items():
+        year = sheetYear(name)
+        if year is None:
+            continue
+
+        # Drop the helper cells some sheets have to the right of the data.
+        df_sheet = df_sheet.loc[:, ~df_sheet.columns.astype(str)
+                                .str.startswith('Unnamed')]
+        df_sheet = df_sheet.dropna(how='all')
+        df_sheet['Year'] = year
+        frames.append(df_sheet)
+
+    df = pd.concat(frames, ignore_index=True)
+
+    if 'Height' in df.columns:
+        df['Height'] = parseHeight(df['Height'])
+    if 'Weight' in df.columns:
+        df['Weight'] = parseWeight(df['Weight'])
+
+    return df
+
+
+def loadWorkbook(PATH) -> pd.DataFrame:
+    '''
+    Return the converted contents of a workbook, using the converted cache
+    when the workbook's checksum has not changed.
+    '''
+    checksum = fileChecksum(PATH)
+    name = os.path.splitext(os.path.basename(PATH))[0]
+    CACHE_PATH = os.path.join(CACHE_DIR, "{}_{}.pkl".format(name,
+                                                           checksum[:16]))
+
+    if os.path.exists(CACHE_PATH):
+        print("** Ingest {}: Converted cache HIT".format(PATH))
+        return pd.read_pickle(CACHE_PATH)
+
+    print("** Ingest {}: Parse workbook".format(PATH))
+    df = readWorkbook(PATH)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.to_pickle(CACHE_PATH + ".tmp")
+    os.replace(CACHE_PATH + ".tmp", CACHE_PATH)
+
+    return df
@@ -0,0 +1,255 @@
+'''
+File:   resultsStore.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/13/2022
+Description:
+    Support file to 'main.py'
+    Local results warehouse. Every run of 'main.py' is kept (instead of
+    overwriting the MODEL_Metrics / CONC csv files of the previous run) in
+    one SQLite database:
+        runs          - run id, hash of the run configuration, start time
+        run_config    - one row per configuration setting (indexed, so runs
+                        can be selected by e.g. INCLUDE_POS=False)
+        metrics       - (run, model, decade, metric) -> value
+        concentrations- (run, model, decade, cluster, position) -> fraction
+        labels        - cluster label of every player, stored as compact
+                        int16 arrays next to the player IDs (int32)
+
+    All rows of one (model, decade) job are written in a single transaction
+    when the job finishes.
+
+    Example: silhouette by decade for every kMeans run without positions
+        store.metrics(MODEL='kMeans', METRIC='SC', INCLUDE_POS=False)
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+RESULTS_PATH = "../data/output/Results.sqlite"
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    config_hash TEXT NOT NULL,
+    config      TEXT NOT NULL,
+    created     TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS runs_hash ON runs (config_hash);
+
+CREATE TABLE IF NOT EXISTS run_config (
+    run_id  TEXT NOT NULL REFERENCES runs (run_id),
+    name    TEXT NOT NULL,
+    value   TEXT NOT NULL,
+    PRIMARY KEY (run_id, name));
+CREATE INDEX IF NOT EXISTS run_config_value ON run_config (name, value);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id  TEXT NOT NULL REFERENCES runs (run_id),
+    model   TEXT NOT NULL,
+    years   TEXT NOT NULL,
+    metric  TEXT NOT NULL,
+    value,
+    PRIMARY KEY (run_id, model, years, metric));
+CREATE INDEX IF NOT EXISTS metrics_model ON metrics (model, metric, years);
+
+CREATE TABLE IF NOT EXISTS concentrations (
+    run_id   TEXT NOT NULL REFERENCES runs (run_id),
+    model    TEXT NOT NULL,
+    years    TEXT NOT NULL,
+    cluster  INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    value    REAL,
+    PRIMARY KEY (run_id, model, years, cluster, position));
+CREATE INDEX IF NOT EXISTS concentrations_model
+    ON concentrations (model, years);
+
+CREATE TABLE IF NOT EXISTS labels (
+    run_id  TEXT NOT NULL REFERENCES runs (run_id),
+    model   TEXT NOT NULL,
+    years   TEXT NOT NULL,
+    ids     BLOB NOT NULL,
+    labels  BLOB NOT NULL,
+    PRIMARY KEY (run_id, model, years));
+'''
+
+
+def configHash(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True,
+                                     default=str).encode()).hexdigest()
+
+
+def yearsName(YEARS) -> str:
+    return "{}-{}".format(YEARS[0], YEARS[1])
+
+
+class ResultsStore:
+    # Constructor. Open (and create if needed) the database at PATH.
+    def __init__(self, PATH=RESULTS_PATH):
+        directory = os.path.dirname(PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = PATH
+        self.connection = sqlite3.connect(PATH)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    ##################################################################
+    # @input config   dict of the settings of this run (json serializable)
+    # @output str     id of the new run.
+    def startRun(self, config: dict) -> str:
+        run_id = "{}-{}".format(
+            datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S"),
+            uuid.uuid4().hex[:8])
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?)",
+                (run_id, configHash(config),
+                 json.dumps(config, sort_keys=True, default=str),
+                 datetime.now(timezone.utc).isoformat()))
+            self.connection.executemany(
+                "INSERT INTO run_config VALUES (?, ?, ?)",
+                [(run_id, name, json.dumps(value, default=str))
+                 for name, value in config.items()])
+
+        return run_id
+
+    ##################################################################
+    # @input run_id    Run the job belongs to.
+    # @input MODEL     Model name (ex: 'kMeans')
+    # @input YEARS     [firstYear, lastYear] of the decade.
+    # @input metrics   dict of metric name -> value (ex: {'SC': 0.21})
+    # @input df_conc   (optional) position concentrations of each cluster.
+    #                   See 'modelCommon.positionConcentration()'
+    #                   (cluster -1 = noise)
+    # @input ids       (optional) player IDs and their cluster labels.
+    # @input labels
+    # Des: Write every result of one (model, decade) job in one transaction.
+    def recordJob(self, run_id, MODEL, YEARS, metrics: dict,
+                  df_conc: pd.DataFrame = None, ids=None, labels=None):
+        years = yearsName(YEARS)
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)",
+                [(run_id, MODEL, years, metric, _sqlValue(value))
+                 for metric, value in metrics.items()])
+
+            if df_conc is not None:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO concentrations "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(run_id, MODEL, years, int(cluster), position,
+                      float(value))
+                     for cluster, row in df_conc.iterrows()
+                     for position, value in row.items()])
+
+            if labels is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?)",
+                    (run_id, MODEL, years,
+                     np.asarray(ids, dtype=np.int32).tobytes(),
+                     np.asarray(labels, dtype=np.int16).tobytes()))
+
+    def latestRun(self, CONFIG_HASH=None):
+        query = "SELECT run_id FROM runs"
+        params = []
+        if CONFIG_HASH is not None:
+            query += " WHERE config_hash = ?"
+            params.append(CONFIG_HASH)
+        row = self.connection.execute(
+            query + " ORDER BY created DESC LIMIT 1", params).fetchone()
+
+        return None if row is None else row[0]
+
+    def _runFilter(self, config: dict):
+        # One indexed sub-query per configuration setting.
+        clauses = []
+        params = []
+        for name, value in config.items():
+            clauses.append("m.run_id IN (SELECT run_id FROM run_config "
+                           "WHERE name = ? AND value = ?)")
+            params.extend([name, json.dumps(value, default=str)])
+
+        return clauses, params
+
+    def metrics(self, MODEL=None, METRIC=None, RUN_ID=None,
+                **config) -> pd.DataFrame:
+        '''
+        Metrics of every matching run. Keyword arguments select runs by
+        their configuration, e.g. metrics(MODEL='kMeans', INCLUDE_POS=False)
+        '''
+        clauses, params = self._runFilter(config)
+        for column, value in [('model', MODEL), ('metric', METRIC),
+                              ('run_id', RUN_ID)]:
+            if value is not None:
+                clauses.append("m.{} = ?".format(column))
+                params.append(value)
+
+        query = "SELECT m.run_id, r.created, m.model, m.years, m.metric, " \
+                "m.value FROM metrics m JOIN runs r USING (run_id)"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+
+        return pd.read_sql_query(query + " ORDER BY r.created, m.years",
+                                 self.connection, params=params)
+
+    def concentrations(self, RUN_ID, MODEL, YEARS) -> pd.DataFrame:
+        '''
+        :return: DataFrame in the same layout as the CONC_*.csv files
+                    (one row per cluster, 'Total' + one column per position)
+        '''
+        df = pd.read_sql_query(
+            "SELECT cluster, position, value FROM concentrations "
+            "WHERE run_id = ? AND model = ? AND years = ? "
+            "ORDER BY rowid",
+            self.connection, params=[RUN_ID, MODEL, yearsName(YEARS)])
+
+        # Columns in the order they were written.
+        order = list(dict.fromkeys(df['position']))
+        df_conc = df.pivot(index='cluster', columns='position',
+                           values='value')
+        df_conc = df_conc[order]
+        df_conc.index.name = None
+        df_conc.columns.name = None
+
+        return df_conc
+
+    def labels(self, RUN_ID, MODEL, YEARS) -> pd.Series:
+        '''
+        :return: Cluster label of every player, indexed by player ID.
+        '''
+        row = self.connection.execute(
+            "SELECT ids, labels FROM labels "
+            "WHERE run_id = ? AND model = ? AND years = ?",
+            (RUN_ID, MODEL, yearsName(YEARS))).fetchone()
+        if row is None:
+            return None
+
+        return pd.Series(np.frombuffer(row[1], dtype=np.int16),
+                         index=np.frombuffer(row[0], dtype=np.int32),
+                         name='Cluster')
+
+
+def _sqlValue(value):
+    # NumPy scalars are stored as plain python numbers.
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
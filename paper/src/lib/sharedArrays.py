@@ -0,0 +1,89 @@
+'''
+File:   sharedArrays.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/10/2022
+Description:
+    Support file for parallel (process pool) work such as k-sweeps,
+    bootstrap refits and permutation tests.
+    Feature matrices and label arrays are written ONCE to memory-mapped .npy
+    files (in /dev/shm when available) instead of being pickled into every
+    worker. Workers attach to the arrays by name with zero copies, so worker
+    memory stays flat as the number of workers grows. The files are deleted
+    when the store is closed.
+
+    Usage:
+        with SharedArrayStore() as store:
+            store.put('x', x)
+            with store.pool(NUM_WORKERS) as pool:
+                results = list(pool.map(workerFunction, tasks))
+
+        def workerFunction(task):
+            x = sharedArrays.get('x')    # read-only, zero copy
+'''
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+SHM_DIR = "/dev/shm"
+
+# Arrays attached in this process. name -> read-only np.memmap
+_ARRAYS = {}
+
+
+def _attachAll(handles: dict):
+    for name, path in handles.items():
+        _ARRAYS[name] = np.load(path, mmap_mode='r')
+
+
+def get(name):
+    '''
+    Array 'name' of the store this process (or worker) is attached to.
+    '''
+    return _ARRAYS[name]
+
+
+class SharedArrayStore:
+    # Constructor. Create a private directory for the shared blocks.
+    def __init__(self, ROOT=None):
+        if ROOT is None and os.path.isdir(SHM_DIR):
+            ROOT = SHM_DIR
+        self.directory = tempfile.mkdtemp(prefix="nba_shared_", dir=ROOT)
+        self.handles = {}
+
+    ##################################################################
+    # @input name    str name workers use to find the array.
+    # @input array   numpy array to share.
+    # Des: Write the array to a shared block and attach it in this process.
+    def put(self, name, array):
+        path = os.path.join(self.directory, "{}.npy".format(name))
+        np.save(path, np.ascontiguousarray(array))
+
+        self.handles[name] = path
+        _attachAll({name: path})
+
+        return path
+
+    ##################################################################
+    # @output ProcessPoolExecutor whose workers are attached to every array
+    #           put in the store so far.
+    def pool(self, NUM_WORKERS=None):
+        return ProcessPoolExecutor(max_workers=NUM_WORKERS,
+                                   initializer=_attachAll,
+                                   initargs=(dict(self.handles),))
+
+    def close(self):
+        for name in self.handles:
+            _ARRAYS.pop(name, None)
+        self.handles = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -28,8 +28,19 @@ import hierarchyClustering as hc
 import kMeans as kMeans
 from pca import runPCA
 from som import som
+from gmm import runGMM
+from dbscan import runDBSCAN
 import pandas as pd
 import lib.modelCommon as common
+import lib.fitCache as fitCache
+import lib.globalBasis as globalBasis
+import lib.distanceCache as distanceCache
+import lib.neighborIndex as neighborIndex
+import lib.pcaService as pcaService
+from lib.resultsStore import ResultsStore
+from lib.checkpoint import Checkpoints
+import lib.agreement as agreement
+import lib.pipelineArtifact as pipelineArtifact
 
 ##########################
 ################
@@ -45,7 +56,8 @@ DEBUG   - Simple program run. Run only one decade of information. Most
 LOAD_MODEL_DATA - Determine if the program should create the data used in 
                     modeling (see the program's two inputs) or load an already 
                     created .csv file from a previous run when this flag was 
-                    set to FALSE.
+                    set to FALSE. A .pkl copy saved next to the .csv keeps the 
+                    compact dtypes (categorical/int8/float32) and is preferred.
                     (REQUIRES two input .csv files - see file header)
 OUTPUT_FILES_FLAG - Decide if reference DataQualityReports and other csvs for 
                      independent validation should be created.
@@ -60,6 +72,54 @@ THREE_POSITION_FLAG - Specify how many positions to consider. The traditional
                         five positions {PG, SG, SF, PF, C} or condensed 
                         summarized positions {G, F, C}
                         TRUE = Player positions are reduced to only { G, F, C }
+
+FIT_CACHE - Reuse model fits from previous runs. Fits are keyed by a hash of 
+                the feature matrix and the model hyperparameters, so a rerun 
+                that only changes plotting or scoring skips all re-fitting.
+                Fits are kept in FIT_CACHE_PATH, which is limited to 
+                FIT_CACHE_MAX_MB (least recently used fits are deleted).
+
+GLOBAL_BASIS - Fit the MinMax scaler and PCA basis ONCE on the players of 
+                GLOBAL_BASIS_YEARS and only project each decade into it. 
+                Decades then share one geometry. The basis is saved to 
+                GLOBAL_BASIS_PATH and reused by later runs (also after new 
+                seasons are added) while its fitting config (feature 
+                columns, GLOBAL_BASIS_YEARS, REQ_GAMES, REQ_MIN, DATA_PATH) 
+                does not change. GLOBAL_BASIS_REFIT forces a new fit.
+                FALSE = every decade is scaled and decomposed independently.
+
+HIERARCHY_NEIGHBORS - Number of nearest neighbors of the connectivity graph 
+                        for connectivity-constrained ward in the hierarchy 
+                        model. None = unconstrained ward.
+
+DBSCAN - Run the density-based (DBSCAN) model. A player is a core player 
+            with at least DBSCAN_MIN_SAMPLES neighbors within DBSCAN_EPS. 
+            DBSCAN_EPS = None estimates eps from the k-distance of every 
+            decade. Players outside dense regions are reported as 'Noise'.
+
+RESULTS_STORE - Keep the metrics, position concentrations and cluster labels 
+                of every run in the results database RESULTS_PATH (keyed by 
+                run, configuration, model and decade) next to the csv files. 
+                See 'lib/resultsStore.py' for cross-run queries.
+
+AGREEMENT - Compare the cluster labels of every pair of models (and the 
+            players' 'Pos') in each decade with ARI, NMI and Variation of 
+            Information. Outputs a .npz tensor and a heatmap per decade.
+
+RESUME - Write a checkpoint after every (model, decade) job to 
+            CHECKPOINT_PATH. A run that stops early (error, crash) is 
+            restarted with the same settings and only runs the jobs that 
+            are missing. Checkpoints are deleted once a run completes.
+
+GMM - Run the Gaussian Mixture (EM) model. A mixture is fit for every 
+        component count in GMM_K_RANGE and covariance type in GMM_COVARIANCE 
+        {diag, tied, full}; the mixture with the lowest BIC is reported.
+
+EXPORT_PIPELINES - Save the fitted pipeline (scaler, PCA basis, centroids / 
+                    SOM weights / ward linkage) of every (decade, model) to 
+                    PIPELINE_PATH. New players can then be scored without 
+                    refitting (see 'lib/pipelineArtifact.py' and 
+                    'inferenceService.py').
                      
 -- File Paths --
 PLAYER_PATH - File path to a dataset with player height and weight
@@ -81,20 +141,46 @@ PLAYER_PATH = "../data/input/Players.csv"
 DATA_PATH = "../data/input/Seasons_Stats_1950_2022.csv"  # 1950-2022
 OUTPUT_FILES_FLAG = True
 
+FIT_CACHE = True
+FIT_CACHE_PATH = "../model/cache/"
+FIT_CACHE_MAX_MB = 512
+
+RESULTS_STORE = True
+RESULTS_PATH = "../data/output/Results.sqlite"
+
+AGREEMENT = True
+
+RESUME = True
+CHECKPOINT_PATH = "../model/checkpoint/"
+
+EXPORT_PIPELINES = True
+PIPELINE_PATH = "../model/pipelines/"
+
 HIERARCHICAL = True
 SOM = True
 KMEANS = True
 PCA_kMEANS = True
+GMM = True
+GMM_K_RANGE = range(2, 9)
+GMM_COVARIANCE = ['diag', 'tied', 'full']
+DBSCAN = True
+DBSCAN_MIN_SAMPLES = 10
+DBSCAN_EPS = None
+HIERARCHY_NEIGHBORS = None
 
 PCA = True
 VARIANCE_THRESHOLD = 0.85
+GLOBAL_BASIS = False
+GLOBAL_BASIS_PATH = "../model/ref/Global_Basis.npz"
+GLOBAL_BASIS_YEARS = [1971, 2020]
+GLOBAL_BASIS_REFIT = False
 
 REQ_GAMES = 20
 REQ_MIN = 10
 INCLUDE_POS = False
 THREE_POSITION_FLAG = False
 
-DQR_NON_NUMERIC_COLUMNS = ['Unnamed: 0', 'Player', 'Tm', 'Pos',
+DQR_NON_NUMERIC_COLUMNS = ['Unnamed: 0', 'Player', 'Tm', 'Teams', 'Pos',
                            'blanl', 'blank2']
 
 YEARS = [[1971, 1980],
@@ -106,6 +192,8 @@ YEARS = [[1971, 1980],
 if DEBUG:
     YEARS = [YEARS[0], YEARS[1]]
 
+fitCache.configure(FIT_CACHE_PATH, FIT_CACHE_MAX_MB, FIT_CACHE)
+
 # common.calcEntropy()
 
 ##########################
@@ -115,80 +203,193 @@ if DEBUG:
 '''
 ** Program Execution starts HERE **
 '''
-# Load your own correctly formatted csv file to reduce computation time.
-if LOAD_MODEL_DATA:
-    df_data = pd.read_csv("../data/ref/Season_Stats_MODEL_{}-{}.csv".format(
-        YEARS[0][0], YEARS[len(YEARS) - 1][1]),
-        index_col=False)
-else:
-    df_data = dp.initialDataModification(PLAYER_PATH, DATA_PATH, YEARS,
-                                         REQ_GAMES, REQ_MIN,
-                                         THREE_POSITION_FLAG,
-                                         DQR_NON_NUMERIC_COLUMNS,
-                                         OUTPUT_FILES_FLAG)
-
-# Create Cluster Metric dataframe placeholder to collect all metrics.
-df_metrics_hierarchy = pd.DataFrame(columns=['Years', 'CHS', 'SC', 'DBI'])
-df_metrics_som = pd.DataFrame(columns=['Years', 'CHS', 'SC', 'DBI'])
-df_metrics_kMeans = pd.DataFrame(columns=['Years', 'CHS', 'SC', 'DBI'])
-df_metrics_kMeans_pca = pd.DataFrame(columns=['Years', 'CHS', 'SC', 'DBI'])
-kmeans_inertia = []
-
-# Begin modeling for each set of year-pairs specified.
-for YEAR in YEARS:
-    df_year = df_data.loc[(df_data['Year'] >= YEAR[0]) &
-                          (df_data['Year'] <= YEAR[1])]
-
-    if HIERARCHICAL:
-        metrics = hc.hierarchicalClustering(df_year, [YEAR[0], YEAR[1]],
-                                            INCLUDE_POS,
-                                            THREE_POSITION_FLAG,
-                                            PCA, VARIANCE_THRESHOLD)
-        df_metrics_hierarchy.loc[len(df_metrics_hierarchy)] = metrics
-        print("** Model1 (Divisive Clustering): COMPLETE\n")
-
-    if SOM:
-        metrics = som(df_year, [YEAR[0], YEAR[1]],
-                      INCLUDE_POS, THREE_POSITION_FLAG,
-                      PCA, VARIANCE_THRESHOLD)
-        df_metrics_som.loc[len(df_metrics_som)] = metrics
-        print("** Model2 (SOM Clustering): COMPLETE\n")
-
-    if KMEANS:
-        metrics = kMeans.runKmeans(df_year, [YEAR[0], YEAR[1]],
-                                   INCLUDE_POS, THREE_POSITION_FLAG,
-                                   False, VARIANCE_THRESHOLD)
-        df_metrics_kMeans.loc[len(df_metrics_kMeans)] = metrics
-
-        print("** Model3 (KMeans): COMPLETE\n")
-
-    if PCA_kMEANS:
-        metrics = runPCA(df_year, [YEAR[0], YEAR[1]],
-                                   INCLUDE_POS, THREE_POSITION_FLAG,
-                                   VARIANCE_THRESHOLD)
-        df_metrics_kMeans_pca.loc[len(df_metrics_kMeans_pca)] = metrics
-        print("** Model4 (PCA KMeans): COMPLETE\n")
-
-# Output the resulting cluster metrics to individual .csv files.
-df_metrics_hierarchy.to_csv(
-    '../data/output/MODEL_Metrics_Hierarchy_{}-{}.csv'.format(
-        YEARS[0][0], YEARS[len(YEARS) - 1][1]),
-    index=False)
-
-df_metrics_som.to_csv(
-    '../data/output/MODEL_Metrics_som_{}-{}.csv'.format(
-        YEARS[0][0], YEARS[len(YEARS) - 1][1]),
-    index=False)
-
-df_metrics_kMeans.to_csv(
-    '../data/output/MODEL_Metrics_kMeans_{}-{}.csv'.format(
-        YEARS[0][0], YEARS[len(YEARS) - 1][1]),
-    index=False)
-
-df_metrics_kMeans_pca.to_csv(
-    '../data/output/MODEL_Metrics_kMeans_pca_{}-{}.csv'.format(
-        YEARS[0][0], YEARS[len(YEARS) - 1][1]),
-    index=False)
+# Guarded so process pool workers (spawn start method, the default on
+# macOS and Windows) can import this module without starting a run.
+if __name__ == '__main__':
+    # Load your own correctly formatted csv file to reduce computation time.
+    if LOAD_MODEL_DATA:
+        df_data = dp.loadModelData(
+            "../data/ref/Season_Stats_MODEL_{}-{}".format(
+                YEARS[0][0], YEARS[len(YEARS) - 1][1]))
+    else:
+        df_data = dp.initialDataModification(PLAYER_PATH, DATA_PATH, YEARS,
+                                             REQ_GAMES, REQ_MIN,
+                                             THREE_POSITION_FLAG,
+                                             DQR_NON_NUMERIC_COLUMNS,
+                                             OUTPUT_FILES_FLAG)
+
+    # Optionally fit one scaler/PCA basis on the full table for all decades.
+    if GLOBAL_BASIS:
+        df_fit = df_data.loc[(df_data['Year'] >= GLOBAL_BASIS_YEARS[0]) &
+                             (df_data['Year'] <= GLOBAL_BASIS_YEARS[1])]
+        df_features = hc.modifyDataForModel(df_fit, INCLUDE_POS,
+                                            THREE_POSITION_FLAG)
+        globalBasis.activate(globalBasis.loadOrFit(
+            df_features, GLOBAL_BASIS_PATH,
+            {'YEARS': GLOBAL_BASIS_YEARS,
+             'REQ_GAMES': REQ_GAMES,
+             'REQ_MIN': REQ_MIN,
+             'DATA_PATH': DATA_PATH},
+            GLOBAL_BASIS_REFIT))
+
+    # Settings that change the results of a run.
+    RUN_CONFIG = {'YEARS': YEARS,
+                  'DATA_PATH': DATA_PATH,
+                  'REQ_GAMES': REQ_GAMES,
+                  'REQ_MIN': REQ_MIN,
+                  'INCLUDE_POS': INCLUDE_POS,
+                  'THREE_POSITION_FLAG': THREE_POSITION_FLAG,
+                  'PCA': PCA,
+                  'VARIANCE_THRESHOLD': VARIANCE_THRESHOLD,
+                  'GLOBAL_BASIS': GLOBAL_BASIS,
+                  'GLOBAL_BASIS_YEARS': GLOBAL_BASIS_YEARS,
+                  'GMM_K_RANGE': list(GMM_K_RANGE),
+                  'GMM_COVARIANCE': GMM_COVARIANCE,
+                  'DBSCAN_MIN_SAMPLES': DBSCAN_MIN_SAMPLES,
+                  'DBSCAN_EPS': DBSCAN_EPS,
+                  'HIERARCHY_NEIGHBORS': HIERARCHY_NEIGHBORS}
+
+    # Columns of each model's metrics.
+    METRIC_COLUMNS = ['Years', 'CHS', 'SC', 'DBI']
+    GMM_METRIC_COLUMNS = METRIC_COLUMNS + ['K', 'Covariance', 'Entropy']
+    DBSCAN_METRIC_COLUMNS = METRIC_COLUMNS + ['Clusters', 'Noise', 'Eps']
+
+    # Model jobs run for every decade.
+    # (name, enabled, metric columns, .csv name, description, model function)
+    MODEL_JOBS = [
+        ("Hierarchy", HIERARCHICAL, METRIC_COLUMNS, "Hierarchy",
+         "Model1 (Divisive Clustering)",
+         lambda df, Y: hc.hierarchicalClustering(df, Y, INCLUDE_POS,
+                                                 THREE_POSITION_FLAG,
+                                                 PCA, VARIANCE_THRESHOLD,
+                                                 HIERARCHY_NEIGHBORS)),
+        ("SOM", SOM, METRIC_COLUMNS, "som",
+         "Model2 (SOM Clustering)",
+         lambda df, Y: som(df, Y, INCLUDE_POS, THREE_POSITION_FLAG,
+                           PCA, VARIANCE_THRESHOLD)),
+        ("kMeans", KMEANS, METRIC_COLUMNS, "kMeans",
+         "Model3 (KMeans)",
+         lambda df, Y: kMeans.runKmeans(df, Y, INCLUDE_POS,
+                                        THREE_POSITION_FLAG,
+                                        False, VARIANCE_THRESHOLD)),
+        ("PCA_kMeans", PCA_kMEANS, METRIC_COLUMNS, "kMeans_pca",
+         "Model4 (PCA KMeans)",
+         lambda df, Y: runPCA(df, Y, INCLUDE_POS, THREE_POSITION_FLAG,
+                              VARIANCE_THRESHOLD)),
+        ("GMM", GMM, GMM_METRIC_COLUMNS, "gmm",
+         "Model5 (Gaussian Mixture)",
+         lambda df, Y: runGMM(df, Y, INCLUDE_POS, THREE_POSITION_FLAG,
+                              PCA, VARIANCE_THRESHOLD,
+                              GMM_K_RANGE, GMM_COVARIANCE)),
+        ("DBSCAN", DBSCAN, DBSCAN_METRIC_COLUMNS, "dbscan",
+         "Model6 (DBSCAN)",
+         lambda df, Y: runDBSCAN(df, Y, INCLUDE_POS, THREE_POSITION_FLAG,
+                                 PCA, VARIANCE_THRESHOLD,
+                                 DBSCAN_MIN_SAMPLES, DBSCAN_EPS))]
+
+    # Collect the metric rows of every model.
+    model_metrics = {job[0]: [] for job in MODEL_JOBS}
+    kmeans_inertia = []
+
+    checkpoints = Checkpoints(RUN_CONFIG, df_data, CHECKPOINT_PATH) \
+        if RESUME else None
+
+    # Every run gets its own id in the results store. A resumed run keeps the
+    # id of the run it continues.
+    results = None
+    if RESULTS_STORE:
+        results = ResultsStore(RESULTS_PATH)
+        if checkpoints is not None:
+            run_id = checkpoints.runId(lambda: results.startRun(RUN_CONFIG))
+        else:
+            run_id = results.startRun(RUN_CONFIG)
+
+    # Begin modeling for each set of year-pairs specified.
+    for YEAR in YEARS:
+        df_year = df_data.loc[(df_data['Year'] >= YEAR[0]) &
+                              (df_data['Year'] <= YEAR[1])]
+
+        # Cluster labels of every model in this decade.
+        decade_labels = {}
+
+        for MODEL_NAME, ENABLED, COLUMNS, _, DESCRIPTION, runModel in \
+                MODEL_JOBS:
+            if not ENABLED:
+                continue
+
+            metrics = None
+            labels = None
+            if checkpoints is not None:
+                metrics = checkpoints.load(MODEL_NAME, YEAR)
+
+            # Labels of a resumed job: checkpoint, else the results store.
+            if metrics is not None:
+                labels = checkpoints.labels(MODEL_NAME, YEAR)
+                if labels is None and results is not None:
+                    stored = results.labels(run_id, MODEL_NAME, YEAR)
+                    if stored is not None:
+                        labels = stored.reindex(
+                            df_year['ID'].to_numpy()).to_numpy()
+                if labels is None or len(labels) != len(df_year) or \
+                        pd.isna(labels).any():
+                    print("** {}: checkpoint without cluster labels, "
+                          "re-running".format(DESCRIPTION))
+                    metrics = None
+
+            if metrics is not None:
+                print("** {}: RESUMED from checkpoint".format(DESCRIPTION))
+                decade_labels[MODEL_NAME] = labels
+            else:
+                metrics = runModel(df_year, [YEAR[0], YEAR[1]])
+                decade_labels[MODEL_NAME] = df_year['Cluster'].to_numpy()
+
+                if results is not None:
+                    common.recordModelResults(results, run_id, MODEL_NAME,
+                                              YEAR, COLUMNS, metrics,
+                                              df_year, THREE_POSITION_FLAG)
+                if checkpoints is not None:
+                    checkpoints.save(MODEL_NAME, YEAR, metrics,
+                                     decade_labels[MODEL_NAME])
+
+            model_metrics[MODEL_NAME].append(metrics)
+            print("** {}: COMPLETE\n".format(DESCRIPTION))
+
+        if AGREEMENT:
+            missing = [MODEL_NAME for MODEL_NAME, ENABLED, *_ in MODEL_JOBS
+                       if ENABLED and MODEL_NAME not in decade_labels]
+            if missing:
+                print("** Model Agreement {}-{}: no labels for {}".format(
+                    YEAR[0], YEAR[1], ", ".join(missing)))
+            if len(decade_labels) > 1:
+                agreement.reportAgreement(decade_labels, df_year['Pos'], YEAR)
+
+        if EXPORT_PIPELINES:
+            pipelineArtifact.exportDecade(
+                df_year, YEAR,
+                [MODEL_NAME for MODEL_NAME, ENABLED, *_ in MODEL_JOBS
+                 if ENABLED and MODEL_NAME in pipelineArtifact.MODELS],
+                INCLUDE_POS, THREE_POSITION_FLAG, PCA, VARIANCE_THRESHOLD,
+                HIERARCHY_NEIGHBORS, PIPELINE_PATH)
+
+        # Pairwise distances, neighbor indexes and decompositions are only
+        # shared within a decade.
+        distanceCache.clear()
+        neighborIndex.clear()
+        pcaService.clear()
+
+    if results is not None:
+        results.close()
+
+    # Output the resulting cluster metrics to individual .csv files.
+    for MODEL_NAME, _, COLUMNS, CSV_NAME, _, _ in MODEL_JOBS:
+        pd.DataFrame(model_metrics[MODEL_NAME], columns=COLUMNS).to_csv(
+            '../data/output/MODEL_Metrics_{}_{}-{}.csv'.format(
+                CSV_NAME, YEARS[0][0], YEARS[len(YEARS) - 1][1]),
+            index=False)
+
+    # Every job finished, the next run starts from scratch.
+    if checkpoints is not None:
+        checkpoints.clear()
 
 '''
 NOTES for later
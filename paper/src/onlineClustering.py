@@ -0,0 +1,312 @@
+'''
+File:   onlineClustering.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/19/2022
+Description:
+    Online mode for the current season. New player totals arrive weekly;
+    instead of re-running 'runKmeans' and 'som' on the whole decade, the
+    current models absorb new / updated player rows incrementally:
+        kMeans - sequential (running mean) centroid updates. The learning
+                 rate of a centroid is 1 / (players in the cluster), so it
+                 decays as the cluster grows. An updated row first removes
+                 its old contribution, so centroids stay exact cluster means.
+        SOM    - winner + neighborhood weight updates. The learning rate of a
+                 node is also 1 / (players mapped to it), scaled by the
+                 neighborhood function, whose width decays with the number
+                 of updates since the last full refit.
+    The scaler / PCA basis of the last full refit stay fixed between refits
+    ('lib/pipelineArtifact.py'). An update costs time proportional to the
+    changed rows only.
+
+    Drift = largest centroid displacement since the last full refit,
+    relative to the mean distance between the refit centroids. When it
+    exceeds DRIFT_THRESHOLD, a full refit on the current rows runs in a
+    background thread. Updates keep being answered by the current models
+    meanwhile and are replayed on the refit models when they are swapped in.
+'''
+
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+import dataPreparation as dp
+import lib.pipelineArtifact as pipelineArtifact
+
+##########################
+################
+##########################
+
+'''
+-- Online settings --
+UPDATE_PATH - New / updated player rows (modeling dataset columns). An
+                optional 'Week' column splits them into weekly updates.
+MODELS - Models updated online {kMeans, SOM}
+DRIFT_THRESHOLD - Relative centroid drift that triggers a full refit.
+SOM_SIGMA - Initial SOM neighborhood width (in map units)
+SOM_DECAY - Number of updates after which the neighborhood width is halved.
+'''
+YEARS = [2011, 2020]
+MODEL_DATA_PATH = "../data/ref/Season_Stats_MODEL_1971-2020"
+UPDATE_PATH = "../data/input/Season_Stats_UPDATE.csv"
+
+MODELS = ['kMeans', 'SOM']
+INCLUDE_POS = False
+APPLY_PCA = True
+VARIANCE_THRESHOLD = 0.85
+DRIFT_THRESHOLD = 0.10
+
+SOM_SIGMA = 0.5
+SOM_DECAY = 500
+
+
+class OnlineModel:
+    '''
+    Incrementally updated centers of one model. Preprocessing comes from
+    the artifact of the last full refit.
+    '''
+
+    def __init__(self, artifact, df: pd.DataFrame):
+        self.artifact = artifact
+        self.model = artifact.model
+        self.positions = artifact.positions
+
+        self.centers = np.array(artifact.arrays['centers'], dtype=np.float64)
+        self.reference = self.centers.copy()
+        distances = np.linalg.norm(self.reference[:, None] -
+                                   self.reference[None, :], axis=2)
+        self.scale = distances[np.triu_indices(len(self.reference), 1)] \
+            .mean() if len(self.reference) > 1 else 1.0
+        self.updates = 0
+
+        # Current model-space point, label and position of every row.
+        self.rows = {}
+        self.counts = np.zeros(len(self.centers))
+        self.position_counts = np.zeros((len(self.centers),
+                                         len(self.positions)))
+        self._assign(df)
+
+    def _encode(self, df: pd.DataFrame):
+        x = self.artifact.transform(df[self.artifact.features].to_numpy(
+            dtype=np.float64))
+        pos = pd.Categorical(df['Pos'].astype(str),
+                             categories=self.positions).codes
+
+        return x, pos
+
+    def _assign(self, df: pd.DataFrame):
+        x, pos = self._encode(df)
+        labels = pipelineArtifact.nearestCenter(x, self.centers)
+        for ID, x_row, label, p in zip(df['ID'], x, labels, pos):
+            self.rows[ID] = (x_row, label, p)
+
+        np.add.at(self.counts, labels, 1)
+        known = pos >= 0
+        np.add.at(self.position_counts, (labels[known], pos[known]), 1)
+
+    def _remove(self, IDS):
+        '''
+        Take the old version of updated rows out of the counts (and out of
+        the kMeans means).
+        '''
+        for ID in IDS:
+            x_old, label, p = self.rows.pop(ID)
+            self.counts[label] = self.counts[label] - 1
+            if p >= 0:
+                self.position_counts[label, p] -= 1
+            if self.model != 'SOM' and self.counts[label] > 0:
+                self.centers[label] -= (x_old - self.centers[label]) / \
+                    self.counts[label]
+
+    def update(self, df_rows: pd.DataFrame):
+        '''
+        Absorb new / updated rows.
+        :return: cluster label of every row of df_rows.
+        '''
+        self._remove([ID for ID in df_rows['ID'] if ID in self.rows])
+
+        x, pos = self._encode(df_rows)
+        labels = np.empty(len(x), dtype=np.int64)
+        for i in range(len(x)):
+            label = int(np.argmin(np.sum((self.centers - x[i]) ** 2,
+                                         axis=1)))
+            labels[i] = label
+            self.counts[label] = self.counts[label] + 1
+
+            if self.model == 'SOM':
+                sigma = max(SOM_SIGMA / (1 + self.updates / SOM_DECAY), 1e-3)
+                # 1-D map (m x 1): map distance = index distance.
+                grid = np.arange(len(self.centers)) - label
+                h = np.exp(-grid ** 2 / (2 * sigma ** 2))
+                rate = h / np.maximum(self.counts, 1)
+                self.centers += rate[:, None] * (x[i] - self.centers)
+            else:
+                self.centers[label] += (x[i] - self.centers[label]) / \
+                    self.counts[label]
+            self.updates = self.updates + 1
+
+        for ID, x_row, label, p in zip(df_rows['ID'], x, labels, pos):
+            self.rows[ID] = (x_row, label, p)
+            if p >= 0:
+                self.position_counts[label, p] += 1
+
+        return labels
+
+    def drift(self) -> float:
+        displacement = np.linalg.norm(self.centers - self.reference, axis=1)
+
+        return float(displacement.max() / self.scale)
+
+    def concentration(self) -> pd.DataFrame:
+        '''
+        Current position mix of the clusters ('positionConcentration' format).
+        '''
+        df_conc = pd.DataFrame(np.round(self.position_counts /
+                                        np.maximum(self.counts, 1)[:, None],
+                                        3),
+                               columns=self.positions)
+        df_conc.insert(0, 'Total', self.counts.astype(int))
+
+        return df_conc
+
+
+class OnlineClustering:
+    '''
+    Online kMeans / SOM models of the current decade plus the background
+    refit when they drift.
+    '''
+
+    def __init__(self, df_year: pd.DataFrame, YEARS: list, MODELS=MODELS,
+                 DRIFT_THRESHOLD=DRIFT_THRESHOLD, BACKGROUND=True):
+        self.years = YEARS
+        self.model_names = MODELS
+        self.drift_threshold = DRIFT_THRESHOLD
+        self.background = BACKGROUND
+        self.three = 'G' in set(df_year['Pos'].astype(str))
+
+        # Rows of the last refit + rows changed since (by 'ID').
+        self.df_base = df_year
+        self.changes = {}
+
+        self.lock = threading.Lock()
+        self.refit_thread = None
+        self.pending = None
+        self.refits = 0
+
+        self.models = self._fit(df_year)
+
+    def _fit(self, df: pd.DataFrame) -> dict:
+        models = {}
+        for MODEL_NAME in self.model_names:
+            artifact = pipelineArtifact.fitArtifact(
+                df, self.years, MODEL_NAME, INCLUDE_POS, self.three,
+                APPLY_PCA, VARIANCE_THRESHOLD)
+            models[MODEL_NAME] = OnlineModel(artifact, df)
+
+        return models
+
+    def currentData(self) -> pd.DataFrame:
+        if not self.changes:
+            return self.df_base
+
+        df_changes = pd.DataFrame(list(self.changes.values()))
+        return pd.concat([self.df_base.loc[~self.df_base['ID'].isin(
+            self.changes)], df_changes], ignore_index=True)
+
+    def update(self, df_rows: pd.DataFrame) -> dict:
+        '''
+        :param df_rows: New or updated player rows (same columns as the
+                        modeling dataset, identified by 'ID').
+        :return: dict of model name -> cluster labels of df_rows (after
+                    dropping all but the last row of a repeated 'ID').
+        '''
+        # A player listed twice in one batch (ex: traded mid-week) would be
+        # counted twice by the models; the last row is the current one.
+        df_rows = df_rows.drop_duplicates('ID', keep='last')
+
+        with self.lock:
+            for row in df_rows.to_dict('records'):
+                self.changes[row['ID']] = row
+            if self.pending is not None:
+                self.pending.append(df_rows)
+
+            labels = {name: model.update(df_rows)
+                      for name, model in self.models.items()}
+            drift = self.drift()
+
+        if max(drift.values()) > self.drift_threshold:
+            self.refit(WAIT=not self.background)
+
+        return labels
+
+    def drift(self) -> dict:
+        return {name: model.drift() for name, model in self.models.items()}
+
+    def concentration(self, MODEL_NAME) -> pd.DataFrame:
+        with self.lock:
+            return self.models[MODEL_NAME].concentration()
+
+    def refit(self, WAIT=False):
+        '''
+        Full refit on the current rows (background thread unless WAIT).
+        Does nothing while a refit is already running.
+        '''
+        with self.lock:
+            if self.refit_thread is not None and \
+                    self.refit_thread.is_alive():
+                return
+            df = self.currentData()
+            self.pending = []
+            self.refit_thread = threading.Thread(target=self._refit,
+                                                 args=(df,), daemon=True)
+            self.refit_thread.start()
+
+        if WAIT:
+            self.refit_thread.join()
+
+    def _refit(self, df: pd.DataFrame):
+        models = self._fit(df)
+
+        with self.lock:
+            # Updates that arrived during the refit are not in 'df'.
+            changes = {}
+            for df_rows in self.pending:
+                for model in models.values():
+                    model.update(df_rows)
+                for row in df_rows.to_dict('records'):
+                    changes[row['ID']] = row
+            self.pending = None
+            self.models = models
+            self.df_base = df
+            self.changes = changes
+            self.refits = self.refits + 1
+
+        print("** Online Refit {}-{}: COMPLETE ({} players)".format(
+            self.years[0], self.years[1], len(df)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Online cluster updates of the current decade")
+    parser.add_argument('--updates', default=UPDATE_PATH)
+    args = parser.parse_args()
+
+    df_data = dp.loadModelData(MODEL_DATA_PATH)
+    online = OnlineClustering(df_data.loc[(df_data['Year'] >= YEARS[0]) &
+                                          (df_data['Year'] <= YEARS[1])],
+                              YEARS, BACKGROUND=False)
+
+    df_updates = pd.read_csv(args.updates)
+    weeks = [df for _, df in df_updates.groupby('Week')] \
+        if 'Week' in df_updates.columns else [df_updates]
+    for i, df_week in enumerate(weeks):
+        online.update(df_week.drop(columns='Week', errors='ignore'))
+        print("** Update {}: drift {}".format(
+            i + 1, {name: round(value, 4)
+                    for name, value in online.drift().items()}))
+
+    for MODEL_NAME in MODELS:
+        print("{} concentration:".format(MODEL_NAME))
+        print(online.concentration(MODEL_NAME).to_string())
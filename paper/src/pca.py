@@ -9,18 +9,17 @@ Description:
 
 import pandas as pd
 import lib.modelCommon as common
+from kMeans import cachedKmeans
 
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
-from sklearn.preprocessing import MinMaxScaler
 
 
 
 def modifydataformodel(df: pd.DataFrame,
                        INCLUDE_POS_FLAG, THREE_POS_FLAG) -> pd.DataFrame:
     # Remove Features
-    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos']
+    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos', 'Teams']
 
     # Also delete position features if they should not be used in modeling.
     if not INCLUDE_POS_FLAG:
@@ -31,6 +30,10 @@ def modifydataformodel(df: pd.DataFrame,
                                     "Pos_SF", "Pos_PF",
                                     "Pos_C"])
 
+    # Cluster labels written by previously run models are not features.
+    REMOVE_FEATURES.extend([col for col in df.columns
+                            if col.startswith('Cluster')])
+
     df = df.drop(columns=REMOVE_FEATURES)
 
     return df
@@ -41,15 +44,15 @@ def runPCA(df: pd.DataFrame, YEARS: list, INCLUDE_POS, THREE_POS_FLAG,
 
     mod_data = modifydataformodel(df, INCLUDE_POS, THREE_POS_FLAG)
 
-    scaler = MinMaxScaler()
-    X = scaler.fit_transform(mod_data)
+    X = common.scaleData(mod_data.to_numpy())
 
     # Identify optimal PCA components through Elbow Plots beforehand.
-    common.createElbowPlots(len(mod_data.columns), X, YEARS)
+    common.createElbowPlots(len(mod_data.columns), X, YEARS,
+                            ROW_NORMALIZED=False)
 
     # Reduce the data's dimensionality to a number of components that explain
     # a portion of the dataset's variance.
-    X_transform = common.pcaTransform(X, VARIANCE)
+    X_transform = common.pcaTransform(X, VARIANCE, ROW_NORMALIZED=False)
 
     plt.figure()
     colors = ["navy", "turquoise", "darkorange", "darkgreen", "maroon"]
@@ -84,12 +87,7 @@ def runPCA(df: pd.DataFrame, YEARS: list, INCLUDE_POS, THREE_POS_FLAG,
 
     # Perform cluster modeling on the resulting PCA components
     num_clusters = len(df['Pos'].unique())
-    kmeans = KMeans(n_clusters=num_clusters,
-                    init='k-means++',
-                    max_iter=300,
-                    n_init=10,
-                    random_state=0)
-    pred_y = kmeans.fit_predict(X_transform)
+    pred_y = cachedKmeans(X_transform, num_clusters)['labels']
     df.loc[:, 'Cluster'] = pred_y
 
     common.calcPositionConc(df, "PCA", YEARS, THREE_POS_FLAG)
@@ -0,0 +1,227 @@
+'''
+File:   permutationTest.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/16/2022
+Description:
+    Significance of the change in cluster statistics between adjacent
+    decades (ex: "position concentration entropy rises over time").
+
+    For every pair of adjacent decades the players of both decades are
+    pooled and the decade labels are permuted N_PERMUTATIONS times. Each
+    permutation splits the pool into two pseudo-decades of the original
+    sizes, refits the model on both and recomputes
+        Entropy - average position entropy of the clusters ('calcEntropy')
+        CHS, SC, DBI - cluster tightness scores
+    The observed change (later - earlier decade) is compared with this null
+    distribution: two-sided p-value and effect size (z score vs the null).
+
+    Permutations are drawn up front as one index matrix per decade pair.
+    Batches of rows are evaluated in a process pool; the pooled feature
+    matrices and the index matrix are shared with the workers through a
+    SharedArrayStore.
+
+Output:
+    OUTPUT_PATH - one row per (decade pair, statistic).
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, \
+    silhouette_score
+
+import dataPreparation as dp
+import kMeans as kMeans
+import lib.modelCommon as common
+import lib.pcaService as pcaService
+import lib.sharedArrays as sharedArrays
+from lib.sharedArrays import SharedArrayStore
+
+##########################
+################
+##########################
+
+'''
+-- Test settings --
+MODEL_DATA_PATH - Prepared modeling dataset (see 'main.py' LOAD_MODEL_DATA)
+N_PERMUTATIONS - Permutations per decade pair.
+BATCH_SIZE - Permutations evaluated by one worker task.
+NUM_CLUSTERS - k of the kMeans model refit on every permutation.
+APPLY_PCA / VARIANCE_THRESHOLD - Same feature preparation as 'main.py'.
+'''
+YEARS = [[1971, 1980],
+         [1981, 1990],
+         [1991, 2000],
+         [2001, 2010],
+         [2011, 2020]]
+MODEL_DATA_PATH = "../data/ref/Season_Stats_MODEL_{}-{}".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+OUTPUT_PATH = "../data/output/PERMUTATION_Tests_{}-{}.csv".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+
+N_PERMUTATIONS = 1000
+BATCH_SIZE = 25
+NUM_WORKERS = None
+SEED = 0
+
+INCLUDE_POS = False
+NUM_CLUSTERS = 5
+APPLY_PCA = True
+VARIANCE_THRESHOLD = 0.85
+
+STATISTICS = ['Entropy', 'CHS', 'SC', 'DBI']
+
+
+def clusterStatistics(x_raw, x_score, positions, THREE_POS_FLAG,
+                      APPLY_PCA=APPLY_PCA, VARIANCE=VARIANCE_THRESHOLD,
+                      NUM_CLUSTERS=NUM_CLUSTERS):
+    '''
+    Fit the model on one (pseudo-)decade and score it.
+    :param x_raw: Model features before scaling.
+    :param x_score: Features the tightness scores are calculated on.
+    :return: np.array in the order of STATISTICS.
+    '''
+    x = common.normalizeData(np.asarray(x_raw))
+    if APPLY_PCA:
+        # Throw-away matrices: keep them out of the PCA/fit caches.
+        x = pcaService.transform(x, VARIANCE, CACHE=False)
+
+    labels = kMeans.fitKmeans(x, NUM_CLUSTERS)['labels']
+
+    df_conc = common.positionConcentration(labels, positions,
+                                           THREE_POS_FLAG, NUM_CLUSTERS)
+
+    return np.array([common.concentrationEntropy(df_conc),
+                     calinski_harabasz_score(x_score, labels),
+                     silhouette_score(x_score, labels),
+                     davies_bouldin_score(x_score, labels)])
+
+
+def permutationMatrix(nA: int, nB: int, N_PERMUTATIONS, SEED=SEED):
+    '''
+    :return: (N_PERMUTATIONS, nA + nB) int32 matrix. Each row is a random
+                order of the pooled players; the first nA are decade A.
+    '''
+    rng = np.random.default_rng(SEED)
+    pool = np.tile(np.arange(nA + nB, dtype=np.int32), (N_PERMUTATIONS, 1))
+
+    return rng.permuted(pool, axis=1)
+
+
+def _permutationBatch(job) -> np.ndarray:
+    '''
+    Process pool worker. Statistic differences (B - A) of the permutation
+    rows [start, stop) of one decade pair.
+    '''
+    name, start, stop, nA, THREE_POS_FLAG = job
+    x_raw = sharedArrays.get(name + '_x')
+    x_score = sharedArrays.get(name + '_score')
+    positions = sharedArrays.get(name + '_pos')
+    permutations = sharedArrays.get(name + '_perm')
+
+    differences = np.empty((stop - start, len(STATISTICS)))
+    for row in range(start, stop):
+        A = permutations[row, :nA]
+        B = permutations[row, nA:]
+        differences[row - start] = \
+            clusterStatistics(x_raw[B], x_score[B], positions[B],
+                              THREE_POS_FLAG) - \
+            clusterStatistics(x_raw[A], x_score[A], positions[A],
+                              THREE_POS_FLAG)
+
+    return differences
+
+
+def summarize(observedA, observedB, null) -> pd.DataFrame:
+    '''
+    :param null: (N_PERMUTATIONS, len(STATISTICS)) null differences.
+    '''
+    observed = observedB - observedA
+    null_mean = null.mean(axis=0)
+    null_std = null.std(axis=0, ddof=1)
+
+    # Two-sided, with the observed split counted as one permutation.
+    extreme = np.abs(null - null_mean) >= np.abs(observed - null_mean)
+    p_value = (1 + extreme.sum(axis=0)) / (1 + len(null))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        effect = (observed - null_mean) / null_std
+
+    return pd.DataFrame({'Statistic': STATISTICS,
+                         'Before': observedA.round(4),
+                         'After': observedB.round(4),
+                         'Change': observed.round(4),
+                         'NullMean': null_mean.round(4),
+                         'NullStd': null_std.round(4),
+                         'EffectSize': effect.round(3),
+                         'PValue': p_value.round(4),
+                         'Permutations': len(null)})
+
+
+def runPermutationTests(df: pd.DataFrame, YEARS: list,
+                        N_PERMUTATIONS=N_PERMUTATIONS, BATCH_SIZE=BATCH_SIZE,
+                        NUM_WORKERS=NUM_WORKERS, SEED=SEED) -> pd.DataFrame:
+    THREE_POS_FLAG = 'G' in set(df['Pos'].astype(str))
+    decades = [df.loc[(df['Year'] >= YEAR[0]) & (df['Year'] <= YEAR[1])]
+               for YEAR in YEARS]
+
+    # Features and observed statistics of every decade.
+    data = []
+    for df_year in decades:
+        x_raw = kMeans.modifyDataForModel(df_year, INCLUDE_POS,
+                                          THREE_POS_FLAG).to_numpy(
+            dtype=np.float64)
+        x_score = common.scoringFeatures(df_year, INCLUDE_POS).to_numpy(
+            dtype=np.float64)
+        positions = np.asarray(df_year['Pos'].astype(str), dtype=str)
+        data.append((x_raw, x_score, positions,
+                     clusterStatistics(x_raw, x_score, positions,
+                                       THREE_POS_FLAG)))
+
+    results = []
+    with SharedArrayStore() as store:
+        jobs = []
+        for i in range(len(YEARS) - 1):
+            name = "pair{}".format(i)
+            (xA, sA, pA, _), (xB, sB, pB, _) = data[i], data[i + 1]
+
+            store.put(name + '_x', np.vstack([xA, xB]))
+            store.put(name + '_score', np.vstack([sA, sB]))
+            store.put(name + '_pos', np.concatenate([pA, pB]))
+            store.put(name + '_perm',
+                      permutationMatrix(len(xA), len(xB), N_PERMUTATIONS,
+                                        SEED + i))
+
+            jobs.extend((name, start, min(start + BATCH_SIZE,
+                                          N_PERMUTATIONS),
+                         len(xA), THREE_POS_FLAG)
+                        for start in range(0, N_PERMUTATIONS, BATCH_SIZE))
+
+        with store.pool(NUM_WORKERS) as pool:
+            batches = list(pool.map(_permutationBatch, jobs))
+
+    for i in range(len(YEARS) - 1):
+        name = "pair{}".format(i)
+        null = np.vstack([batch for job, batch in zip(jobs, batches)
+                          if job[0] == name])
+
+        df_test = summarize(data[i][3], data[i + 1][3], null)
+        df_test.insert(0, 'Years', "{}-{} -> {}-{}".format(
+            YEARS[i][0], YEARS[i][1], YEARS[i + 1][0], YEARS[i + 1][1]))
+        results.append(df_test)
+
+        print("** Permutation Test {}: COMPLETE".format(
+            df_test['Years'].iat[0]))
+
+    return pd.concat(results, ignore_index=True)
+
+
+if __name__ == '__main__':
+    df_data = dp.loadModelData(MODEL_DATA_PATH)
+    df_results = runPermutationTests(df_data, YEARS)
+
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+    df_results.to_csv(OUTPUT_PATH, index=False)
+    print(df_results.to_string())
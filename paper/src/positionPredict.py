@@ -0,0 +1,203 @@
+'''
+File:   positionPredict.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/17/2022
+Description:
+    "Position predictability" benchmark. A direct measure of positionlessness:
+    how well can a player's listed 'Pos' be predicted from his stats in each
+    decade? Falling scores over the decades = positions matter less.
+
+    Classifiers (same per-decade feature matrix as the cluster models):
+        LinearSVC - linear support vector machine
+        Logistic  - multinomial logistic regression
+        MLP       - small multi-layer perceptron
+    Evaluated with repeated stratified k-fold cross validation:
+        Accuracy, macro F1 and one-vs-rest ROC AUC (macro average)
+
+    Fold assignments are drawn once per decade, cached ('lib/fitCache.py')
+    and shared by every classifier. Each (classifier, repeat, fold) split is
+    one process pool task; features, positions and fold assignments are
+    shared with the workers through a SharedArrayStore.
+
+Output:
+    OUTPUT_PATH - mean / std of every metric per (decade, classifier).
+'''
+
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+from sklearn.model_selection import RepeatedStratifiedKFold
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import LinearSVC
+
+import dataPreparation as dp
+import kMeans as kMeans
+import lib.fitCache as fitCache
+import lib.sharedArrays as sharedArrays
+from lib.sharedArrays import SharedArrayStore
+
+##########################
+################
+##########################
+
+'''
+-- Benchmark settings --
+N_FOLDS / N_REPEATS - Repeated stratified k-fold cross validation.
+CLASSIFIERS - Classifiers to evaluate (see 'buildClassifier()')
+'''
+YEARS = [[1971, 1980],
+         [1981, 1990],
+         [1991, 2000],
+         [2001, 2010],
+         [2011, 2020]]
+MODEL_DATA_PATH = "../data/ref/Season_Stats_MODEL_{}-{}".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+OUTPUT_PATH = "../data/output/POSITION_Predictability_{}-{}.csv".format(
+    YEARS[0][0], YEARS[len(YEARS) - 1][1])
+
+N_FOLDS = 10
+N_REPEATS = 3
+SEED = 0
+NUM_WORKERS = None
+CLASSIFIERS = ['LinearSVC', 'Logistic', 'MLP']
+
+METRICS = ['Accuracy', 'F1', 'AUC']
+
+
+def buildClassifier(NAME):
+    # Scaling is part of the pipeline so it is fit on the training fold only.
+    if NAME == 'LinearSVC':
+        model = LinearSVC(C=1.0, max_iter=5000)
+    elif NAME == 'Logistic':
+        model = LogisticRegression(C=1.0, max_iter=1000)
+    elif NAME == 'MLP':
+        model = MLPClassifier(hidden_layer_sizes=(32,), alpha=1e-3,
+                              max_iter=300, early_stopping=True,
+                              random_state=SEED)
+    else:
+        raise ValueError("Unknown classifier '{}'".format(NAME))
+
+    return make_pipeline(StandardScaler(), model)
+
+
+def foldAssignments(y, N_FOLDS=N_FOLDS, N_REPEATS=N_REPEATS, SEED=SEED):
+    '''
+    :param y: Integer position codes.
+    :return: (N_REPEATS, n) int8 array. [r, i] = test fold of player i in
+                repeat r.
+    '''
+    def draw():
+        folds = np.empty((N_REPEATS, len(y)), dtype=np.int8)
+        splitter = RepeatedStratifiedKFold(n_splits=N_FOLDS,
+                                           n_repeats=N_REPEATS,
+                                           random_state=SEED)
+        for split, (_, test) in enumerate(splitter.split(np.zeros(len(y)),
+                                                         y)):
+            folds[split // N_FOLDS, test] = split % N_FOLDS
+        return {'folds': folds}
+
+    return fitCache.cachedFit(np.asarray(y), "StratifiedKFold",
+                              {'n_splits': N_FOLDS, 'n_repeats': N_REPEATS,
+                               'seed': SEED}, draw)['folds']
+
+
+def ovrAUC(y, scores, NUM_CLASSES) -> float:
+    '''
+    Macro one-vs-rest ROC AUC. Works for probabilities and for decision
+    function values (LinearSVC) alike.
+    '''
+    aucs = [roc_auc_score(y == c, scores[:, c]) for c in range(NUM_CLASSES)
+            if 0 < np.sum(y == c) < len(y)]
+
+    return float(np.mean(aucs))
+
+
+def _foldJob(job) -> np.ndarray:
+    '''
+    Process pool worker. Metrics (order of METRICS) of one classifier on
+    one train / test split.
+    '''
+    name, CLASSIFIER, REPEAT, FOLD = job
+    x = sharedArrays.get(name + '_x')
+    y = sharedArrays.get(name + '_y')
+    test = sharedArrays.get(name + '_folds')[REPEAT] == FOLD
+
+    model = buildClassifier(CLASSIFIER)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=ConvergenceWarning)
+        model.fit(x[~test], y[~test])
+
+    predicted = model.predict(x[test])
+    if hasattr(model, 'predict_proba'):
+        scores = model.predict_proba(x[test])
+    else:
+        scores = model.decision_function(x[test])
+
+    # Columns of 'scores' follow model.classes_ (every code is in training).
+    full = np.full((len(predicted), int(y.max()) + 1), -np.inf)
+    full[:, model.classes_] = scores
+
+    return np.array([accuracy_score(y[test], predicted),
+                     f1_score(y[test], predicted, average='macro'),
+                     ovrAUC(y[test], full, int(y.max()) + 1)])
+
+
+def runPositionPredict(df: pd.DataFrame, YEARS: list, N_FOLDS=N_FOLDS,
+                       N_REPEATS=N_REPEATS, CLASSIFIERS=CLASSIFIERS,
+                       NUM_WORKERS=NUM_WORKERS) -> pd.DataFrame:
+    THREE_POS_FLAG = 'G' in set(df['Pos'].astype(str))
+
+    with SharedArrayStore() as store:
+        jobs = []
+        years = {}
+        for i, YEAR in enumerate(YEARS):
+            df_year = df.loc[(df['Year'] >= YEAR[0]) &
+                             (df['Year'] <= YEAR[1])]
+            name = "decade{}".format(i)
+            years[name] = "{}-{}".format(YEAR[0], YEAR[1])
+
+            x = kMeans.modifyDataForModel(df_year, False, THREE_POS_FLAG)
+            y = pd.Categorical(df_year['Pos'].astype(str)).codes.astype(
+                np.int8)
+
+            store.put(name + '_x', x.to_numpy(dtype=np.float64))
+            store.put(name + '_y', y)
+            store.put(name + '_folds', foldAssignments(y, N_FOLDS,
+                                                       N_REPEATS))
+
+            jobs.extend((name, CLASSIFIER, REPEAT, FOLD)
+                        for CLASSIFIER in CLASSIFIERS
+                        for REPEAT in range(N_REPEATS)
+                        for FOLD in range(N_FOLDS))
+
+        with store.pool(NUM_WORKERS) as pool:
+            scores = list(pool.map(_foldJob, jobs, chunksize=2))
+
+    df_folds = pd.DataFrame(scores, columns=METRICS)
+    df_folds['Years'] = [years[job[0]] for job in jobs]
+    df_folds['Classifier'] = [job[1] for job in jobs]
+
+    df_results = df_folds.groupby(['Years', 'Classifier'], sort=False) \
+        .agg(['mean', 'std']).round(4)
+    df_results.columns = ["{}_{}".format(metric, stat.capitalize())
+                          for metric, stat in df_results.columns]
+    df_results['Splits'] = N_FOLDS * N_REPEATS
+
+    return df_results.reset_index()
+
+
+if __name__ == '__main__':
+    df_data = dp.loadModelData(MODEL_DATA_PATH)
+    df_results = runPositionPredict(df_data, YEARS)
+
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+    df_results.to_csv(OUTPUT_PATH, index=False)
+    print(df_results.to_string())
@@ -17,13 +17,14 @@ import pandas as pd
 from sklearn_som.som import SOM
 
 import lib.modelCommon as common
+import lib.fitCache as fitCache
 
 
 def modifyDataForModel(df: pd.DataFrame,
                        INCLUDE_POS_FLAG, THREE_POS_FLAG) -> pd.DataFrame:
 
     # Remove Features
-    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos']
+    REMOVE_FEATURES = ['ID', 'Year', 'Player', 'Tm', 'Pos', 'Teams']
 
     # Also delete position features if they should not be used in modeling.
     if not INCLUDE_POS_FLAG:
@@ -34,11 +35,32 @@ def modifyDataForModel(df: pd.DataFrame,
                                     "Pos_SF", "Pos_PF",
                                     "Pos_C"])
 
+    # Cluster labels written by previously run models are not features.
+    REMOVE_FEATURES.extend([col for col in df.columns
+                            if col.startswith('Cluster')])
+
     df = df.drop(columns=REMOVE_FEATURES)
 
     return df
 
 
+def fitSOM(x, m: int) -> dict:
+    nba_som = SOM(m=m,
+                  n=1,
+                  dim=len(x[0]),
+                  random_state=2)
+    nba_som.fit(x, epochs=1)
+
+    return {'labels': nba_som.predict(x),
+            'weights': nba_som.weights}
+
+
+def cachedSOM(x, m: int) -> dict:
+    return fitCache.cachedFit(x, "SOM",
+                              {'m': m, 'n': 1, 'epochs': 1, 'random_state': 2},
+                              lambda: fitSOM(x, m))
+
+
 def som(df: pd.DataFrame, YEARS: list,
         INCLUDE_POS, THREE_POS_FLAG,
         APPLY_PCA: bool, VARIANCE: float):
@@ -52,12 +74,9 @@ def som(df: pd.DataFrame, YEARS: list,
 
     print("Data for Model Modification: COMPLETE")
 
-    nba_som = SOM(m=len(df['Pos'].unique()),
-                  n=1,
-                  dim=len(x[0]),
-                  random_state=2)
-    nba_som.fit(x, epochs=1)
-    labels = nba_som.predict(x)
+    m = len(df['Pos'].unique())
+    fit = cachedSOM(x, m)
+    labels = fit['labels']
 
     # Ensure that all labels are corrected to be in range [0, 4]
     labels = labels
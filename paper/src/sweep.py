@@ -0,0 +1,359 @@
+'''
+File:   sweep.py
+Author: John Smutny
+Course: ECE-5424: Advanced Machine Learning
+Date:   12/12/2022
+Description:
+    Parameter sweep of the 'main.py' knobs (REQ_GAMES, REQ_MIN, INCLUDE_POS,
+    THREE_POSITION_FLAG, VARIANCE_THRESHOLD and the models) without editing
+    constants and rerunning everything from 'initialDataModification'.
+
+    Every grid point is described as a chain of stages:
+        load -> positions -> dedupe -> impute -> filter -> features
+             -> model (fit + scores)
+    A stage is identified only by the settings it depends on, e.g. 'dedupe'
+    depends on THREE_POSITION_FLAG but not on REQ_GAMES. Each distinct stage
+    is computed once and shared by every grid point that needs it, so a
+    large sweep costs little more than its distinct preprocessing variants.
+
+    Preprocessing runs in this process. The model stage runs in a process
+    pool; feature matrices, scoring matrices and their pairwise distances
+    are shared with the workers through a SharedArrayStore.
+
+Output:
+    SWEEP_PATH - Long format table, one row per
+                    (grid point, model, decade, metric). Model agreement
+                    rows use the model pair as 'Model' (ex: 'SOM~kMeans').
+'''
+
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+import dataPreparation as dp
+import hierarchyClustering as hc
+import kMeans as kMeans
+import som as som
+import gmm as gmm
+import lib.modelCommon as common
+import lib.agreement as agreement
+import lib.distanceCache as distanceCache
+import lib.sharedArrays as sharedArrays
+from lib.sharedArrays import SharedArrayStore
+
+##########################
+################
+##########################
+
+'''
+-- Sweep Grid --
+Every combination of the lists below is run. See 'main.py' for the meaning
+of each setting.
+
+MODEL - Models to run for every grid point.
+            {Hierarchy, SOM, kMeans, PCA_kMeans, GMM}
+NUM_WORKERS - Size of the model process pool (None = one per CPU).
+'''
+PLAYER_PATH = "../data/input/Players.csv"
+DATA_PATH = "../data/input/Seasons_Stats_1950_2022.csv"
+SWEEP_PATH = "../data/output/SWEEP_Results.csv"
+
+YEARS = [[1971, 1980],
+         [1981, 1990],
+         [1991, 2000],
+         [2001, 2010],
+         [2011, 2020]]
+
+GRID = {'REQ_GAMES': [10, 20, 40],
+        'REQ_MIN': [5, 10, 20],
+        'INCLUDE_POS': [False],
+        'THREE_POSITION_FLAG': [False, True],
+        'VARIANCE_THRESHOLD': [0.75, 0.85, 0.95]}
+MODEL = ['Hierarchy', 'SOM', 'kMeans', 'PCA_kMeans', 'GMM']
+GMM_K_RANGE = range(2, 9)
+GMM_COVARIANCE = ['diag', 'tied', 'full']
+NUM_WORKERS = None
+
+# Feature matrix used by each model (same preprocessing as its model file).
+#   normalized     - MinMax scale -> row normalize
+#   normalized_pca - MinMax scale -> row normalize -> PCA
+#   scaled_pca     - MinMax scale -> PCA
+MODEL_FEATURES = {'Hierarchy': 'normalized_pca',
+                  'SOM': 'normalized_pca',
+                  'kMeans': 'normalized',
+                  'PCA_kMeans': 'scaled_pca',
+                  'GMM': 'normalized_pca'}
+
+
+class StageGraph:
+    '''
+    Memoized stages of the preprocessing. Each stage result is stored under
+    a key made of the settings it depends on.
+    '''
+
+    def __init__(self, PLAYER_PATH, DATA_PATH, YEARS_PAIRS):
+        self.player_path = PLAYER_PATH
+        self.data_path = DATA_PATH
+        self.years = YEARS_PAIRS
+        self.results = {}
+        self.computed = {}
+
+    def _stage(self, name, key, function):
+        if (name, key) not in self.results:
+            self.results[(name, key)] = function()
+            self.computed[name] = self.computed.get(name, 0) + 1
+
+        return self.results[(name, key)]
+
+    def load(self):
+        return self._stage('load', (), lambda: dp.cleanupFeatures(
+            dp.loadData(self.player_path, self.data_path, self.years),
+            self.years))
+
+    def positions(self, THREE):
+        return self._stage('positions', (THREE,),
+                           lambda: dp.cleanPositionFeature(
+                               self.load().copy(), THREE))
+
+    def dedupe(self, THREE):
+        return self._stage('dedupe', (THREE,),
+                           lambda: dp.resolveTrades(
+                               self.positions(THREE).copy()))
+
+    def impute(self, THREE):
+        return self._stage('impute', (THREE,),
+                           lambda: dp.encodePositions(dp.modifyNanValues(
+                               self.dedupe(THREE).copy(), 0.3, self.years)))
+
+    def filter(self, THREE, REQ_GAMES, REQ_MIN):
+        return self._stage('filter', (THREE, REQ_GAMES, REQ_MIN),
+                           lambda: dp.compactDtypes(dp.applyPlayerFilters(
+                               self.impute(THREE), REQ_GAMES, REQ_MIN)))
+
+    def decade(self, THREE, REQ_GAMES, REQ_MIN, YEAR):
+        def select():
+            df = self.filter(THREE, REQ_GAMES, REQ_MIN)
+            return df.loc[(df['Year'] >= YEAR[0]) &
+                          (df['Year'] <= YEAR[1])]
+
+        return self._stage('decade', (THREE, REQ_GAMES, REQ_MIN,
+                                      tuple(YEAR)), select)
+
+    def features(self, THREE, REQ_GAMES, REQ_MIN, YEAR, INCLUDE_POS,
+                 VARIANT, VARIANCE):
+        '''
+        Model input matrix. VARIANCE is ignored (and not part of the key)
+        for the variant without PCA.
+        '''
+        if not VARIANT.endswith('_pca'):
+            VARIANCE = None
+
+        def build():
+            df = self.decade(THREE, REQ_GAMES, REQ_MIN, YEAR)
+            x = hc.modifyDataForModel(df, INCLUDE_POS, THREE).to_numpy()
+
+            if VARIANT.startswith('normalized'):
+                x = common.normalizeData(x)
+            else:
+                x = common.scaleData(x)
+
+            if VARIANCE is not None:
+                x = common.pcaTransform(x, VARIANCE,
+                                        ROW_NORMALIZED=VARIANT.startswith(
+                                            'normalized'))
+
+            return np.ascontiguousarray(x, dtype=np.float64)
+
+        return self._stage('features', (THREE, REQ_GAMES, REQ_MIN,
+                                         tuple(YEAR), INCLUDE_POS, VARIANT,
+                                         VARIANCE), build)
+
+    def scoring(self, THREE, REQ_GAMES, REQ_MIN, YEAR, INCLUDE_POS):
+        '''
+        Matrix the tightness scores are computed on and the players'
+        positions.
+        '''
+        def build():
+            df = self.decade(THREE, REQ_GAMES, REQ_MIN, YEAR)
+            x = common.scoringFeatures(df, INCLUDE_POS).to_numpy(
+                dtype=np.float64)
+
+            # Fixed width strings so the array can be shared.
+            return x, np.asarray(df['Pos'].astype(str), dtype=str)
+
+        return self._stage('scoring', (THREE, REQ_GAMES, REQ_MIN,
+                                       tuple(YEAR), INCLUDE_POS), build)
+
+
+def gridPoints(GRID: dict) -> list:
+    names = list(GRID)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[GRID[n] for n in names])]
+
+
+def _modelJob(job) -> dict:
+    '''
+    Process pool worker. Fit one model on one shared feature matrix and
+    score its clusters.
+    '''
+    x = sharedArrays.get(job['features'])
+    x_score = sharedArrays.get(job['scoring'])
+    positions = sharedArrays.get(job['positions'])
+    THREE = job['THREE_POSITION_FLAG']
+    numPositions = len(np.unique(positions))
+
+    model = job['Model']
+    if model == 'Hierarchy':
+        labels = hc.cachedHierarchy(x, numPositions)['labels']
+    elif model == 'SOM':
+        labels = som.cachedSOM(x, numPositions)['labels']
+    elif model == 'kMeans':
+        labels = kMeans.cachedKmeans(x, 5)['labels']
+    elif model == 'PCA_kMeans':
+        labels = kMeans.cachedKmeans(x, numPositions)['labels']
+    else:
+        fits = gmm.fitMixtures(x, job['GMM_K_RANGE'], job['GMM_COVARIANCE'],
+                               NUM_WORKERS=1)
+        best = min(fits, key=lambda fit: fit['BIC'])
+        labels = np.argmax(best['resp'], axis=1)
+
+    _, labels = np.unique(labels, return_inverse=True)
+
+    df_score = pd.DataFrame(x_score)
+    df_labels = pd.Series(labels)
+    if job['distances'] is not None:
+        silhouette = distanceCache.silhouetteFromCondensed(
+            sharedArrays.get(job['distances']), labels)
+    else:
+        silhouette = distanceCache.silhouette(x_score, labels)
+
+    df_conc = common.positionConcentration(labels, positions, THREE,
+                                           int(labels.max()) + 1)
+
+    return {'labels': labels.astype(np.int16),
+            'K': int(labels.max()) + 1,
+            'CHS': common.calcCalinskiHarabaszScore(df_score, df_labels),
+            'SC': round(silhouette, 3),
+            'DBI': common.calcDaviesBouldinIndex(df_score, df_labels),
+            'Entropy': common.concentrationEntropy(df_conc)}
+
+
+def runSweep(GRID: dict, MODEL: list, YEARS: list,
+             PLAYER_PATH, DATA_PATH, NUM_WORKERS=None) -> pd.DataFrame:
+    stages = StageGraph(PLAYER_PATH, DATA_PATH, YEARS)
+    points = gridPoints(GRID)
+
+    with SharedArrayStore() as store:
+        shared = {}
+
+        def share(key, array):
+            # Distinct stage results are written to the store only once.
+            if key not in shared:
+                shared[key] = "a{}".format(len(shared))
+                store.put(shared[key], array)
+            return shared[key]
+
+        # Build every distinct preprocessing variant and one model job per
+        # distinct (feature matrix, model) pair.
+        jobs = {}
+        rows = []
+        for point in points:
+            THREE = point['THREE_POSITION_FLAG']
+            settings = (THREE, point['REQ_GAMES'], point['REQ_MIN'])
+
+            for YEAR in YEARS:
+                x_score, positions = stages.scoring(*settings, YEAR,
+                                                    point['INCLUDE_POS'])
+                scoringKey = ('scoring', *settings, tuple(YEAR),
+                              point['INCLUDE_POS'])
+
+                if scoringKey + ('pdist',) not in shared:
+                    d = distanceCache.condensed(x_score)
+                    distances = None if d is None else \
+                        share(scoringKey + ('pdist',), d)
+                else:
+                    distances = shared[scoringKey + ('pdist',)]
+
+                for model in MODEL:
+                    VARIANT = MODEL_FEATURES[model]
+                    x = stages.features(*settings, YEAR,
+                                        point['INCLUDE_POS'], VARIANT,
+                                        point['VARIANCE_THRESHOLD'])
+                    featureKey = ('features', *settings, tuple(YEAR),
+                                  point['INCLUDE_POS'], VARIANT,
+                                  point['VARIANCE_THRESHOLD']
+                                  if VARIANT.endswith('_pca') else None)
+
+                    jobKey = (featureKey, model)
+                    if jobKey not in jobs:
+                        jobs[jobKey] = {
+                            'Model': model,
+                            'THREE_POSITION_FLAG': THREE,
+                            'features': share(featureKey, x),
+                            'scoring': share(scoringKey, x_score),
+                            'positions': share(scoringKey + ('Pos',),
+                                               positions),
+                            'distances': distances,
+                            'GMM_K_RANGE': list(GMM_K_RANGE),
+                            'GMM_COVARIANCE': GMM_COVARIANCE}
+
+                    rows.append((point, model, YEAR, jobKey))
+
+            # Distances are not needed again once the decade is shared.
+            distanceCache.clear()
+
+        print("** Sweep: {} grid points, {} model jobs".format(
+            len(points), len(jobs)))
+        for name, count in stages.computed.items():
+            print("**** Stage {}: {} distinct variants".format(name, count))
+
+        jobKeys = list(jobs)
+        with store.pool(NUM_WORKERS) as pool:
+            results = dict(zip(jobKeys,
+                               pool.map(_modelJob,
+                                        [jobs[key] for key in jobKeys])))
+
+    # One row per (grid point, model, decade, metric)
+    records = []
+    decade_labels = {}
+    for point, model, YEAR, jobKey in rows:
+        years = "{}-{}".format(YEAR[0], YEAR[1])
+        for metric, value in results[jobKey].items():
+            if metric == 'labels':
+                decade_labels.setdefault((tuple(point.items()), years),
+                                         {})[model] = value
+                continue
+            records.append({**point,
+                            'Model': model,
+                            'Years': years,
+                            'Metric': metric,
+                            'Value': value})
+
+    # Agreement of every model pair (and 'Pos') of each decade.
+    for (point, years), labels in decade_labels.items():
+        point = dict(point)
+        YEAR = [int(year) for year in years.split("-")]
+        _, positions = stages.scoring(point['THREE_POSITION_FLAG'],
+                                      point['REQ_GAMES'], point['REQ_MIN'],
+                                      YEAR, point['INCLUDE_POS'])
+        names, tensor = agreement.agreementTensor(labels, positions)
+        for measure, pair, value in agreement.pairRows(names, tensor):
+            records.append({**point,
+                            'Model': pair,
+                            'Years': years,
+                            'Metric': measure,
+                            'Value': value})
+
+    return pd.DataFrame(records)
+
+
+if __name__ == '__main__':
+    df_results = runSweep(GRID, MODEL, YEARS, PLAYER_PATH, DATA_PATH,
+                          NUM_WORKERS)
+
+    os.makedirs(os.path.dirname(SWEEP_PATH), exist_ok=True)
+    df_results.to_csv(SWEEP_PATH, index=False)
+    print("** Sweep: {} rows written to {}".format(len(df_results),
+                                                   SWEEP_PATH))